@@ -3,7 +3,33 @@ Power dialer implements optimistic dialing to connect agent with a customer
 trying to keep agent's utilization high
 '''
 __all__ = [
+    'agent',
     'agent_state',
+    'agent_table',
+    'async_power_dialer',
+    'benchmark',
+    'call_data',
     'call_state',
+    'campaign',
+    'circuit_breaker',
+    'dial_executor',
+    'dial_window',
+    'governor',
+    'handoff',
+    'inflight',
+    'journal',
+    'lead_buffer',
+    'lead_file',
+    'lead_scheduler',
+    'metrics',
+    'pacing',
+    'phone',
     'power_dialer',
+    'retry',
+    'sharding',
+    'simulation',
+    'skill_routing',
+    'suppression',
+    'timeouts',
+    'trace',
 ]
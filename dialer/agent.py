@@ -0,0 +1,209 @@
+'''
+Contains class Agent which implements the state machine of a customer support agent.
+It's shared by the threaded and the asyncio based dialers
+'''
+import logging
+import threading
+import time
+from .agent_state import TRANSITIONS, AgentEvent, AgentState, next_state
+from .metrics import DEFAULT_METRICS
+
+class Agent: # pylint: disable=too-many-instance-attributes
+    '''
+    State machine of a customer support agent, and the collaborators both dialers share.
+    Subclasses implement `connect`
+    '''
+    # there may be thousands of agents, so they don't carry a __dict__
+    __slots__ = ('agent_id', 'agent_state', 'current_lead', 'is_logging_out', 'listeners',
+                 'clock', 'state_changed_at', 'lock', 'skills', 'inflight', 'suppression',
+                 'retries', 'journal', 'governor', 'breaker')
+    logger = logging.getLogger(__name__)
+    metrics = DEFAULT_METRICS
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, agent_id: str, skills=(), inflight: object = None,
+                 suppression: object = None, retries: object = None, journal: object = None,
+                 governor: object = None, breaker: object = None):
+        """Constructor
+
+        :param agent_id: The name to use.
+        :param skills: skills of the agent, like languages. Leads requiring other skills
+            aren't routed to the agent
+        :param inflight: an InFlightRegistry shared with other dialers
+        :param suppression: a SuppressionList screening leads
+        :param retries: a RetryScheduler outcomes of attempts are reported to
+        :param journal: an OutcomeJournal recording every dial attempt
+        :param governor: a DialGovernor granting lines to attempts
+        :param breaker: a CircuitBreaker shared by all dialers
+        """
+        self.agent_id = agent_id
+        self.skills = frozenset(skills)
+        self.inflight = inflight
+        self.suppression = suppression
+        self.retries = retries
+        self.journal = journal
+        self.governor = governor
+        self.breaker = breaker
+        self.agent_state = AgentState.UNAVAILABLE
+        self.current_lead = '' # phone number of the current customer
+        self.is_logging_out = False # changed if agent indicates desire to logout during a call
+        self.listeners = () # callables notified about state transitions
+        self.clock = time.monotonic # returns current time in seconds
+        self.state_changed_at = None # clock() value of the latest transition
+        # lock guarding agent_state, current_lead and is_logging_out.
+        # Each agent has its own, so callbacks of different agents never contend
+        self.lock = threading.Lock()
+
+    def add_state_listener(self, listener):
+        '''
+        Registers a callable invoked as listener(agent, old_state, new_state, lead)
+        after every state transition. lead is the phone number of the customer whose call
+        started or ended with the transition, or an empty string
+        '''
+        self.listeners = self.listeners + (listener,)
+
+    def remove_state_listener(self, listener):
+        '''
+        Unregisters a listener added with add_state_listener
+        '''
+        listeners = list(self.listeners)
+        listeners.remove(listener)
+        self.listeners = tuple(listeners)
+
+    def change_state_locked(self, new_state: AgentState) -> bool:
+        '''
+        Changes agent's state. Returns True if the state is different.
+        Must be called while holding the lock
+        '''
+        old_state = self.agent_state
+        if old_state == new_state:
+            return False
+        self.agent_state = new_state
+        now = self.clock()
+        if old_state == AgentState.WAITING:
+            self.metrics.waiting_seconds.observe(now - self.state_changed_at)
+        self.state_changed_at = now
+        return True
+
+    def notify(self, old_state: AgentState, new_state: AgentState, lead: str):
+        '''
+        Notifies listeners about a transition. Listeners are invoked after the lock
+        is released, so they may call back into the agent
+        '''
+        for listener in self.listeners:
+            listener(self, old_state, new_state, lead)
+
+    def state_error(self, expected: list) -> Exception:
+        '''
+        Logs an error about agent being in a wrong state and returns an exception to raise
+        '''
+        names = ' or '.join(state.name for state in expected)
+        msg = (f'Agent "{self.agent_id}" must be in {names} state. '
+               f'Current state is "{self.agent_state}"')
+        self.logger.error(msg)
+        return Exception(msg)
+
+    def transition(self, event: AgentEvent, lead_phone_number: str = '') -> str:
+        '''
+        Atomically applies the event according to TRANSITIONS and notifies listeners.
+        Raises an exception and logs an error if the event is not allowed in the current state.
+        Returns phone number of the customer the agent was connected with before the event
+        '''
+        with self.lock:
+            old_state = self.agent_state
+            new_state, logging_out = next_state(event, old_state, self.is_logging_out)
+            if new_state is None:
+                raise self.state_error(list(TRANSITIONS[event]))
+            self.is_logging_out = logging_out
+            previous_lead = self.current_lead
+            if event == AgentEvent.CALL_STARTED:
+                self.current_lead = lead_phone_number
+            elif old_state == AgentState.BUSY and new_state != AgentState.BUSY:
+                self.current_lead = ''
+            # the customer whose call starts, or ends
+            lead = self.current_lead or previous_lead
+            changed = self.change_state_locked(new_state)
+        if changed:
+            self.notify(old_state, new_state, lead)
+        return previous_lead
+
+    def report_outcome(self, phone_number: str, conn_state, latency: float):
+        '''
+        Counts the outcome of a dial attempt which took latency seconds,
+        and reports it to the retry scheduler and the journal
+        '''
+        self.metrics.outcome(conn_state).inc()
+        if self.retries is not None:
+            self.retries.record_outcome(phone_number, conn_state)
+        if self.journal is not None:
+            self.journal.record_dial(self.agent_id, phone_number, conn_state, latency)
+
+    def claim_leads(self, leads: list) -> list:
+        '''
+        Drops duplicate numbers of the batch, suppressed numbers and numbers being dialed
+        by other dialers. Returns the remaining leads, which are registered as in flight
+        '''
+        # the same number can't be dialed twice in one batch
+        leads = list(dict.fromkeys(leads))
+        if self.suppression is not None:
+            allowed = self.suppression.screen(leads)
+            if len(allowed) < len(leads):
+                self.metrics.suppressed_leads.inc(len(leads) - len(allowed))
+            leads = allowed
+        if self.inflight is None or not leads:
+            return leads
+        claimed = self.inflight.acquire(leads)
+        if len(claimed) < len(leads):
+            self.metrics.duplicate_leads.inc(len(leads) - len(claimed))
+        return claimed
+
+    def give_up_connect(self):
+        '''
+        Ends a connect which failed with an error. The agent becomes AVAILABLE again,
+        or UNAVAILABLE if it wanted to logout meanwhile
+        '''
+        if self.agent_state == AgentState.WAITING:
+            self.transition(AgentEvent.GIVE_UP)
+
+    def on_agent_login(self):
+        '''
+        Notification when agent logs in and can be connected with customers
+        '''
+        self.transition(AgentEvent.LOGIN)
+
+    def on_agent_logout(self):
+        '''
+        Notification when agent logs out and should not be connected with customers anymore.
+        A busy, or connecting agent is logged out after the current call.
+        An attempt to logout again is treated as a no-op
+        '''
+        self.transition(AgentEvent.LOGOUT)
+
+    def on_call_started(self, lead_phone_number: str):
+        '''
+        Notification when agent is connected with a customer
+        '''
+        self.transition(AgentEvent.CALL_STARTED, lead_phone_number)
+
+    def on_call_failed(self):
+        '''
+        Notification when call unexpectedly ends. And the agent can be connected again
+        '''
+        lead = self.transition(AgentEvent.CALL_FAILED)
+        self.metrics.calls_failed.inc()
+        if self.logger.isEnabledFor(logging.WARNING):
+            warn_msg = f'Call failed for agent="{self.agent_id}" lead="{lead}"'
+            self.logger.warning(warn_msg)
+
+    def on_call_ended(self):
+        '''
+        Notification when call ends. And the agent can be connected again
+        '''
+        self.transition(AgentEvent.CALL_ENDED)
+
+    def on_backoff_over(self):
+        '''
+        Notification when the dialing service may be tried again. And the agent
+        can be connected again
+        '''
+        self.transition(AgentEvent.RESUME)
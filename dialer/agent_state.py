@@ -1,5 +1,5 @@
 '''
-Contains class AgentState
+Contains class AgentState and the table of transitions between agent states
 '''
 import enum
 
@@ -11,3 +11,57 @@ class AgentState(enum.Enum):
     WAITING = 2 # waiting to be connected to a customer
     BUSY = 3 # talking to a customer
     UNAVAILABLE = 4 # logged out
+    BACKOFF = 5 # the dialing service is failing, connecting is paused for a while
+
+class AgentEvent(enum.Enum):
+    '''
+    Events changing the state of an agent
+    '''
+    LOGIN = 1
+    LOGOUT = 2
+    CONNECT = 3 # dialing for the agent starts
+    GIVE_UP = 4 # connecting ended without a customer
+    CALL_STARTED = 5
+    CALL_ENDED = 6
+    CALL_FAILED = 7
+    BACK_OFF = 8 # connecting stopped without dialing, because the dialing service is failing
+    RESUME = 9 # back-off is over
+
+# event -> {state in which the event is allowed: state after the event}.
+# Logging out a connecting, backing off, or busy agent only marks him as logging out.
+# Such agent becomes UNAVAILABLE instead of AVAILABLE once connecting, the back-off,
+# or the call is over
+TRANSITIONS = {
+    AgentEvent.LOGIN: {AgentState.UNAVAILABLE: AgentState.AVAILABLE},
+    AgentEvent.LOGOUT: {
+        AgentState.AVAILABLE: AgentState.UNAVAILABLE,
+        AgentState.WAITING: AgentState.WAITING,
+        AgentState.BUSY: AgentState.BUSY,
+        AgentState.UNAVAILABLE: AgentState.UNAVAILABLE,
+        AgentState.BACKOFF: AgentState.BACKOFF,
+    },
+    AgentEvent.CONNECT: {AgentState.AVAILABLE: AgentState.WAITING},
+    AgentEvent.GIVE_UP: {AgentState.WAITING: AgentState.AVAILABLE},
+    AgentEvent.CALL_STARTED: {AgentState.WAITING: AgentState.BUSY},
+    AgentEvent.CALL_ENDED: {AgentState.BUSY: AgentState.AVAILABLE},
+    AgentEvent.CALL_FAILED: {AgentState.BUSY: AgentState.AVAILABLE},
+    AgentEvent.BACK_OFF: {AgentState.WAITING: AgentState.BACKOFF},
+    AgentEvent.RESUME: {AgentState.BACKOFF: AgentState.AVAILABLE},
+}
+
+def next_state(event: AgentEvent, old_state: AgentState, logging_out: bool) -> tuple:
+    '''
+    Applies the event to an agent in old_state according to TRANSITIONS.
+    Returns a tuple of the new state and the new logging out flag.
+    The new state is None if the event is not allowed in old_state
+    '''
+    new_state = TRANSITIONS[event].get(old_state)
+    if new_state is None:
+        return None, logging_out
+    if event == AgentEvent.LOGOUT:
+        # a busy, or connecting agent will be logged out later
+        return new_state, new_state != AgentState.UNAVAILABLE
+    if new_state == AgentState.AVAILABLE and logging_out:
+        # agent wanted to logout during the call, or while connecting
+        return AgentState.UNAVAILABLE, False
+    return new_state, logging_out
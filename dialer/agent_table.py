@@ -0,0 +1,135 @@
+'''
+Contains class AgentTable which keeps states of a very large number of agents
+in array backed columns instead of one object per agent
+'''
+import array
+import logging
+from .agent_state import TRANSITIONS, AgentEvent, AgentState, next_state
+from .phone import decode, encode
+
+FREE_ROW = 0 # value of the state column of rows which don't hold an agent
+
+class AgentTable:
+    '''
+    States of many agents. Agents are rows identified by a small integer,
+    rows of removed agents are reused. Every row takes a byte for the state, a byte for
+    the logout flag and 8 bytes for the encoded phone number of the current customer.
+    Transitions follow the same rules as class Agent. The table is not thread safe,
+    callers serialize access to it
+    '''
+    logger = logging.getLogger(__name__)
+
+    def __init__(self):
+        self.rows = {} # agent_id -> row
+        self.agent_ids = [] # row -> agent_id, None for free rows
+        self.free_rows = [] # rows of removed agents
+        self.states = array.array('B') # AgentState values
+        self.logging_out = array.array('B')
+        self.leads = array.array('q') # encoded current lead, 0 if there is none
+        self.counts = [0] * (max(state.value for state in AgentState) + 1)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, agent_id: str, state: AgentState = AgentState.UNAVAILABLE) -> int:
+        '''
+        Adds an agent in the state and returns its row
+        '''
+        if agent_id in self.rows:
+            raise ValueError(f'Agent "{agent_id}" is already in the table')
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.agent_ids[row] = agent_id
+        else:
+            row = len(self.agent_ids)
+            self.agent_ids.append(agent_id)
+            self.states.append(FREE_ROW)
+            self.logging_out.append(0)
+            self.leads.append(0)
+        self.rows[agent_id] = row
+        self.states[row] = state.value
+        self.counts[state.value] += 1
+        return row
+
+    def remove(self, agent_id: str):
+        '''
+        Removes an agent. Its row is given to the next added agent
+        '''
+        row = self.rows.pop(agent_id)
+        self.counts[self.states[row]] -= 1
+        self.agent_ids[row] = None
+        self.states[row] = FREE_ROW
+        self.logging_out[row] = 0
+        self.leads[row] = 0
+        self.free_rows.append(row)
+
+    def state(self, row: int) -> AgentState:
+        '''
+        Returns the state of the agent
+        '''
+        return AgentState(self.states[row])
+
+    def current_lead(self, row: int) -> str:
+        '''
+        Returns phone number of the current customer, or an empty string
+        '''
+        lead = self.leads[row]
+        return decode(lead) if lead else ''
+
+    def is_logging_out(self, row: int) -> bool:
+        '''
+        True if the agent will be logged out after the current call
+        '''
+        return bool(self.logging_out[row])
+
+    def count(self, state: AgentState) -> int:
+        '''
+        Returns the number of agents in the state
+        '''
+        return self.counts[state.value]
+
+    def rows_in_state(self, state: AgentState):
+        '''
+        Yields rows of agents in the state
+        '''
+        value = state.value
+        for row, row_state in enumerate(self.states):
+            if row_state == value:
+                yield row
+
+    def set_state(self, row: int, new_state: AgentState):
+        '''
+        Changes the state of the agent, bypassing the transition rules
+        '''
+        self.counts[self.states[row]] -= 1
+        self.counts[new_state.value] += 1
+        self.states[row] = new_state.value
+
+    def state_error(self, row: int, expected: list) -> Exception:
+        '''
+        Logs an error about agent being in a wrong state and returns an exception to raise
+        '''
+        names = ' or '.join(state.name for state in expected)
+        msg = (f'Agent "{self.agent_ids[row]}" must be in {names} state. '
+               f'Current state is "{self.state(row)}"')
+        self.logger.error(msg)
+        return Exception(msg)
+
+    def transition(self, row: int, event: AgentEvent, lead_phone_number: str = '') -> str:
+        '''
+        Applies the event the same way as Agent.transition. Raises an exception and logs
+        an error if the event is not allowed in the current state.
+        Returns phone number of the customer the agent was connected with before the event
+        '''
+        old_state = self.state(row)
+        new_state, logging_out = next_state(event, old_state, bool(self.logging_out[row]))
+        if new_state is None:
+            raise self.state_error(row, list(TRANSITIONS[event]))
+        self.logging_out[row] = logging_out
+        previous_lead = self.current_lead(row)
+        if event == AgentEvent.CALL_STARTED:
+            self.leads[row] = encode(lead_phone_number)
+        elif old_state == AgentState.BUSY and new_state != AgentState.BUSY:
+            self.leads[row] = 0
+        self.set_state(row, new_state)
+        return previous_lead
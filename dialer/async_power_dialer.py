@@ -0,0 +1,226 @@
+'''
+Asyncio flavour of the power dialer. It expects two objects to be injected:
+
+- dialing_service which implements coroutine `dial`
+- database which implements coroutine `get_lead_phone_number_to_dial`
+  and optionally a bulk coroutine `get_lead_phone_numbers_to_dial`
+
+A single event loop drives concurrent dial attempts of all agents,
+no thread is started per dialed lead.
+'''
+import asyncio
+import logging
+from .agent import Agent
+from .agent_state import AgentEvent
+from .call_state import CallState
+
+# pylint: disable=too-many-instance-attributes
+class AsyncPowerDialer(Agent):
+    '''
+    Automatic dialer connecting agent with a customer using coroutines
+    '''
+    __slots__ = ('DIAL_RATIO', 'database', 'dialing_service', 'ring_timeout', 'tasks')
+    logger = logging.getLogger(__name__)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, database: object, dialing_service: object, agent_id: str,
+                 ring_timeout: float = None, inflight: object = None,
+                 suppression: object = None, retries: object = None, journal: object = None,
+                 governor: object = None, breaker: object = None, skills=()):
+        """Constructor
+
+        :param agent_id: The name to use.
+        :param database: an object implementing `get_lead_phone_number_to_dial` coroutine
+        :param dialing_service: an object implementing `dial` coroutine
+        :param ring_timeout: seconds after which an unfinished attempt counts as FAILED
+        :param inflight: an InFlightRegistry shared with other dialers.
+            Numbers being dialed by one of them are skipped by the others
+        :param suppression: a SuppressionList. Listed numbers are never dialed
+        :param retries: a RetryScheduler. Outcomes of all attempts are reported to it,
+            so failed leads are dialed again later
+        :param journal: an OutcomeJournal recording every dial attempt
+        :param governor: a DialGovernor shared by all dialers. Attempts wait for a line
+            so the carrier's limits aren't exceeded
+        :param breaker: a CircuitBreaker shared by all dialers. While it's open,
+            connecting agents back off without consuming leads
+        :param skills: skills of the agent. A database implementing
+            `get_lead_phone_numbers_for_skills` coroutine only hands out leads
+            whose required skills the agent has
+        """
+        super().__init__(agent_id, skills, inflight, suppression, retries, journal, governor,
+                         breaker)
+        self.DIAL_RATIO = 2 # pylint: disable=invalid-name
+        self.database = database
+        self.dialing_service = dialing_service
+        self.ring_timeout = ring_timeout
+        self.tasks = [] # array of tasks started in connect method. It's used in unit tests
+
+    async def dialing_wrapper(self, phone_number: str, timeout: float = None) -> CallState:
+        '''
+        Handles dialing of a single phone number. Returns the state of the connection.
+        Exceptions raised by the dialing service and attempts which don't finish
+        within timeout seconds are logged and reported as FAILED. Attempts cancelled
+        because another lead of the batch connected are reported as DISCONNECTED
+        '''
+        loop = asyncio.get_event_loop()
+        acquired = False
+        error = False
+        started = loop.time()
+        try:
+            if self.governor is not None:
+                # waiting for a line doesn't count towards the ring timeout
+                await self.governor.acquire_async(self.agent_id)
+                acquired = True
+                started = loop.time()
+            conn_state = await asyncio.wait_for(
+                self.dialing_service.dial(self.agent_id, phone_number), timeout)
+        except asyncio.CancelledError:
+            if self.breaker is not None:
+                # a cancelled call tells nothing about the dialing service
+                self.breaker.release(1)
+            self.report_outcome(phone_number, CallState.DISCONNECTED, loop.time() - started)
+            raise
+        except asyncio.TimeoutError:
+            self.metrics.dial_timeouts.inc()
+            if self.logger.isEnabledFor(logging.WARNING):
+                msg = f'Dialing "{phone_number}" for agent "{self.agent_id}" timed out'
+                self.logger.warning(msg)
+            conn_state = CallState.FAILED
+        except Exception as ex: # pylint: disable=broad-except
+            self.metrics.dial_exceptions.inc()
+            if self.logger.isEnabledFor(logging.ERROR):
+                msg = (f'Dialing "{phone_number}" for agent "{self.agent_id}" failed. '
+                       f'Error: "{ex}"')
+                self.logger.error(msg)
+            conn_state = CallState.FAILED
+            error = True
+        finally:
+            if acquired:
+                self.governor.release()
+            if self.inflight is not None:
+                self.inflight.release(phone_number)
+        if self.breaker is not None:
+            self.breaker.record(loop.time() - started, error)
+        self.report_outcome(phone_number, conn_state, loop.time() - started)
+        return conn_state
+
+    async def dial_batch(self, leads: list, timeout: float = None) -> str:
+        '''
+        Dials all leads concurrently and returns the first connected number,
+        or an empty string if none of the attempts connected.
+        Attempts still in progress when a lead connects, or when dial_batch itself
+        is cancelled, are cancelled and awaited
+        '''
+        tasks = {}
+        self.metrics.dials.inc(len(leads))
+        for lead in leads:
+            task = asyncio.ensure_future(self.dialing_wrapper(lead, timeout))
+            tasks[task] = lead
+            self.tasks.append(task)
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                # several attempts may finish during the same iteration of the loop.
+                # Preserve the order in which leads were fetched to stay deterministic
+                for task in sorted(done, key=lambda t: leads.index(tasks[t])):
+                    if task.result() == CallState.CONNECTED:
+                        return tasks[task]
+            return ''
+        finally:
+            # attempts which are still ringing only occupy lines now
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    async def fetch_leads(self, count: int) -> list:
+        '''
+        Fetches up to count leads. Prefers `get_lead_phone_numbers_for_skills`
+        and `get_lead_phone_numbers_to_dial` bulk coroutines when the database implements them
+        '''
+        skill_fetch = getattr(self.database, 'get_lead_phone_numbers_for_skills', None)
+        if skill_fetch is not None:
+            return list(await skill_fetch(self.skills, count))[:count]
+        bulk_fetch = getattr(self.database, 'get_lead_phone_numbers_to_dial', None)
+        if bulk_fetch is not None:
+            return list(await bulk_fetch(count))[:count]
+        leads = []
+        for _ in range(count):
+            lead = await self.database.get_lead_phone_number_to_dial()
+            if lead is None:
+                break
+            leads.append(lead)
+        return leads
+
+    async def connect(self, deadline: float = None):
+        '''
+        Connects agent with the next customer.
+        If deadline is given gives up after that many seconds and leaves the agent AVAILABLE
+        '''
+        # First let's ensure that agent is available. Concurrent connects can't both succeed
+        self.transition(AgentEvent.CONNECT)
+        try:
+            await self.dial_batches(deadline)
+        except BaseException:
+            # a failed fetch, or a cancelled connect, must not leave the agent WAITING
+            self.give_up_connect()
+            raise
+
+    async def dial_batches(self, deadline: float = None):
+        '''
+        Dials batches of leads until the agent is connected with a customer,
+        there are no more leads, or deadline seconds passed
+        '''
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        expires = started + deadline if deadline is not None else None
+        self.tasks.clear()
+        batches = 0
+        # We start multiple concurrent attempts, but there is a small chance
+        # that all attempts will fail. Then we will start a new batch
+        while True:
+            timeout = self.ring_timeout
+            if expires is not None:
+                remaining = expires - loop.time()
+                if remaining <= 0:
+                    # out of time, don't waste leads
+                    self.transition(AgentEvent.GIVE_UP)
+                    self.metrics.connects_without_call.inc()
+                    return
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            count = self.DIAL_RATIO
+            if self.breaker is not None:
+                # while the dialing service is failing, leads would only be wasted
+                count = self.breaker.permit(count)
+                if count == 0:
+                    self.transition(AgentEvent.BACK_OFF)
+                    self.metrics.backoffs.inc()
+                    self.metrics.connects_without_call.inc()
+                    loop.call_later(self.breaker.retry_after(), self.on_backoff_over)
+                    return
+            fetch_started = loop.time()
+            leads = await self.fetch_leads(count)
+            self.metrics.lead_fetch_seconds.observe(loop.time() - fetch_started)
+
+            if not leads:
+                # no more leads in the database
+                if self.breaker is not None:
+                    self.breaker.release(count)
+                self.transition(AgentEvent.GIVE_UP)
+                self.metrics.connects_without_call.inc()
+                return
+            leads = self.claim_leads(leads)
+            if self.breaker is not None:
+                self.breaker.release(count - len(leads))
+            if not leads:
+                continue
+            batches += 1
+            connected_number = await self.dial_batch(leads, timeout)
+            if connected_number != '':
+                self.on_call_started(connected_number)
+                self.metrics.connects.inc()
+                self.metrics.time_to_connect.observe(loop.time() - started)
+                self.metrics.batches_per_connect.observe(batches)
+                return
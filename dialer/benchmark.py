@@ -0,0 +1,267 @@
+'''
+Benchmark of PowerDialer.connect against synthetic dialing services with configurable
+ring time and outcome distributions. Results are written as JSON, so numbers of
+different releases can be compared. Run it from the repository root:
+
+    python -m dialer.benchmark --output results.json
+'''
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import platform
+import random
+import sys
+import threading
+import time
+from .agent_state import AgentState
+from .call_state import CallState
+from .dial_executor import DialExecutor
+from .power_dialer import PowerDialer
+
+try:
+    import resource
+except ImportError: # pragma: no cover
+    resource = None # not available on Windows
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+class Scenario:
+    '''
+    Parameters of a benchmark run. Ring times follow a log-normal distribution,
+    calls which are neither answered, failed nor raising end up DISCONNECTED
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, name: str, answer_rate: float = 0.3, fail_rate: float = 0.3,
+                 exception_rate: float = 0.0, median_ring_seconds: float = 0.005,
+                 ring_sigma: float = 0.5, agents: int = 1, connects: int = 200,
+                 ring_timeout: float = None, connect_deadline: float = 10.0,
+                 max_workers: int = 64, seed: int = 1):
+        """Constructor
+
+        :param name: name of the scenario in the results
+        :param answer_rate: probability that a customer answers
+        :param fail_rate: probability that a call fails
+        :param exception_rate: probability that the dialing service raises
+        :param median_ring_seconds: median time a call rings before its outcome is known
+        :param ring_sigma: standard deviation of the logarithm of ring times
+        :param agents: number of agents connecting concurrently
+        :param connects: total number of connects measured
+        :param ring_timeout: passed to PowerDialer
+        :param connect_deadline: seconds after which a connect counts as unsuccessful
+        :param max_workers: size of the thread pool running dial attempts
+        :param seed: seed of the random generator, so runs are repeatable
+        """
+        if answer_rate + fail_rate + exception_rate > 1:
+            raise ValueError('Sum of outcome rates must not exceed 1')
+        self.name = name
+        self.answer_rate = answer_rate
+        self.fail_rate = fail_rate
+        self.exception_rate = exception_rate
+        self.median_ring_seconds = median_ring_seconds
+        self.ring_sigma = ring_sigma
+        self.agents = agents
+        self.connects = connects
+        self.ring_timeout = ring_timeout
+        self.connect_deadline = connect_deadline
+        self.max_workers = max_workers
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        '''
+        Returns parameters of the scenario
+        '''
+        return dict(vars(self))
+
+SCENARIOS = [
+    Scenario('typical'),
+    Scenario('low_answer_rate', answer_rate=0.05, fail_rate=0.6),
+    Scenario('flaky_service', answer_rate=0.3, fail_rate=0.2, exception_rate=0.2),
+    Scenario('many_agents', agents=20, connects=400),
+]
+
+class SyntheticDatabase:
+    '''
+    Endless source of distinct leads
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = 0
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns count new phone numbers
+        '''
+        with self.lock:
+            first = self.counter
+            self.counter += count
+        return [f'+1212{number:07d}' for number in range(first, first + count)]
+
+class SyntheticDialingService:
+    '''
+    Dialing service drawing ring times and outcomes from the distributions of a scenario.
+    It also tracks the number of dials and the peak number of live threads
+    '''
+    def __init__(self, scenario: Scenario):
+        """Constructor
+
+        :param scenario: distributions to draw from
+        """
+        self.scenario = scenario
+        self.mu = math.log(scenario.median_ring_seconds) # pylint: disable=invalid-name
+        # lock guarding all variables below
+        self.lock = threading.Lock()
+        self.random = random.Random(scenario.seed)
+        self.dials = 0
+        self.peak_threads = 0
+
+    def dial(self, agent_id: str, phone_number: str) -> CallState: # pylint: disable=unused-argument
+        '''
+        Simulates a call
+        '''
+        scenario = self.scenario
+        with self.lock:
+            self.dials += 1
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            ring_seconds = self.random.lognormvariate(self.mu, scenario.ring_sigma)
+            draw = self.random.random()
+        time.sleep(ring_seconds)
+        if draw < scenario.answer_rate:
+            return CallState.CONNECTED
+        draw -= scenario.answer_rate
+        if draw < scenario.fail_rate:
+            return CallState.FAILED
+        if draw - scenario.fail_rate < scenario.exception_rate:
+            raise Exception('Synthetic dialing error')
+        return CallState.DISCONNECTED
+
+def percentile(values: list, fraction: float) -> float:
+    '''
+    Returns the nearest-rank percentile of sorted values, or None if there are none
+    '''
+    if not values:
+        return None
+    rank = max(math.ceil(fraction * len(values)), 1)
+    return values[rank - 1]
+
+def peak_rss_kb() -> int:
+    '''
+    Returns peak resident set size of the process as reported by getrusage,
+    which is in kilobytes on Linux. It covers the whole life of the process,
+    so it's only the peak of a scenario when the scenario ran in a process of its own.
+    None if it can't be measured
+    '''
+    if resource is None: # pragma: no cover
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_agent(dialer: PowerDialer, connects: int, scenario: Scenario, latencies: list):
+    '''
+    Connects the agent the given number of times and records time-to-connect
+    of successful connects
+    '''
+    dialer.on_agent_login()
+    for _ in range(connects):
+        started = time.perf_counter()
+        dialer.connect(scenario.connect_deadline)
+        if dialer.agent_state == AgentState.BUSY:
+            latencies.append(time.perf_counter() - started)
+            dialer.on_call_ended()
+
+def run_scenario(scenario: Scenario) -> dict:
+    '''
+    Runs the scenario and returns its metrics
+    '''
+    database = SyntheticDatabase()
+    service = SyntheticDialingService(scenario)
+    executor = DialExecutor(scenario.max_workers)
+    latencies = []
+    workers = []
+    started = time.perf_counter()
+    for i in range(scenario.agents):
+        dialer = PowerDialer(database, service, f'agent{i}', executor=executor,
+                             ring_timeout=scenario.ring_timeout)
+        # connects are spread evenly, the first agents take the remainder
+        connects = scenario.connects // scenario.agents + (i < scenario.connects % scenario.agents)
+        worker = threading.Thread(target=run_agent,
+                                  args=(dialer, connects, scenario, latencies))
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    latencies.sort()
+    connected = len(latencies)
+    return {
+        'scenario': scenario.to_dict(),
+        'connects': connected,
+        'failed_connects': scenario.connects - connected,
+        'elapsed_seconds': elapsed,
+        'time_to_connect_p50': percentile(latencies, 0.50),
+        'time_to_connect_p95': percentile(latencies, 0.95),
+        'time_to_connect_p99': percentile(latencies, 0.99),
+        'dials': service.dials,
+        'dials_per_connect': service.dials / connected if connected else None,
+        'peak_threads': service.peak_threads,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+def run_isolated(scenario: Scenario, quiet: bool = False) -> dict:
+    '''
+    Runs the scenario in a freshly spawned process and returns its metrics,
+    so peak RSS isn't inflated by earlier scenarios. With quiet dialer logs are silenced
+    '''
+    context = multiprocessing.get_context('spawn')
+    initializer = logging.disable if quiet else None
+    with context.Pool(1, initializer, (logging.ERROR,) if quiet else ()) as pool:
+        return pool.apply(run_scenario, (scenario,))
+
+def run(scenarios: list, isolated: bool = True, quiet: bool = False) -> dict:
+    '''
+    Runs the scenarios one by one and returns a report. Every scenario runs in a process
+    of its own, unless isolated is False. Then peak RSS of a scenario includes
+    the scenarios before it
+    '''
+    results = [run_isolated(scenario, quiet) if isolated else run_scenario(scenario)
+               for scenario in scenarios]
+    for result in results:
+        result['isolated'] = isolated
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+def main(argv: list = None):
+    '''
+    Command line entry point
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark of PowerDialer.connect')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file with results')
+    parser.add_argument('--scenario', action='append', choices=[s.name for s in SCENARIOS],
+                        help='scenario to run, may be repeated. All are run by default')
+    parser.add_argument('--connects', type=int, help='overrides number of connects')
+    parser.add_argument('--verbose', action='store_true', help="don't silence dialer logs")
+    parser.add_argument('--in-process', action='store_true',
+                        help='run scenarios in this process instead of a process per scenario.'
+                        ' Peak RSS of a scenario then includes the scenarios before it')
+    args = parser.parse_args(argv)
+    scenarios = [Scenario(**dict(s.to_dict(), connects=args.connects or s.connects))
+                 for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    if not args.verbose:
+        # failing dial attempts are part of the benchmark, logging them is just noise
+        logging.disable(logging.ERROR)
+    try:
+        report = run(scenarios, not args.in_process, not args.verbose)
+    finally:
+        logging.disable(logging.NOTSET)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    for result in report['results']:
+        print(f"{result['scenario']['name']}: p50={result['time_to_connect_p50']} "
+              f"p99={result['time_to_connect_p99']} "
+              f"dials/connect={result['dials_per_connect']}", file=sys.stdout)
+
+if __name__ == '__main__': # pragma: no cover
+    main()
@@ -2,17 +2,92 @@
 Group of data used fo synchronization between concurrent dialing threads
 '''
 
+import collections
 import threading
 
-# pylint: disable=too-few-public-methods
+# what's left of a resolved batch: either the connected number, or what's needed to dial
+# the next batch. losers are (phone number, time when dialing started) tuples of attempts
+# to cancel, and timers are timeouts which are no longer needed. queued are
+# (phone number, governor waiter, state) tuples of attempts which never started
+# and are finished with the state, generation is the one of the resolved batch
+BatchResult = collections.namedtuple(
+    'BatchResult', ['connected_number', 'callback', 'deadline', 'losers', 'timers', 'queued',
+                    'call_data', 'generation'])
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
 class CallData:
     '''
     Data shared between multiple calling threads
     '''
+    __slots__ = ('connected_number', 'thread_counter', 'resolved', 'pending', 'cancelled',
+                 'timers', 'queued', 'deadline', 'generation', 'lock', 'callback')
+
     def __init__(self):
         self.connected_number = ''
         self.thread_counter = 0
-        # lock guarding connected_number and thread_counter variables
+        self.resolved = False # set once the batch is connected, or all threads finished
+        self.pending = {} # phone number -> time when dialing started, for unfinished attempts
+        self.cancelled = set() # phone numbers of attempts cancelled, or timed out
+        self.timers = {} # phone number -> scheduled timeout of the attempt
+        # phone number -> governor waiter of attempts waiting for a line
+        self.queued = {}
+        self.deadline = None # time.monotonic() value when connect gives up
+        # incremented every time the object is recycled, so late results of attempts
+        # from a previous batch can be told apart
+        self.generation = 0
+        # lock guarding all variables above
         self.lock = threading.RLock()
-        # event to signal when connection is made, or all threads finished
-        self.event = threading.Event()
+        # callable invoked when the batch is resolved: either connection is made,
+        # or all threads finished and there are no more leads to dial
+        self.callback = None
+
+    def reset(self):
+        '''
+        Prepares the object for the next batch
+        '''
+        with self.lock:
+            self.connected_number = ''
+            self.thread_counter = 0
+            self.resolved = False
+            self.pending.clear()
+            self.cancelled.clear()
+            self.timers.clear()
+            self.queued.clear()
+            self.deadline = None
+            self.generation += 1
+            self.callback = None
+
+class CallDataPool:
+    '''
+    Recycles CallData objects, together with their locks and containers,
+    so dialing a batch doesn't allocate them
+    '''
+    def __init__(self, max_size: int = 1024):
+        """Constructor
+
+        :param max_size: maximum number of idle objects kept for reuse
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.free = []
+
+    def acquire(self) -> CallData:
+        '''
+        Returns an idle CallData, or a new one if there are none
+        '''
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+        return CallData()
+
+    def release(self, call_data: CallData):
+        '''
+        Returns a CallData of a finished batch to the pool
+        '''
+        call_data.reset()
+        with self.lock:
+            if len(self.free) < self.max_size:
+                self.free.append(call_data)
+
+# pool shared by all dialers
+DEFAULT_POOL = CallDataPool()
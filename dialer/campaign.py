@@ -0,0 +1,195 @@
+'''
+Contains class Campaign which drives many PowerDialer agents from a single scheduler thread
+'''
+import heapq
+import logging
+import threading
+import time
+from .agent_state import AgentState
+from .agent_table import AgentTable
+
+# pylint: disable=too-many-instance-attributes
+class Campaign:
+    '''
+    Owns a group of agents and starts a dial batch for every agent which becomes AVAILABLE.
+    Agents are connected with `start_connect`, so the scheduler never blocks on dialing
+    '''
+    def __init__(self, idle_retry_seconds: float = 1.0):
+        """Constructor
+
+        :param idle_retry_seconds: delay before an agent which found no leads is connected again
+        """
+        self.logger = logging.getLogger(__name__)
+        self.idle_retry_seconds = idle_retry_seconds
+        self.dialers = {} # agent_id -> dialer
+        self.table = AgentTable() # states of the agents, for counts and scans
+        self.connecting = set() # agent ids with a connect in progress
+        # heap of (due time, agent_id) of agents waiting to be connected
+        self.schedule = []
+        # condition guarding all fields above and the statistics below
+        self.condition = threading.Condition()
+        self.connects = 0
+        # agent_id -> dials of the agent when the campaign started, or when it was added later
+        self.dials_at_start = {}
+        self.removed_dials = 0 # dials since the start of agents removed meanwhile
+        self.started_at = None
+        self.thread = None
+        self.running = False
+
+    def add_agent(self, dialer):
+        '''
+        Adds an agent to the campaign. The agent is connected as soon as it's AVAILABLE
+        '''
+        with self.condition:
+            self.dialers[dialer.agent_id] = dialer
+            self.table.add(dialer.agent_id, dialer.agent_state)
+            self.dials_at_start[dialer.agent_id] = dialer.dials
+            dialer.add_state_listener(self.on_state_changed)
+            if dialer.agent_state == AgentState.AVAILABLE:
+                self.schedule_agent(dialer.agent_id, 0)
+
+    def remove_agent(self, agent_id: str):
+        '''
+        Removes an agent from the campaign. A connect in progress is not interrupted
+        '''
+        with self.condition:
+            dialer = self.dialers.pop(agent_id)
+            self.table.remove(agent_id)
+            self.removed_dials += dialer.dials - self.dials_at_start.pop(agent_id)
+            dialer.remove_state_listener(self.on_state_changed)
+
+    def schedule_agent(self, agent_id: str, delay: float):
+        '''
+        Schedules an agent to be connected after delay seconds.
+        Must be called while holding the condition
+        '''
+        heapq.heappush(self.schedule, (time.monotonic() + delay, agent_id))
+        self.condition.notify()
+
+    # pylint: disable=unused-argument
+    def on_state_changed(self, dialer, old_state, new_state, lead):
+        '''
+        State listener registered with every agent of the campaign
+        '''
+        with self.condition:
+            row = self.table.rows.get(dialer.agent_id)
+            if row is None:
+                # the agent was removed after the transition
+                return
+            # notifications of one agent may arrive out of order, its current state wins
+            self.table.set_state(row, dialer.agent_state)
+            if new_state == AgentState.AVAILABLE and dialer.agent_id not in self.connecting:
+                self.schedule_agent(dialer.agent_id, 0)
+
+    def agents_in_state(self, state: AgentState) -> list:
+        '''
+        Returns ids of the agents in the state
+        '''
+        with self.condition:
+            return [self.table.agent_ids[row] for row in self.table.rows_in_state(state)]
+
+    def on_connect_done(self, dialer, error):
+        '''
+        Invoked when connect of an agent is over
+        '''
+        with self.condition:
+            self.connecting.discard(dialer.agent_id)
+            if dialer.agent_state == AgentState.BUSY:
+                self.connects += 1
+            elif dialer.agent_state == AgentState.AVAILABLE:
+                # there were no leads, try again a bit later
+                self.schedule_agent(dialer.agent_id, self.idle_retry_seconds)
+        if error is not None:
+            msg = f'Connecting agent "{dialer.agent_id}" failed. Error: "{error}"'
+            self.logger.error(msg)
+
+    def pop_due_agents(self) -> list:
+        '''
+        Returns dialers which are due to be connected.
+        Must be called while holding the condition
+        '''
+        now = time.monotonic()
+        due = []
+        while self.schedule and self.schedule[0][0] <= now:
+            _, agent_id = heapq.heappop(self.schedule)
+            dialer = self.dialers.get(agent_id)
+            if (dialer is not None and agent_id not in self.connecting
+                    and dialer.agent_state == AgentState.AVAILABLE):
+                self.connecting.add(agent_id)
+                due.append(dialer)
+        return due
+
+    def run_once(self) -> int:
+        '''
+        Starts a dial batch for every agent due to be connected.
+        Returns the number of agents which started connecting
+        '''
+        with self.condition:
+            due = self.pop_due_agents()
+        for dialer in due:
+            try:
+                dialer.start_connect(self.on_connect_done)
+            except Exception as ex: # pylint: disable=broad-except
+                # the agent most likely logged out after being scheduled
+                self.on_connect_done(dialer, ex)
+        return len(due)
+
+    def loop(self):
+        '''
+        Body of the scheduler thread
+        '''
+        while True:
+            with self.condition:
+                while self.running and not (self.schedule and
+                                            self.schedule[0][0] <= time.monotonic()):
+                    timeout = self.schedule[0][0] - time.monotonic() if self.schedule else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+            self.run_once()
+
+    def start(self):
+        '''
+        Starts the scheduler thread
+        '''
+        with self.condition:
+            self.running = True
+            self.started_at = time.monotonic()
+            self.connects = 0
+            self.dials_at_start = {agent_id: dialer.dials
+                                   for agent_id, dialer in self.dialers.items()}
+            self.removed_dials = 0
+        self.thread = threading.Thread(target=self.loop, name='campaign', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops the scheduler thread. Dial attempts in progress are not interrupted
+        '''
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stats(self) -> dict:
+        '''
+        Returns throughput of the campaign since it started.
+        Dials agents made before they joined the campaign are not counted
+        '''
+        with self.condition:
+            dials = self.removed_dials + sum(dialer.dials - self.dials_at_start[agent_id]
+                                             for agent_id, dialer in self.dialers.items())
+            connects = self.connects
+            states = {state.name: self.table.count(state) for state in AgentState}
+            elapsed = time.monotonic() - self.started_at if self.started_at is not None else 0
+        return {
+            'agents': len(self.dialers),
+            'dials': dials,
+            'connects': connects,
+            'elapsed': elapsed,
+            'dials_per_second': dials / elapsed if elapsed > 0 else 0.0,
+            'connects_per_second': connects / elapsed if elapsed > 0 else 0.0,
+            'states': states,
+        }
@@ -0,0 +1,140 @@
+'''
+Contains class CircuitBreaker which stops dialing while the dialing service is failing,
+so an outage doesn't burn through the lead list and flood the logs
+'''
+import collections
+import enum
+import logging
+import threading
+import time
+from .metrics import DEFAULT_METRICS
+
+class BreakerState(enum.Enum):
+    '''
+    States of a circuit breaker
+    '''
+    CLOSED = 1 # calls go through
+    OPEN = 2 # calls are refused until the cool-down is over
+    HALF_OPEN = 3 # a few trial calls tell whether the service recovered
+
+# pylint: disable=too-many-instance-attributes
+class CircuitBreaker:
+    '''
+    Tracks errors and latency of the latest calls of the dialing service. The circuit opens
+    when the share of failed calls reaches error_rate. A call fails when it raises an exception,
+    or takes longer than slow_seconds. Once open_seconds passed, trial_calls calls
+    are let through. The circuit closes when all of them succeed, and opens again
+    as soon as one of them fails
+    '''
+    logger = logging.getLogger(__name__)
+    metrics = DEFAULT_METRICS
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, error_rate: float = 0.5, window: int = 20, min_calls: int = 10,
+                 slow_seconds: float = None, open_seconds: float = 30.0, trial_calls: int = 1,
+                 trial_wait_seconds: float = 1.0, clock=None):
+        """Constructor
+
+        :param error_rate: share of failed calls, between 0 and 1, which opens the circuit
+        :param window: number of latest calls the error rate is computed from
+        :param min_calls: the circuit doesn't open before that many calls were made
+        :param slow_seconds: calls taking longer count as failed. Latency isn't checked
+            by default
+        :param open_seconds: how long the circuit stays open before trial calls are made
+        :param trial_calls: calls let through while the circuit is half-open
+        :param trial_wait_seconds: how long a dialer backs off while trial calls
+            of other dialers are in progress
+        :param clock: a callable returning current time in seconds, time.monotonic by default
+        """
+        if not 0 < error_rate <= 1 or window < 1 or trial_calls < 1:
+            raise ValueError('error_rate must be between 0 and 1, '
+                             'window and trial_calls must be positive numbers')
+        self.error_rate = error_rate
+        self.min_calls = min(min_calls, window)
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.trial_calls = trial_calls
+        self.trial_wait_seconds = trial_wait_seconds
+        self.clock = clock if clock is not None else time.monotonic
+        # lock guarding all fields below
+        self.lock = threading.Lock()
+        self.state = BreakerState.CLOSED
+        self.calls = collections.deque(maxlen=window) # True for every failed call
+        self.failures = 0 # failed calls in the window
+        self.opened_at = None # clock() value when the circuit opened
+        self.trials = 0 # trial calls permitted and not recorded yet
+        self.successes = 0 # successful trial calls
+
+    def permit(self, count: int) -> int:
+        '''
+        Returns how many of count calls may be made now. Permitted calls must be either
+        recorded or returned with `release`
+        '''
+        with self.lock:
+            if (self.state == BreakerState.OPEN
+                    and self.clock() - self.opened_at >= self.open_seconds):
+                self.state = BreakerState.HALF_OPEN
+                self.trials = 0
+                self.successes = 0
+            if self.state == BreakerState.CLOSED:
+                return count
+            if self.state == BreakerState.OPEN:
+                return 0
+            permitted = max(0, min(count, self.trial_calls - self.successes - self.trials))
+            self.trials += permitted
+            return permitted
+
+    def release(self, count: int):
+        '''
+        Returns permitted calls which weren't made
+        '''
+        with self.lock:
+            if self.state == BreakerState.HALF_OPEN:
+                self.trials = max(0, self.trials - count)
+
+    def retry_after(self) -> float:
+        '''
+        Returns seconds after which calls may be permitted again
+        '''
+        with self.lock:
+            if self.state == BreakerState.OPEN:
+                return max(0.0, self.opened_at + self.open_seconds - self.clock())
+            if self.state == BreakerState.HALF_OPEN:
+                return self.trial_wait_seconds
+            return 0.0
+
+    def record(self, latency: float, error: bool = False):
+        '''
+        Records a finished call which took latency seconds. error tells whether it raised
+        an exception
+        '''
+        failed = error or (self.slow_seconds is not None and latency > self.slow_seconds)
+        opened = closed = False
+        with self.lock:
+            if self.state == BreakerState.CLOSED:
+                if len(self.calls) == self.calls.maxlen:
+                    self.failures -= self.calls[0]
+                self.calls.append(failed)
+                self.failures += failed
+                opened = (len(self.calls) >= self.min_calls
+                          and self.failures >= self.error_rate * len(self.calls))
+            elif self.state == BreakerState.HALF_OPEN:
+                self.trials = max(0, self.trials - 1)
+                self.successes += not failed
+                opened = failed
+                closed = self.successes >= self.trial_calls
+            # calls which started before the circuit opened don't matter anymore
+            if opened:
+                self.state = BreakerState.OPEN
+                self.opened_at = self.clock()
+            elif closed:
+                self.state = BreakerState.CLOSED
+            if opened or closed:
+                self.calls.clear()
+                self.failures = 0
+        if opened:
+            self.metrics.breaker_opened.inc()
+            msg = f'Dialing service is failing, dialing is paused for {self.open_seconds} seconds'
+            self.logger.warning(msg)
+        elif closed:
+            self.logger.info('Dialing service recovered, dialing is resumed')
@@ -0,0 +1,67 @@
+'''
+Contains class DialExecutor, a bounded pool of reusable worker threads
+that run dial attempts of all PowerDialer instances
+'''
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 64
+
+class DialExecutor:
+    '''
+    Shared bounded thread pool. At most `max_workers` dial attempts are in flight,
+    further attempts are queued until a worker thread becomes free.
+    Worker threads are kept alive and reused between attempts
+    '''
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        """Constructor
+
+        :param max_workers: hard cap on the number of concurrent dial attempts
+        """
+        if max_workers < 1:
+            raise ValueError('max_workers must be a positive number')
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix='dialer')
+        # lock guarding in_flight and pending counters
+        self.lock = threading.Lock()
+        self.in_flight = 0 # number of attempts being executed right now
+        self.pending = 0 # number of submitted attempts which didn't finish yet
+
+    def submit(self, func, *args):
+        '''
+        Schedules func(*args) to run on one of the worker threads. Returns a future
+        '''
+        with self.lock:
+            self.pending += 1
+        return self.pool.submit(self._run, func, *args)
+
+    def _run(self, func, *args):
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        '''
+        Stops worker threads once all submitted attempts finish
+        '''
+        self.pool.shutdown(wait=wait)
+
+# executor shared by all PowerDialer instances which weren't given their own executor
+_DEFAULT_EXECUTOR = None
+_DEFAULT_EXECUTOR_LOCK = threading.Lock()
+
+def get_default_executor() -> DialExecutor:
+    '''
+    Returns the process wide executor, creating it on first use
+    '''
+    global _DEFAULT_EXECUTOR # pylint: disable=global-statement
+    with _DEFAULT_EXECUTOR_LOCK:
+        if _DEFAULT_EXECUTOR is None:
+            _DEFAULT_EXECUTOR = DialExecutor()
+        return _DEFAULT_EXECUTOR
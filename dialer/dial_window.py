@@ -0,0 +1,131 @@
+'''
+Contains class DialWindow which groups small `dial_many` requests of several agents
+into one submission, so the dialing service gets a round trip per window
+rather than per batch
+'''
+import queue
+import threading
+import time
+
+class DialGroup: # pylint: disable=too-few-public-methods
+    '''
+    Requests collected during one window
+    '''
+    __slots__ = ('agent_ids', 'numbers', 'owners', 'closed')
+
+    def __init__(self):
+        self.agent_ids = [] # agent of every number
+        self.numbers = []
+        self.owners = [] # (results queue, index in its request) of every number
+        self.closed = False # no more requests may join
+
+class DialWindow:
+    '''
+    Implements `dial_many(agent_id, numbers)` method on top of a dialing service.
+    Requests with fewer than max_numbers numbers wait up to window seconds for requests
+    of other agents, then all of them are submitted in one `dial_many` call of the service.
+    Its agent_id argument is then a list with the agent of every number.
+    Results are routed back to the requests they belong to as they're streamed.
+    Other methods, like `dial` and `cancel`, are passed to the service
+    '''
+    def __init__(self, dialing_service: object, window: float = 0.005, max_numbers: int = 64):
+        """Constructor
+
+        :param dialing_service: an object implementing `dial_many` method
+            which accepts a list of agent ids
+        :param window: seconds the first request of a group waits for others
+        :param max_numbers: a group is submitted as soon as it has that many numbers.
+            Larger requests are submitted on their own right away
+        """
+        if window < 0 or max_numbers < 1:
+            raise ValueError('window must not be negative and max_numbers must be positive')
+        self.dialing_service = dialing_service
+        self.window = window
+        self.max_numbers = max_numbers
+        # condition guarding the group being collected and the counter below
+        self.condition = threading.Condition()
+        self.group = None
+        self.submissions = 0 # number of `dial_many` calls of the service
+
+    def __getattr__(self, name):
+        return getattr(self.dialing_service, name)
+
+    def dial_many(self, agent_id: str, numbers: list):
+        '''
+        Joins the current group, or submits a large request right away.
+        Returns an iterator of (index, CallState) pairs
+        '''
+        if len(numbers) >= self.max_numbers:
+            with self.condition:
+                self.submissions += 1
+            return self.dialing_service.dial_many(agent_id, numbers)
+        results = queue.Queue()
+        with self.condition:
+            group = self.group
+            if group is None:
+                group = self.group = DialGroup()
+                threading.Thread(target=self.submit, args=(group,), name='dial-window',
+                                 daemon=True).start()
+            for index, number in enumerate(numbers):
+                group.agent_ids.append(agent_id)
+                group.numbers.append(number)
+                group.owners.append((results, index))
+            if len(group.numbers) >= self.max_numbers:
+                self.close_locked(group)
+        return self.stream(results, len(numbers))
+
+    def close_locked(self, group: DialGroup):
+        '''
+        Stops the current group from accepting requests and wakes up its submitter.
+        Must be called while holding the condition
+        '''
+        group.closed = True
+        self.group = None
+        self.condition.notify_all()
+
+    @staticmethod
+    def stream(results: queue.Queue, count: int):
+        '''
+        Yields results of a request routed to it by the submitter.
+        Raises the error of the submission if it failed
+        '''
+        for _ in range(count):
+            result = results.get()
+            if isinstance(result, Exception):
+                raise result
+            if result is None:
+                # the service returned fewer results
+                return
+            yield result
+
+    def submit(self, group: DialGroup):
+        '''
+        Body of the thread submitting a group once its window is over.
+        Routes streamed results to the requests of the group
+        '''
+        deadline = time.monotonic() + self.window
+        with self.condition:
+            while not group.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close_locked(group)
+                    break
+                self.condition.wait(remaining)
+            self.submissions += 1
+        answered = set()
+        try:
+            for index, conn_state in self.dialing_service.dial_many(group.agent_ids,
+                                                                    group.numbers):
+                if index in answered:
+                    continue
+                answered.add(index)
+                results, request_index = group.owners[index]
+                results.put((request_index, conn_state))
+            end = None
+        except Exception as ex: # pylint: disable=broad-except
+            # dialers log the attempts which failed
+            end = ex
+        # requests which are still waiting for results learn how the stream ended
+        for results in {results for index, (results, _) in enumerate(group.owners)
+                        if index not in answered}:
+            results.put(end)
@@ -0,0 +1,213 @@
+'''
+Contains class DialGovernor which keeps dial attempts of all agents within
+the carrier's limits of concurrent lines and calls per second
+'''
+import asyncio
+import collections
+import math
+import threading
+import time
+from .timeouts import get_default_scheduler
+
+class Waiter: # pylint: disable=too-few-public-methods
+    '''
+    Attempt queued in the governor
+    '''
+    __slots__ = ('agent_id', 'wake', 'count', 'granted')
+
+    def __init__(self, agent_id: str, wake, count: int):
+        self.agent_id = agent_id
+        self.wake = wake # invoked once the lines were granted
+        self.count = count # lines needed, all of them are granted at once
+        self.granted = False
+
+# pylint: disable=too-many-instance-attributes
+class DialGovernor:
+    '''
+    Grants a line to every dial attempt. An attempt needs a free line, of max_lines,
+    and a token of a bucket refilled at calls_per_second. Attempts which can't start
+    right away are queued per agent, and agents take turns, so an agent dialing
+    a large batch doesn't hold the others back. A bulk request asks for the lines
+    of all its attempts in one call, they are granted together, so a request never holds
+    some lines while it waits for others
+    '''
+    def __init__(self, max_lines: int, calls_per_second: float, burst: int = None,
+                 clock=None, timer: object = None):
+        """Constructor
+
+        :param max_lines: dial attempts in progress at most
+        :param calls_per_second: rate at which attempts may start
+        :param burst: attempts which may start at once after a quiet period,
+            calls_per_second rounded up by default
+        :param clock: a callable returning current time in seconds, time.monotonic by default
+        :param timer: an object implementing `schedule(delay, func, *args)` method,
+            used to serve queued attempts when tokens are refilled
+        """
+        if max_lines < 1 or calls_per_second <= 0:
+            raise ValueError('max_lines and calls_per_second must be positive numbers')
+        self.max_lines = max_lines
+        self.rate = calls_per_second
+        self.burst = burst if burst is not None else max(math.ceil(calls_per_second), 1)
+        self.clock = clock if clock is not None else time.monotonic
+        self.timer = timer if timer is not None else get_default_scheduler()
+        # lock guarding all fields below
+        self.lock = threading.Lock()
+        self.in_use = 0 # lines granted and not released yet
+        self.tokens = float(self.burst)
+        self.refilled_at = self.clock()
+        self.queues = {} # agent_id -> deque of waiters
+        self.turns = collections.deque() # agents with waiters, in the order they are served
+        self.depth = 0 # number of waiters
+        self.refill_pending = False # dispatch is scheduled for when the next token arrives
+
+    @property
+    def queue_depth(self) -> int:
+        '''
+        Returns the number of attempts waiting for a line
+        '''
+        return self.depth
+
+    def refill_locked(self):
+        '''
+        Adds tokens earned since the last refill. Must be called while holding the lock
+        '''
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def needed_tokens(self, count: int) -> int:
+        '''
+        Returns tokens which must be available to grant count lines. A request larger
+        than the burst waits for a full bucket and leaves it in debt
+        '''
+        return min(count, self.burst)
+
+    def try_grant_locked(self, count: int = 1) -> bool:
+        '''
+        Takes count lines and as many tokens if they are available.
+        Must be called while holding the lock
+        '''
+        if self.in_use + count > self.max_lines:
+            return False
+        self.refill_locked()
+        if self.tokens < self.needed_tokens(count):
+            return False
+        self.tokens -= count
+        self.in_use += count
+        return True
+
+    def dispatch_locked(self) -> list:
+        '''
+        Grants lines to queued attempts, agents taking turns. Returns waiters to wake up.
+        Must be called while holding the lock
+        '''
+        granted = []
+        while self.turns:
+            agent_id = self.turns[0]
+            waiters = self.queues[agent_id]
+            if not self.try_grant_locked(waiters[0].count):
+                break
+            self.turns.popleft()
+            waiter = waiters.popleft()
+            if waiters:
+                self.turns.append(agent_id)
+            else:
+                del self.queues[agent_id]
+            self.depth -= 1
+            waiter.granted = True
+            granted.append(waiter)
+        if self.turns and not self.refill_pending:
+            count = self.queues[self.turns[0]][0].count
+            if self.in_use + count <= self.max_lines:
+                # out of tokens, try again when enough of them arrived
+                self.refill_pending = True
+                self.timer.schedule((self.needed_tokens(count) - self.tokens) / self.rate,
+                                    self.on_refill)
+        return granted
+
+    def on_refill(self):
+        '''
+        Invoked by the timer when a token arrived
+        '''
+        with self.lock:
+            self.refill_pending = False
+            granted = self.dispatch_locked()
+        for waiter in granted:
+            waiter.wake()
+
+    def enqueue(self, agent_id: str, wake, count: int = 1) -> Waiter:
+        '''
+        Grants count lines right away and returns None, or queues a waiter.
+        wake() is invoked once the lines are granted to the waiter
+        '''
+        if not 0 < count <= self.max_lines:
+            raise ValueError(f'count must be between 1 and {self.max_lines}')
+        with self.lock:
+            if not self.turns and self.try_grant_locked(count):
+                return None
+            waiter = Waiter(agent_id, wake, count)
+            waiters = self.queues.get(agent_id)
+            if waiters is None:
+                waiters = self.queues[agent_id] = collections.deque()
+                self.turns.append(agent_id)
+            waiters.append(waiter)
+            self.depth += 1
+            granted = self.dispatch_locked()
+        for granted_waiter in granted:
+            granted_waiter.wake()
+        return waiter
+
+    def cancel(self, waiter: Waiter) -> bool:
+        '''
+        Removes a waiter from the queue. Returns False if a line was already granted to it
+        '''
+        with self.lock:
+            if waiter.granted:
+                return False
+            waiters = self.queues[waiter.agent_id]
+            waiters.remove(waiter)
+            if not waiters:
+                del self.queues[waiter.agent_id]
+                self.turns.remove(waiter.agent_id)
+            self.depth -= 1
+            # waiters needing fewer lines may have been queued behind it
+            granted = self.dispatch_locked()
+        for granted_waiter in granted:
+            granted_waiter.wake()
+        return True
+
+    def acquire(self, agent_id: str, count: int = 1):
+        '''
+        Blocks until count lines are granted to the calling thread
+        '''
+        event = threading.Event()
+        if self.enqueue(agent_id, event.set, count) is not None:
+            event.wait()
+
+    async def acquire_async(self, agent_id: str):
+        '''
+        Waits until a line is granted, without blocking the event loop
+        '''
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+        waiter = self.enqueue(agent_id, wake)
+        if waiter is None:
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not self.cancel(waiter):
+                self.release()
+            raise
+
+    def release(self, count: int = 1):
+        '''
+        Frees count lines once their attempts are over
+        '''
+        with self.lock:
+            self.in_use -= count
+            granted = self.dispatch_locked()
+        for waiter in granted:
+            waiter.wake()
@@ -0,0 +1,100 @@
+'''
+Contains class HandoffQueue which routes surplus connected calls to other agents
+'''
+import collections
+import logging
+import threading
+import time
+from .agent_state import AgentState
+
+class HandoffQueue: # pylint: disable=too-many-instance-attributes
+    '''
+    Shared by agents of a campaign. When a customer answers after the agent who dialed him
+    was already connected, the call is handed to another WAITING agent. If nobody is waiting
+    the call is parked for a grace period and taken by the next agent who starts connecting.
+    A call only goes to an agent who has all the skills of the agent who dialed it, because
+    the lead was fetched for those skills
+    '''
+    def __init__(self, grace_seconds: float = 2.0, clock=None):
+        """Constructor
+
+        :param grace_seconds: how long a surplus call may wait for an agent before it's abandoned
+        :param clock: a callable returning current time in seconds, time.monotonic by default
+        """
+        self.logger = logging.getLogger(__name__)
+        self.grace_seconds = grace_seconds
+        self.clock = clock if clock is not None else time.monotonic
+        # lock guarding all fields below
+        self.lock = threading.Lock()
+        self.waiting = collections.OrderedDict() # agent_id -> agent, longest waiting first
+        self.parked = collections.deque() # (expiration time, phone number, required skills)
+        self.handoffs = 0 # surplus calls connected to another agent
+        self.abandoned = 0 # surplus calls nobody took during grace period
+
+    def add_agent(self, agent):
+        '''
+        Starts tracking WAITING state of an agent
+        '''
+        agent.add_state_listener(self.on_state_changed)
+
+    def on_state_changed(self, agent, old_state, new_state, lead): # pylint: disable=unused-argument
+        '''
+        State listener registered with every agent sharing the queue
+        '''
+        with self.lock:
+            if new_state == AgentState.WAITING:
+                self.waiting[agent.agent_id] = agent
+            else:
+                self.waiting.pop(agent.agent_id, None)
+
+    def expire(self, now: float):
+        '''
+        Drops parked calls which waited longer than the grace period.
+        Must be called while holding the lock
+        '''
+        while self.parked and self.parked[0][0] <= now:
+            _, phone_number, _ = self.parked.popleft()
+            self.abandoned += 1
+            msg = f'Nobody took connected call with lead="{phone_number}"'
+            self.logger.warning(msg)
+
+    def offer(self, source, phone_number: str) -> bool:
+        '''
+        Hands a connected call of the source agent over to another waiting agent
+        with the skills, or parks it. Returns False if the call has to be abandoned
+        '''
+        skills = source.skills
+        while True:
+            with self.lock:
+                candidate = None
+                for agent_id, agent in self.waiting.items():
+                    if agent is not source and skills <= agent.skills:
+                        candidate = self.waiting.pop(agent_id)
+                        break
+                if candidate is None:
+                    if self.grace_seconds <= 0:
+                        self.abandoned += 1
+                        return False
+                    now = self.clock()
+                    self.expire(now)
+                    self.parked.append((now + self.grace_seconds, phone_number, skills))
+                    return True
+            # the candidate may have been connected in the meantime, then try the next one
+            if candidate.accept_handoff(phone_number):
+                with self.lock:
+                    self.handoffs += 1
+                return True
+
+    def take(self, skills=frozenset()) -> str:
+        '''
+        Returns the longest parked call which is still within the grace period and
+        an agent with the skills may take, or None
+        '''
+        with self.lock:
+            self.expire(self.clock())
+            for index, (_, phone_number, required) in enumerate(self.parked):
+                if required <= skills:
+                    del self.parked[index]
+                    self.handoffs += 1
+                    return phone_number
+            return None
@@ -0,0 +1,146 @@
+'''
+Contains class InFlightRegistry which prevents the same phone number from being dialed
+by several dialers at the same time
+'''
+import array
+import threading
+from .phone import encode
+
+EMPTY = 0 # encoded phone numbers are never zero
+DELETED = -1
+MULTIPLIER = 0x9E3779B97F4A7C15 # 2^64 divided by the golden ratio
+MASK64 = (1 << 64) - 1
+
+class InFlightRegistry:
+    '''
+    Set of phone numbers being dialed, shared by dialers of a campaign.
+    Numbers are kept as 64 bit integers in an open addressing hash table,
+    so millions of them take a few dozen megabytes and lookups take constant time.
+    Numbers which are not E.164 go to a regular set
+    '''
+    def __init__(self, capacity: int = 1024):
+        """Constructor
+
+        :param capacity: number of concurrent dials the table is sized for initially
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be a positive number')
+        # lock guarding all variables below
+        self.lock = threading.Lock()
+        self.initial_capacity = capacity
+        self.slots = None
+        self.shift = 0
+        self.size = 0 # numbers in the table
+        self.used = 0 # slots which are not EMPTY, including DELETED ones
+        self.others = set() # numbers which can't be encoded
+        self.allocate(capacity)
+
+    def __len__(self):
+        return self.size + len(self.others)
+
+    def __contains__(self, phone_number: str) -> bool:
+        key = self.key(phone_number)
+        with self.lock:
+            if key is None:
+                return phone_number in self.others
+            return self.probe(key)[1]
+
+    @staticmethod
+    def key(phone_number: str) -> int:
+        '''
+        Returns the encoded phone number, or None if it's not E.164
+        '''
+        try:
+            return encode(phone_number)
+        except ValueError:
+            return None
+
+    def allocate(self, capacity: int):
+        '''
+        Replaces the table with an empty one, at most half full at the given capacity.
+        Must be called while holding the lock
+        '''
+        bits = max(capacity * 2 - 1, 1).bit_length()
+        self.slots = array.array('q', [EMPTY]) * (1 << bits)
+        self.shift = 64 - bits
+        self.size = 0
+        self.used = 0
+
+    def probe(self, key: int) -> tuple:
+        '''
+        Looks the key up. Returns (index, True) if it's in the table,
+        or (index of a slot where it can be inserted, False).
+        Must be called while holding the lock
+        '''
+        slots = self.slots
+        mask = len(slots) - 1
+        index = ((key * MULTIPLIER) & MASK64) >> self.shift
+        free = -1
+        while True:
+            slot = slots[index]
+            if slot == key:
+                return index, True
+            if slot == EMPTY:
+                return (index if free < 0 else free), False
+            if slot == DELETED and free < 0:
+                free = index
+            index = (index + 1) & mask
+
+    def insert(self, key: int) -> bool:
+        '''
+        Adds the key. Returns False if it's already in the table.
+        Must be called while holding the lock
+        '''
+        index, found = self.probe(key)
+        if found:
+            return False
+        if self.slots[index] == EMPTY:
+            self.used += 1
+        self.slots[index] = key
+        self.size += 1
+        if self.used * 2 > len(self.slots):
+            self.rehash()
+        return True
+
+    def rehash(self):
+        '''
+        Rebuilds the table without DELETED slots, growing it if needed.
+        Must be called while holding the lock
+        '''
+        keys = [slot for slot in self.slots if slot not in (EMPTY, DELETED)]
+        self.allocate(max(len(keys) * 2, self.initial_capacity))
+        for key in keys:
+            self.slots[self.probe(key)[0]] = key
+        self.size = self.used = len(keys)
+
+    def acquire(self, phone_numbers: list) -> list:
+        '''
+        Atomically registers the numbers which are not being dialed already.
+        Returns them, in the original order
+        '''
+        acquired = []
+        with self.lock:
+            for phone_number in phone_numbers:
+                key = self.key(phone_number)
+                if key is None:
+                    if phone_number in self.others:
+                        continue
+                    self.others.add(phone_number)
+                elif not self.insert(key):
+                    continue
+                acquired.append(phone_number)
+        return acquired
+
+    def release(self, phone_number: str):
+        '''
+        Unregisters a number once its dial attempt finished. Unknown numbers are ignored
+        '''
+        key = self.key(phone_number)
+        with self.lock:
+            if key is None:
+                self.others.discard(phone_number)
+                return
+            index, found = self.probe(key)
+            if found:
+                self.slots[index] = DELETED
+                self.size -= 1
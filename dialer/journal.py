@@ -0,0 +1,177 @@
+'''
+Contains class OutcomeJournal, an append-only log of dial attempts and agent transitions
+written behind the dialers' backs by a single thread
+'''
+import abc
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from .metrics import DEFAULT_METRICS
+
+CLOSE = object() # tells the writer thread to stop
+
+def read_journal(path: str):
+    '''
+    Yields records of a journal file as dictionaries
+    '''
+    with open(path, encoding='utf-8') as journal_file:
+        for line in journal_file:
+            yield json.loads(line)
+
+class OutcomeRecorder(abc.ABC):
+    '''
+    Turns dial attempts and agent transitions into journal records.
+    Subclasses set `clock` and implement `append`
+    '''
+    clock = time.time
+
+    @abc.abstractmethod
+    def append(self, record: dict):
+        '''
+        Stores a record
+        '''
+
+    def record_dial(self, agent_id: str, phone_number: str, state, latency: float):
+        '''
+        Records a finished dial attempt. latency is the duration of the attempt in seconds
+        '''
+        self.append({'type': 'dial', 'time': self.clock(), 'agent': agent_id,
+                     'lead': phone_number, 'state': state.name, 'latency': latency})
+
+    def on_state_changed(self, agent, old_state, new_state, lead: str):
+        '''
+        Records a transition. Register it with `Agent.add_state_listener`
+        '''
+        self.append({'type': 'transition', 'time': self.clock(), 'agent': agent.agent_id,
+                     'from': old_state.name, 'state': new_state.name, 'lead': lead})
+
+# pylint: disable=too-many-instance-attributes
+class OutcomeJournal(OutcomeRecorder):
+    '''
+    Dialers only put records into a bounded queue. The writer thread appends them to the
+    journal file as JSON lines and calls fsync once per group of records: when max_batch
+    records were written since the last fsync, or flush_interval seconds passed
+    '''
+    logger = logging.getLogger(__name__)
+    metrics = DEFAULT_METRICS
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, path: str, max_batch: int = 1000, flush_interval: float = 0.5,
+                 capacity: int = 100000, block_seconds: float = None, clock=None):
+        """Constructor
+
+        :param path: journal file, records are appended to it
+        :param max_batch: records written between two calls of fsync at most
+        :param flush_interval: seconds a record may wait for fsync at most
+        :param capacity: records waiting for the writer at most
+        :param block_seconds: how long a full queue may block the caller.
+            By default the caller waits until the writer makes room, so no record is lost.
+            When given, records are dropped and counted if the queue stays full that long,
+            0 drops them right away
+        :param clock: a callable returning current time in seconds, time.time by default.
+            Records are stamped with it
+        """
+        if max_batch < 1 or capacity < 1:
+            raise ValueError('max_batch and capacity must be positive numbers')
+        self.path = path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.block_seconds = block_seconds
+        self.clock = clock if clock is not None else time.time
+        self.queue = queue.Queue(capacity)
+        # lock guarding the counter below
+        self.lock = threading.Lock()
+        self.dropped = 0 # records which didn't fit into the queue
+        self.syncs = 0 # calls of fsync, written by the writer thread only
+        self.output = None # the journal file, owned by the writer thread
+        self.error = None # raised by opening the journal file
+        self.opened = threading.Event()
+        self.thread = threading.Thread(target=self.write_loop, name='journal', daemon=True)
+        self.thread.start()
+        self.opened.wait()
+        if self.error is not None:
+            self.thread.join()
+            self.thread = None
+            raise self.error
+
+    def append(self, record: dict):
+        '''
+        Queues a record for writing. It waits for the disk only when the queue is full
+        '''
+        try:
+            self.queue.put(record, timeout=self.block_seconds)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            self.metrics.journal_dropped.inc()
+
+    def sync(self):
+        '''
+        Flushes written records to the disk. Called by the writer thread
+        '''
+        try:
+            self.output.flush()
+            os.fsync(self.output.fileno())
+            self.syncs += 1
+        except OSError as ex:
+            msg = f'Writing journal "{self.path}" failed. Error: "{ex}"'
+            self.logger.error(msg)
+
+    def write_loop(self):
+        '''
+        Body of the writer thread. The thread opens the journal file and closes it when it stops
+        '''
+        try:
+            with open(self.path, 'a', encoding='utf-8') as output:
+                self.output = output
+                self.opened.set()
+                self.write_records()
+        except OSError as ex:
+            self.error = ex
+        finally:
+            self.opened.set()
+
+    def write_records(self):
+        '''
+        Writes queued records until the journal is closed
+        '''
+        written = 0 # records written since the last fsync
+        deadline = None # when the oldest of them must be synced
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            if record is CLOSE:
+                break
+            if record is not None:
+                try:
+                    self.output.write(json.dumps(record, separators=(',', ':')) + '\n')
+                except (OSError, ValueError) as ex:
+                    msg = f'Writing journal "{self.path}" failed. Error: "{ex}"'
+                    self.logger.error(msg)
+                    continue
+                written += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if written < self.max_batch and time.monotonic() < deadline:
+                    continue
+            self.sync()
+            written = 0
+            deadline = None
+        if written:
+            self.sync()
+
+    def close(self):
+        '''
+        Writes queued records, stops the writer thread and closes the file
+        '''
+        if self.thread is None:
+            return
+        self.queue.put(CLOSE)
+        self.thread.join()
+        self.thread = None
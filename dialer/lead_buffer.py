@@ -0,0 +1,144 @@
+'''
+Contains function fetch_leads and class LeadBuffer which prefetches leads
+in the background so connect rarely waits for a database round trip
+'''
+import collections
+import logging
+import threading
+import time
+
+def fetch_leads(database: object, count: int, skills: frozenset = None) -> list:
+    '''
+    Fetches up to count leads. Uses `get_lead_phone_numbers_to_dial` bulk method
+    if the database implements it, otherwise calls `get_lead_phone_number_to_dial`
+    until enough leads are fetched or the database runs out of leads.
+    When skills are given and the database routes leads by skills, only leads
+    an agent with the skills may take are fetched
+    '''
+    if skills is not None:
+        skill_fetch = getattr(database, 'get_lead_phone_numbers_for_skills', None)
+        if skill_fetch is not None:
+            return list(skill_fetch(skills, count))[:count]
+    bulk_fetch = getattr(database, 'get_lead_phone_numbers_to_dial', None)
+    if bulk_fetch is not None:
+        return list(bulk_fetch(count))[:count]
+    leads = []
+    for _ in range(count):
+        lead = database.get_lead_phone_number_to_dial()
+        if lead is None:
+            break
+        leads.append(lead)
+    return leads
+
+# pylint: disable=too-many-instance-attributes
+class LeadBuffer:
+    '''
+    Implements `get_lead_phone_number_to_dial` and `get_lead_phone_numbers_to_dial` methods
+    on top of another database. A background thread refills the buffer
+    in bulk whenever it drops below the low-water mark. Refills don't ask for skills,
+    so on top of a database routing leads by skills, like SkillDispatcher, only leads
+    which require no skills are buffered. Dialers with skills should use such
+    database directly
+    '''
+    def __init__(self, database: object, capacity: int = 100, low_water: int = None,
+                 retry_seconds: float = 1.0):
+        """Constructor
+
+        :param database: an object implementing `get_lead_phone_number_to_dial` method
+        :param capacity: maximum number of buffered leads
+        :param low_water: the buffer is refilled when it has fewer leads.
+            Half of capacity by default
+        :param retry_seconds: delay before the database is queried again after it ran out of leads
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be a positive number')
+        self.logger = logging.getLogger(__name__)
+        self.database = database
+        self.capacity = capacity
+        self.low_water = low_water if low_water is not None else max(1, capacity // 2)
+        self.retry_seconds = retry_seconds
+        self.leads = collections.deque()
+        # condition guarding all fields below and the buffer itself
+        self.condition = threading.Condition()
+        self.exhausted_at = None # when the database returned fewer leads than requested
+        self.demand = False # a consumer found the buffer empty and waits for a refill
+        self.rounds = 0 # number of completed refills
+        self.closed = False
+        self.thread = threading.Thread(target=self.refill_loop, name='lead-buffer', daemon=True)
+        self.thread.start()
+
+    def is_exhausted(self) -> bool:
+        '''
+        True if the database recently ran out of leads.
+        Must be called while holding the condition
+        '''
+        return (self.exhausted_at is not None and
+                time.monotonic() - self.exhausted_at < self.retry_seconds)
+
+    def needs_refill(self) -> bool:
+        '''
+        True if the refill thread should query the database.
+        Must be called while holding the condition
+        '''
+        return self.demand or (len(self.leads) < self.low_water and not self.is_exhausted())
+
+    def refill_loop(self):
+        '''
+        Body of the refill thread
+        '''
+        while True:
+            with self.condition:
+                while not self.closed and not self.needs_refill():
+                    # wake up when the exhausted database may have new leads
+                    timeout = None
+                    if self.exhausted_at is not None and len(self.leads) < self.low_water:
+                        timeout = self.exhausted_at + self.retry_seconds - time.monotonic()
+                    self.condition.wait(timeout)
+                if self.closed:
+                    return
+                count = self.capacity - len(self.leads)
+            try:
+                leads = fetch_leads(self.database, count)
+            except Exception as ex: # pylint: disable=broad-except
+                msg = f'Fetching leads failed. Error: "{ex}"'
+                self.logger.error(msg)
+                leads = []
+            with self.condition:
+                self.leads.extend(leads)
+                self.exhausted_at = time.monotonic() if len(leads) < count else None
+                self.demand = False
+                self.rounds += 1
+                self.condition.notify_all()
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count buffered leads. Waits for a refill only when the buffer is empty
+        and the database may still have leads. Returns an empty list when there are no leads
+        '''
+        with self.condition:
+            if not self.leads and not self.is_exhausted() and not self.closed:
+                rounds = self.rounds
+                self.demand = True
+                self.condition.notify_all()
+                while self.rounds == rounds and not self.closed:
+                    self.condition.wait()
+            leads = [self.leads.popleft() for _ in range(min(count, len(self.leads)))]
+            if len(self.leads) < self.low_water:
+                self.condition.notify_all()
+            return leads
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Returns the next buffered lead, or None when there are no leads
+        '''
+        leads = self.get_lead_phone_numbers_to_dial(1)
+        return leads[0] if leads else None
+
+    def close(self):
+        '''
+        Stops the refill thread. Buffered leads are still returned
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
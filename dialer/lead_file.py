@@ -0,0 +1,135 @@
+'''
+Contains class LeadFile, a lead source reading phone numbers from a memory-mapped file.
+Lead files hold phone numbers encoded as 64 bit integers in native byte order
+(see module phone), in the order they are dialed. `convert_csv` writes them from CSV exports
+'''
+import array
+import csv
+import mmap
+import os
+import threading
+from .phone import MappedNumbers, decode, encode
+
+CHUNK_SIZE = 65536 # numbers written at once by convert_csv
+# 64 bit integers of a cursor file: position of the next lead,
+# then size and modification time in nanoseconds of the lead file it belongs to
+CURSOR_FIELDS = 3
+
+def convert_csv(csv_path: str, path: str, column: int = 0, skip_header: bool = False,
+                chunk_size: int = CHUNK_SIZE) -> tuple:
+    '''
+    Streams phone numbers from a column of a CSV file to a lead file, keeping their order.
+    Rows with numbers which are not E.164 are skipped.
+    Returns the number of converted and skipped rows
+    '''
+    converted = 0
+    skipped = 0
+    chunk = array.array('q')
+    temporary = f'{path}.tmp'
+    with open(csv_path, newline='', encoding='utf-8') as source, \
+            open(temporary, 'wb') as output:
+        rows = csv.reader(source)
+        if skip_header:
+            next(rows, None)
+        for row in rows:
+            try:
+                chunk.append(encode(row[column].strip()))
+            except (IndexError, ValueError):
+                skipped += 1
+                continue
+            if len(chunk) == chunk_size:
+                chunk.tofile(output)
+                converted += len(chunk)
+                chunk = array.array('q')
+        chunk.tofile(output)
+        converted += len(chunk)
+    os.replace(temporary, path)
+    return converted, skipped
+
+class LeadFile:
+    '''
+    Implements `get_lead_phone_number_to_dial` and `get_lead_phone_numbers_to_dial` methods
+    on top of a lead file. Numbers stay in the page cache instead of the heap, so memory
+    doesn't grow with the list, and every fetch takes constant time.
+    Position of the next lead is kept in a memory-mapped cursor file, so a restarted
+    campaign continues where it stopped. The cursor also records size and modification
+    time of the lead file, and starts over when the lead file was replaced.
+    The cursor advances when leads are fetched, so delivery is at-most-once:
+    leads fetched but not dialed before a crash are not handed out again
+    '''
+    def __init__(self, path: str, cursor_path: str = None):
+        """Constructor
+
+        :param path: file written by `convert_csv`, or any file of native 64 bit integers
+        :param cursor_path: file keeping the position of the next lead.
+            It is created when missing. Path of the lead file with suffix ".cursor" by default
+        """
+        self.path = path
+        self.cursor_path = cursor_path if cursor_path is not None else f'{path}.cursor'
+        self.file = MappedNumbers(path, 'lead')
+        size = CURSOR_FIELDS * 8
+        mode = 'r+b' if os.path.exists(self.cursor_path) else 'w+b'
+        with open(self.cursor_path, mode) as cursor_file:
+            if mode == 'w+b':
+                cursor_file.write(bytes(size))
+                cursor_file.flush()
+            elif os.fstat(cursor_file.fileno()).st_size != size:
+                self.file.close()
+                raise ValueError(f'"{self.cursor_path}" is not a cursor file')
+            self.cursor_map = mmap.mmap(cursor_file.fileno(), size)
+        self.cursor = memoryview(self.cursor_map).cast('q')
+        signature = (self.file.stat.st_size, self.file.stat.st_mtime_ns)
+        if tuple(self.cursor[1:]) != signature:
+            # a new cursor, or the lead file changed since the cursor was written
+            self.cursor[0] = 0
+            self.cursor[1], self.cursor[2] = signature
+        # lock guarding the cursor, dialers fetch leads from many threads
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        '''
+        Returns the number of leads which were not fetched yet
+        '''
+        return max(len(self.file.numbers) - self.cursor[0], 0)
+
+    @property
+    def position(self) -> int:
+        '''
+        Index of the next lead in the file
+        '''
+        return self.cursor[0]
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Returns the next lead, or None when all leads were fetched
+        '''
+        with self.lock:
+            position = self.cursor[0]
+            if position >= len(self.file.numbers):
+                return None
+            self.cursor[0] = position + 1
+        return decode(self.file.numbers[position])
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count next leads
+        '''
+        with self.lock:
+            start = self.cursor[0]
+            end = min(start + count, len(self.file.numbers))
+            if start >= end:
+                return []
+            self.cursor[0] = end
+        return [decode(value) for value in self.file.numbers[start:end]]
+
+    def close(self):
+        '''
+        Writes the cursor to disk and unmaps both files
+        '''
+        with self.lock:
+            if self.cursor_map.closed:
+                return
+            self.cursor_map.flush()
+            self.cursor.release()
+            self.cursor_map.close()
+            self.file.close()
@@ -0,0 +1,118 @@
+'''
+Contains class LeadScheduler which hands out leads by score,
+only while it's calling hours in the lead's time zone
+'''
+import heapq
+import itertools
+import threading
+import time
+from .phone import decode, encode
+
+DAY_SECONDS = 24 * 3600
+DEFAULT_WINDOW = (9 * 3600, 21 * 3600) # 9 AM until 9 PM local time
+
+class LeadScheduler:
+    '''
+    Implements `get_lead_phone_number_to_dial` and `get_lead_phone_numbers_to_dial` methods.
+    Leads are bucketed by their UTC offset and every bucket keeps a heap ordered by score,
+    so the next lead is the best top of the buckets whose calling window is open.
+    There are only a few dozen offsets, so selection takes O(log n) time.
+    Leads of closed buckets are held back until their window opens
+    '''
+    def __init__(self, window: tuple = DEFAULT_WINDOW, clock=None):
+        """Constructor
+
+        :param window: (start, end) of calling hours in seconds since local midnight.
+            A window ending before it starts spans midnight
+        :param clock: a callable returning current UTC time in seconds, time.time by default
+        """
+        start, end = window
+        if not (0 <= start < DAY_SECONDS and 0 <= end <= DAY_SECONDS) or start == end:
+            raise ValueError(f'Invalid calling window {window}')
+        self.window = window
+        self.clock = clock if clock is not None else time.time
+        # lock guarding the buckets
+        self.lock = threading.Lock()
+        self.buckets = {} # UTC offset in seconds -> heap of (-score, sequence, number)
+        self.size = 0
+        self.sequence = itertools.count() # leads of equal score are dialed in FIFO order
+
+    def __len__(self):
+        return self.size
+
+    def add(self, phone_number: str, score: float = 0, utc_offset: int = 0):
+        '''
+        Schedules a lead. Leads with higher score are dialed first
+
+        :param utc_offset: offset of the lead's local time from UTC in seconds
+        '''
+        key = encode(phone_number)
+        with self.lock:
+            heapq.heappush(self.buckets.setdefault(utc_offset, []),
+                           (-score, next(self.sequence), key))
+            self.size += 1
+
+    def is_open(self, utc_offset: int, now: float) -> bool:
+        '''
+        True if it's calling hours at the offset
+        '''
+        local = (now + utc_offset) % DAY_SECONDS
+        start, end = self.window
+        if start < end:
+            return start <= local < end
+        return local >= start or local < end
+
+    def pop_locked(self, now: float) -> str:
+        '''
+        Removes and returns the best lead whose window is open, or None.
+        Must be called while holding the lock
+        '''
+        best = None
+        best_top = None
+        for utc_offset, heap in self.buckets.items():
+            if heap and (best is None or heap[0] < best_top) and self.is_open(utc_offset, now):
+                best = heap
+                best_top = heap[0]
+        if best is None:
+            return None
+        self.size -= 1
+        return decode(heapq.heappop(best)[2])
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Returns the best lead which may be called now, or None
+        '''
+        now = self.clock()
+        with self.lock:
+            return self.pop_locked(now)
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count best leads which may be called now
+        '''
+        now = self.clock()
+        leads = []
+        with self.lock:
+            for _ in range(count):
+                lead = self.pop_locked(now)
+                if lead is None:
+                    break
+                leads.append(lead)
+        return leads
+
+    def next_opening(self) -> float:
+        '''
+        Returns seconds until held back leads may be called, 0 if some may be called now,
+        or None if there are no leads
+        '''
+        now = self.clock()
+        start = self.window[0]
+        delays = []
+        with self.lock:
+            for utc_offset, heap in self.buckets.items():
+                if not heap:
+                    continue
+                if self.is_open(utc_offset, now):
+                    return 0
+                delays.append((start - now - utc_offset) % DAY_SECONDS)
+        return min(delays, default=None)
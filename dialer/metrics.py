@@ -0,0 +1,269 @@
+'''
+Counters and fixed-bucket histograms of the dialer hot paths,
+exported in Prometheus text format
+'''
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def escape(value) -> str:
+    '''
+    Escapes a label value
+    '''
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def format_labels(labels: tuple, extra: tuple = ()) -> str:
+    '''
+    Formats (name, value) pairs as {name="value",...}
+    '''
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+def format_value(value: float) -> str:
+    '''
+    Formats a sample value. Whole numbers don't get a fraction
+    '''
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Counter:
+    '''
+    Monotonically increasing value
+    '''
+    TYPE = 'counter'
+    __slots__ = ('name', 'labels', 'value', 'lock')
+
+    def __init__(self, name: str, labels: tuple = ()):
+        """Constructor
+
+        :param name: name of the metric
+        :param labels: (name, value) pairs
+        """
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        '''
+        Increments the counter
+        '''
+        with self.lock:
+            self.value += amount
+
+    def samples(self) -> list:
+        '''
+        Returns exposition lines of the counter
+        '''
+        return [f'{self.name}{format_labels(self.labels)} {format_value(self.value)}']
+
+class Histogram:
+    '''
+    Distribution of observed values over fixed buckets
+    '''
+    TYPE = 'histogram'
+    __slots__ = ('name', 'labels', 'bounds', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, name: str, buckets: tuple, labels: tuple = ()):
+        """Constructor
+
+        :param name: name of the metric
+        :param buckets: sorted upper bounds of the buckets, +Inf is added automatically
+        :param labels: (name, value) pairs
+        """
+        if list(buckets) != sorted(buckets):
+            raise ValueError('Bucket bounds must be sorted')
+        self.name = name
+        self.labels = labels
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1) # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        '''
+        Records a value
+        '''
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self) -> list:
+        '''
+        Returns exposition lines of the histogram. Buckets are cumulative
+        '''
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+            count = self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = format_labels(self.labels, (('le', format_value(bound)),))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = format_labels(self.labels)
+        lines.append(f'{self.name}_sum{labels} {format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class MetricsRegistry:
+    '''
+    Named metrics, possibly several per name with different labels
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {} # (name, labels) -> metric
+        self.help = {} # name -> (type, help text)
+
+    def register(self, metric, help_text: str):
+        '''
+        Adds a metric. Returns the already registered one if it exists
+        '''
+        key = (metric.name, metric.labels)
+        with self.lock:
+            known = self.help.get(metric.name)
+            if known is not None and known[0] != metric.TYPE:
+                raise ValueError(f'Metric "{metric.name}" is already registered as {known[0]}')
+            self.help[metric.name] = (metric.TYPE, help_text)
+            return self.metrics.setdefault(key, metric)
+
+    def counter(self, name: str, help_text: str, labels: dict = None) -> Counter:
+        '''
+        Returns the counter with the name and labels, creating it if needed
+        '''
+        return self.register(Counter(name, tuple(sorted((labels or {}).items()))), help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple,
+                  labels: dict = None) -> Histogram:
+        '''
+        Returns the histogram with the name and labels, creating it if needed
+        '''
+        return self.register(Histogram(name, buckets, tuple(sorted((labels or {}).items()))),
+                             help_text)
+
+    def to_prometheus(self) -> str:
+        '''
+        Renders all metrics in Prometheus text exposition format
+        '''
+        with self.lock:
+            metrics = sorted(self.metrics.items(), key=lambda item: item[0])
+            help_texts = dict(self.help)
+        lines = []
+        name = None
+        for (metric_name, _), metric in metrics:
+            if metric_name != name:
+                name = metric_name
+                metric_type, help_text = help_texts[name]
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BATCH_BUCKETS = (1, 2, 3, 5, 8, 13, 21)
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+class DialerMetrics:
+    '''
+    Metrics updated by dialers and agents
+    '''
+    def __init__(self, registry: MetricsRegistry):
+        """Constructor
+
+        :param registry: where the metrics are registered
+        """
+        self.registry = registry
+        self.dials = registry.counter('dialer_dials_total', 'Dial attempts started')
+        self.dial_exceptions = registry.counter(
+            'dialer_dial_exceptions_total', 'Dial attempts which raised an exception')
+        self.dial_timeouts = registry.counter(
+            'dialer_dial_timeouts_total', 'Dial attempts which exceeded the ring timeout')
+        self.outcomes = {} # CallState -> counter, created on first use
+        self.connects = registry.counter(
+            'dialer_connects_total', 'Agents connected with a customer')
+        self.connects_without_call = registry.counter(
+            'dialer_connects_without_call_total',
+            'Connects which ended without a customer, because leads or time ran out')
+        self.time_to_connect = registry.histogram(
+            'dialer_time_to_connect_seconds', 'Time from start of connect until the agent is busy',
+            TIME_BUCKETS)
+        self.batches_per_connect = registry.histogram(
+            'dialer_batches_per_connect', 'Batches of leads dialed per successful connect',
+            BATCH_BUCKETS)
+        self.waiting_seconds = registry.histogram(
+            'dialer_waiting_seconds', 'Time agents spent in WAITING state', TIME_BUCKETS)
+        self.lead_fetch_seconds = registry.histogram(
+            'dialer_lead_fetch_seconds', 'Latency of fetching a batch of leads', TIME_BUCKETS)
+        self.calls_failed = registry.counter(
+            'dialer_calls_failed_total', 'Calls which ended unexpectedly')
+        self.duplicate_leads = registry.counter(
+            'dialer_duplicate_leads_total',
+            'Leads skipped because the same number was being dialed already')
+        self.suppressed_leads = registry.counter(
+            'dialer_suppressed_leads_total', 'Leads skipped because they are on a do-not-call list')
+        self.journal_dropped = registry.counter(
+            'dialer_journal_dropped_total', 'Journal records dropped because the queue was full')
+        self.breaker_opened = registry.counter(
+            'dialer_breaker_opened_total',
+            'Times the circuit breaker of the dialing service opened')
+        self.backoffs = registry.counter(
+            'dialer_backoffs_total',
+            'Connects paused without dialing, because the circuit breaker was open')
+
+    def outcome(self, state) -> Counter:
+        '''
+        Returns the counter of dial attempts which finished in the state
+        '''
+        counter = self.outcomes.get(state)
+        if counter is None:
+            counter = self.registry.counter('dialer_dial_outcomes_total',
+                                            'Finished dial attempts by state',
+                                            {'state': state.name})
+            self.outcomes[state] = counter
+        return counter
+
+DEFAULT_REGISTRY = MetricsRegistry()
+# metrics of all dialers and agents
+DEFAULT_METRICS = DialerMetrics(DEFAULT_REGISTRY)
+
+def start_http_server(port: int, address: str = '',
+                      registry: MetricsRegistry = DEFAULT_REGISTRY) -> HTTPServer:
+    '''
+    Serves metrics of the registry to Prometheus from a daemon thread.
+    Returns the server, call its `shutdown` method to stop it
+    '''
+    class MetricsHandler(BaseHTTPRequestHandler):
+        '''
+        Responds to every GET request with the metrics
+        '''
+        def do_GET(self): # pylint: disable=invalid-name
+            '''
+            Handles GET request
+            '''
+            body = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # pylint: disable=redefined-builtin
+            '''
+            Scrapes are not logged
+            '''
+
+    server = HTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,109 @@
+'''
+Pacing strategies decide how many leads are dialed in a single batch.
+A strategy implements two methods:
+
+- `leads_per_batch` returns the number of leads to dial in the next batch
+- `record_outcome` is called with the final state of every dial attempt
+'''
+import threading
+from .call_state import CallState
+
+class FixedPacing:
+    '''
+    Always dials the same number of leads per batch
+    '''
+    def __init__(self, ratio: int = 2):
+        """Constructor
+
+        :param ratio: number of leads dialed per batch
+        """
+        if ratio < 1:
+            raise ValueError('ratio must be a positive number')
+        self.ratio = ratio
+
+    def leads_per_batch(self) -> int:
+        '''
+        Returns the number of leads to dial in the next batch
+        '''
+        return self.ratio
+
+    def record_outcome(self, state: CallState, abandoned: bool = False):
+        '''
+        Fixed pacing ignores outcomes
+        '''
+
+def expected_abandon_rate(connect_rate: float, leads: int) -> float:
+    '''
+    Expected share of answered calls which have no agent to take them,
+    when leads are dialed at once and each one answers with connect_rate probability
+    '''
+    if connect_rate <= 0:
+        return 0.0
+    expected_connects = leads * connect_rate
+    at_least_one = 1 - (1 - connect_rate) ** leads
+    return (expected_connects - at_least_one) / expected_connects
+
+# pylint: disable=too-many-instance-attributes
+class EwmaPacing:
+    '''
+    Predictive pacing. Tracks the connect rate and the abandon rate as exponentially weighted
+    moving averages of outcomes and dials the smallest number of leads which connects
+    the agent with target probability. While the observed abandon rate is above the ceiling,
+    batches are also kept small enough that a single agent's expected abandon rate stays
+    below it. Surplus calls of a campaign are usually taken by other agents, so the
+    single-agent model alone would dial far too few leads
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, initial_connect_rate: float = 0.5, alpha: float = 0.05,
+                 target_connect_probability: float = 0.9, max_abandon_rate: float = 0.03,
+                 max_ratio: int = 10):
+        """Constructor
+
+        :param initial_connect_rate: connect rate assumed before any outcome is observed
+        :param alpha: weight of the latest outcome in the moving average
+        :param target_connect_probability: desired probability that a batch connects
+        :param max_abandon_rate: ceiling for the share of answered calls left without an agent
+        :param max_ratio: upper bound for the number of leads per batch
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1] range')
+        if max_ratio < 1:
+            raise ValueError('max_ratio must be a positive number')
+        self.alpha = alpha
+        self.target_connect_probability = target_connect_probability
+        self.max_abandon_rate = max_abandon_rate
+        self.max_ratio = max_ratio
+        # lock guarding moving averages, outcomes are recorded from many dialing threads
+        self.lock = threading.Lock()
+        self.connect_rate = initial_connect_rate
+        self.abandon_rate = 0.0 # observed share of answered calls left without an agent
+        self.outcomes = 0
+
+    def record_outcome(self, state: CallState, abandoned: bool = False):
+        '''
+        Updates moving averages with the final state of a dial attempt
+        '''
+        connected = 1.0 if state == CallState.CONNECTED else 0.0
+        with self.lock:
+            self.outcomes += 1
+            self.connect_rate += self.alpha * (connected - self.connect_rate)
+            if connected:
+                self.abandon_rate += self.alpha * ((1.0 if abandoned else 0.0) - self.abandon_rate)
+
+    def leads_per_batch(self) -> int:
+        '''
+        Returns the number of leads to dial in the next batch
+        '''
+        connect_rate = self.connect_rate
+        if connect_rate <= 0:
+            return self.max_ratio
+        # customers are being abandoned too often, back off to the conservative model
+        limited = self.abandon_rate > self.max_abandon_rate
+        leads = 1
+        while leads < self.max_ratio:
+            if 1 - (1 - connect_rate) ** leads >= self.target_connect_probability:
+                break
+            if limited and expected_abandon_rate(connect_rate, leads + 1) > self.max_abandon_rate:
+                break
+            leads += 1
+        return leads
@@ -0,0 +1,67 @@
+'''
+Compact integer encoding of E.164 phone numbers. Country codes never start with zero,
+so "+12123334444" maps to 12123334444 and back without losing information.
+Encoded numbers fit into signed 64 bit integers. Class MappedNumbers reads files of them
+'''
+import mmap
+import os
+
+MAX_DIGITS = 15 # E.164 limit
+SEPARATORS = str.maketrans('', '', ' -().') # formatting characters of written numbers
+
+def encode(phone_number: str) -> int:
+    '''
+    Converts a phone number like "+12123334444" to an integer. Numbers without
+    the leading "+" are rejected, because `decode` couldn't tell them apart
+    '''
+    digits = phone_number[1:]
+    if (not phone_number.startswith('+') or not digits.isdigit() or len(digits) > MAX_DIGITS
+            or digits[0] == '0'):
+        raise ValueError(f'"{phone_number}" is not a valid E.164 phone number')
+    return int(digits)
+
+def normalize(phone_number: str) -> str:
+    '''
+    Removes spaces, dashes, dots and parentheses, so "+1 (212) 333-4444" becomes "+12123334444"
+    '''
+    return phone_number.translate(SEPARATORS)
+
+def decode(value: int) -> str:
+    '''
+    Converts an integer produced by `encode` back to a phone number
+    '''
+    return f'+{value}'
+
+class MappedNumbers: # pylint: disable=too-few-public-methods
+    '''
+    Read-only memory map of a file of encoded phone numbers in native byte order.
+    `numbers` is a sequence of the integers, empty once the map is closed
+    '''
+    def __init__(self, path: str, kind: str):
+        """Constructor
+
+        :param path: the file
+        :param kind: what the file is, like "lead", used in the error raised for a file
+            whose size is not a multiple of 8
+        """
+        self.map = None
+        self.numbers = ()
+        with open(path, 'rb') as number_file:
+            self.stat = os.fstat(number_file.fileno())
+            if self.stat.st_size % 8:
+                raise ValueError(f'"{path}" is not a {kind} file, '
+                                 'its size is not a multiple of 8')
+            if self.stat.st_size:
+                # the map keeps its own descriptor, the file can be closed
+                self.map = mmap.mmap(number_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.numbers = memoryview(self.map).cast('q')
+
+    def close(self):
+        '''
+        Unmaps the file
+        '''
+        if self.map is not None:
+            self.numbers.release()
+            self.numbers = ()
+            self.map.close()
+            self.map = None
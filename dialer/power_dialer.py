@@ -4,186 +4,621 @@ Instead of using functions `dial` and `get_lead_phone_number_to_dial`
 this implementation expects two objects to be injected:
 
 - dialing_service which implements method `dial`
+  and optionally a bulk method `dial_many`
 - database which implements method `get_lead_phone_number_to_dial`
+  and optionally a bulk method `get_lead_phone_numbers_to_dial`
 
 this way tests may inject stubs that implement desired behavior.
 '''
 import logging
 import threading
-from .agent_state import AgentState
-from .call_data import CallData
-from.call_state import CallState
+import time
+from .agent import Agent
+from .agent_state import AgentEvent, AgentState
+from .call_data import DEFAULT_POOL, BatchResult
+from .call_state import CallState
+from .dial_executor import get_default_executor
+from .lead_buffer import fetch_leads
+from .pacing import FixedPacing
+from .timeouts import get_default_scheduler
 
-# pylint: disable=too-many-instance-attributes
-class PowerDialer:
+# pylint: disable=too-many-instance-attributes,too-many-public-methods
+class PowerDialer(Agent):
     '''
     Automatic dialer connecting agent with a customer
     '''
-    def __init__(self, database: object, dialing_service: object, agent_id: str):
+    __slots__ = ('DIAL_RATIO', 'MAX_RING_SECONDS', 'database', 'dialing_service', 'executor',
+                 'pacing', 'ring_timeout', 'timer', 'handoff', 'call_data', 'futures',
+                 'futures_lock', 'dials', 'cancelled', 'line_seconds_saved', 'connect_started',
+                 'batches')
+    logger = logging.getLogger(__name__)
+    call_data_pool = DEFAULT_POOL # batches are recycled instead of being allocated
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def __init__(self, database: object, dialing_service: object, agent_id: str,
+                 executor: object = None, pacing: object = None, handoff: object = None,
+                 ring_timeout: float = None, timer: object = None, clock=None,
+                 inflight: object = None, suppression: object = None, retries: object = None,
+                 journal: object = None, governor: object = None, breaker: object = None,
+                 skills=()):
         """Constructor
 
         :param agent_id: The name to use.
         :param database: an object implementing `get_lead_phone_number_to_dial` method
-        :param dialing_service: an object implementing `dial` method
+        :param dialing_service: an object implementing `dial` method. When it also implements
+            `dial_many(agent_id, numbers)`, a batch is dialed in one request, which yields
+            (index of the number, CallState) pairs as calls resolve
+        :param executor: an object implementing `submit` method returning a future.
+            Dial attempts of all dialers share a bounded thread pool by default
+        :param pacing: an object implementing `leads_per_batch` and `record_outcome` methods.
+            DIAL_RATIO leads are dialed per batch by default
+        :param handoff: a HandoffQueue shared with other agents of the campaign.
+            Surplus connected calls are abandoned when it's not set
+        :param ring_timeout: seconds after which an unfinished attempt counts as FAILED
+        :param timer: an object implementing `schedule(delay, func, *args)` method.
+            Timeouts of all dialers share a single thread by default
+        :param clock: a callable returning current time in seconds, time.monotonic by default.
+            Simulations pass a virtual clock
+        :param inflight: an InFlightRegistry shared with other dialers of the campaign.
+            Numbers being dialed by one of them are skipped by the others
+        :param suppression: a SuppressionList. Listed numbers are never dialed
+        :param retries: a RetryScheduler. Outcomes of all attempts are reported to it,
+            so failed leads are dialed again later
+        :param journal: an OutcomeJournal recording every dial attempt
+        :param governor: a DialGovernor shared by all dialers. Attempts wait for a line
+            so the carrier's limits aren't exceeded
+        :param breaker: a CircuitBreaker shared by all dialers. While it's open,
+            connecting agents back off without consuming leads
+        :param skills: skills of the agent. A database implementing
+            `get_lead_phone_numbers_for_skills` method, like SkillDispatcher,
+            only hands out leads whose required skills the agent has
         """
+        super().__init__(agent_id, skills, inflight, suppression, retries, journal, governor,
+                         breaker)
         self.DIAL_RATIO = 2 # pylint: disable=invalid-name
-        self.logger = logging.getLogger(__name__)
+        # how long an unanswered call keeps ringing, used to estimate savings of cancellation
+        self.MAX_RING_SECONDS = 30 # pylint: disable=invalid-name
         self.database = database
         self.dialing_service = dialing_service
-        self.agent_id = agent_id
-        self.agent_state = AgentState.UNAVAILABLE
-        self.current_lead = '' # phone number of the current customer
-        self.is_logging_out = False # changed if agent indicates desire to logout during a call
-        self.threads = [] # array of threads started in connect method. It's used in unit tests
+        self.executor = executor if executor is not None else get_default_executor()
+        self.pacing = pacing if pacing is not None else FixedPacing(self.DIAL_RATIO)
+        self.ring_timeout = ring_timeout
+        self.timer = timer if timer is not None else get_default_scheduler()
+        self.clock = clock if clock is not None else time.monotonic
+        self.handoff = handoff
+        if handoff is not None:
+            handoff.add_agent(self)
+        self.call_data = None # the latest batch
+        self.futures = set() # dial attempts which didn't finish yet. It's used in unit tests
+        # lock guarding futures, which worker threads remove once they finish
+        self.futures_lock = threading.Lock()
+        self.dials = 0 # total number of dial attempts started by this dialer
+        self.cancelled = 0 # total number of dial attempts cancelled by this dialer
+        self.line_seconds_saved = 0.0 # estimated ringing time saved by cancelling attempts
+        self.connect_started = None # clock() value when the current connect started
+        self.batches = 0 # number of batches dialed by the current connect
 
-    def on_agent_login(self):
+    def dialing_wrapper(self, phone_number, call_data, generation):
         '''
-        Notification when agent logs in and can be connected with customers
+        Handles dialing of a single phone number. If this attempt is successful
+        the agent gets connected to the customer.
+        If this is the last thread to finish without a connection then dials the next batch
         '''
-        if self.agent_state != AgentState.UNAVAILABLE:
-            msg = (f'Agent "{self.agent_id}" must be in UNAVAILABLE state. '
-                   f'Current state is "{self.agent_state}"')
-            self.logger.error(msg)
-            raise Exception(msg)
-        self.agent_state = AgentState.AVAILABLE
+        if not self.start_dialing([phone_number], call_data, generation):
+            return
+        started = self.clock()
+        error = False
+        try:
+            conn_state = self.dialing_service.dial(self.agent_id, phone_number)
+        except Exception as ex: # pylint: disable=broad-except
+            conn_state = self.dial_failed(phone_number, ex)
+            error = True
+        finally:
+            if self.governor is not None:
+                self.governor.release()
+        if self.breaker is not None:
+            self.breaker.record(self.clock() - started, error)
+        self.finish_attempt(phone_number, call_data, generation, conn_state, started)
 
-    def on_agent_logout(self):
+    def bulk_dialing_wrapper(self, leads, call_data, generation):
         '''
-        Notification when agent logs out and should not be connected with customers anymore
+        Dials all leads of a batch with a single `dial_many` request
+        and handles every result as soon as it's streamed back.
+        Lines of all attempts were granted together, they are released as attempts finish
         '''
-        # if agent is not connected to a customer he can logout immediately
-        if self.agent_state == AgentState.AVAILABLE:
-            self.agent_state = AgentState.UNAVAILABLE
-        # a busy, or connecting agent will be logged out later
-        # after the end of the current call
-        elif self.agent_state in [AgentState.BUSY, AgentState.WAITING]:
-            self.is_logging_out = True
-        # an attempt to logout again is treated as a no-op
+        leads = self.start_dialing(leads, call_data, generation)
+        if not leads:
+            return
+        started = self.clock()
+        for index, conn_state in self.bulk_results(leads, started):
+            if self.governor is not None:
+                self.governor.release()
+            self.finish_attempt(leads[index], call_data, generation, conn_state, started)
 
-    def on_call_started(self, lead_phone_number: str):
+    def submit(self, func, *args):
         '''
-        Notification when agent is connected with a customer
+        Runs func(*args) on one of the worker threads and tracks its future
         '''
-        if self.agent_state != AgentState.WAITING:
-            msg = (f'Agent "{self.agent_id}" must be in WAITING state. '
-                   f'Current state is "{self.agent_state}"')
-            self.logger.error(msg)
-            raise Exception(msg)
-        self.agent_state = AgentState.BUSY
-        self.current_lead = lead_phone_number
+        future = self.executor.submit(func, *args)
+        with self.futures_lock:
+            self.futures.add(future)
+        future.add_done_callback(self.discard_future)
 
-    def on_call_failed(self):
+    def discard_future(self, future):
         '''
-        Notification when call unexpectedly ends. And the agent can be connected again
+        Done callback of futures returned by submit
         '''
-        if self.agent_state != AgentState.BUSY:
-            msg = (f'Agent "{self.agent_id}" must be in BUSY state. '
-                   f'Current state is "{self.agent_state}"')
-            self.logger.error(msg)
-            raise Exception(msg)
-
-        warn_msg = f'Call failed for agent="{self.agent_id}" lead="{self.current_lead}"'
-        self.logger.warning(warn_msg)
-        self.current_lead = ''
-        if self.is_logging_out:
-            # agent wants to logout after the current call
-            self.is_logging_out = False
-            self.agent_state = AgentState.UNAVAILABLE
-        else:
-            self.agent_state = AgentState.AVAILABLE
+        with self.futures_lock:
+            self.futures.discard(future)
 
-    def on_call_ended(self):
+    def pending_futures(self) -> list:
         '''
-        Notification when call ends. And the agent can be connected again
+        Returns futures of the jobs which didn't finish yet
         '''
-        if self.agent_state != AgentState.BUSY:
-            msg = (f'Agent "{self.agent_id}" must be in BUSY state. '
-                   f'Current state is "{self.agent_state}"')
-            self.logger.error(msg)
-            raise Exception(msg)
+        with self.futures_lock:
+            return list(self.futures)
 
-        self.current_lead = ''
-        if self.is_logging_out:
-            # agent wants to logout after the current call
-            self.is_logging_out = False
-            self.agent_state = AgentState.UNAVAILABLE
-        else:
-            self.agent_state = AgentState.AVAILABLE
+    def start_attempt(self, func, arg, leads: list, call_data, generation):
+        '''
+        Runs func(arg, call_data, generation) on one of the worker threads once the governor
+        granted a line to every lead. Attempts waiting for lines don't occupy worker threads
+        '''
+        def run():
+            self.submit(func, arg, call_data, generation)
+        if self.governor is None:
+            run()
+            return
+        waiter = self.governor.enqueue(self.agent_id, run, len(leads))
+        if waiter is None:
+            run()
+            return
+        with call_data.lock:
+            # once granted, the attempt may have started already
+            if call_data.generation == generation and not waiter.granted:
+                for lead in leads:
+                    call_data.queued[lead] = waiter
+
+    def start_dialing(self, leads: list, call_data, generation) -> list:
+        '''
+        Returns leads which may be dialed now. Attempts whose batch connected, or which
+        timed out while they waited for a worker thread or a line, are finished without
+        dialing, and their lines are released
+        '''
+        skipped = []
+        with call_data.lock:
+            current = call_data.generation == generation
+            dialed = []
+            for lead in leads:
+                if current and lead in call_data.pending and lead not in call_data.cancelled:
+                    call_data.queued.pop(lead, None)
+                    dialed.append(lead)
+                else:
+                    pending = current and lead in call_data.pending
+                    skipped.append((lead, CallState.DISCONNECTED if pending else CallState.FAILED))
+        if self.governor is not None and skipped:
+            self.governor.release(len(skipped))
+        for lead, state in skipped:
+            self.skip_attempt(lead, call_data, generation, state)
+        return dialed
 
-    def dialing_wrapper(self, phone_number, call_data):
+    def skip_attempt(self, phone_number, call_data, generation, state: CallState):
         '''
-        Handles dialing of a single phone number. If this attempt is successful sets an event
-        If this is the last thread to finish then also sets the event
+        Finishes an attempt which was never dialed with the state it ended with:
+        DISCONNECTED when its batch connected, FAILED when it timed out
         '''
+        if self.breaker is not None:
+            # the call permitted for it wasn't made
+            self.breaker.release(1)
+        if self.retries is not None:
+            self.retries.record_outcome(phone_number, state)
         try:
-            conn_state = self.dialing_service.dial(self.agent_id, phone_number)
+            self.complete_attempt(phone_number, call_data, generation, state)
+        finally:
+            if self.inflight is not None:
+                self.inflight.release(phone_number)
+
+    def bulk_results(self, leads: list, started: float):
+        '''
+        Yields (index, CallState) pairs of a `dial_many` request sent at clock() value started.
+        Leads left without a result, because the request failed or the stream ended early,
+        are reported as FAILED
+        '''
+        remaining = set(range(len(leads)))
+        error = None
+        try:
+            for index, conn_state in self.dialing_service.dial_many(self.agent_id, leads):
+                if index in remaining:
+                    remaining.discard(index)
+                    if self.breaker is not None:
+                        self.breaker.record(self.clock() - started)
+                    yield index, conn_state
         except Exception as ex: # pylint: disable=broad-except
-            msg = f'Dialing "{phone_number}" for agent "{self.agent_id}" failed. Error: "{ex}"'
+            error = ex
+        for index in sorted(remaining):
+            if self.breaker is not None:
+                self.breaker.record(self.clock() - started, True)
+            yield index, self.dial_failed(leads[index], error or 'no result was returned')
+
+    def dial_failed(self, phone_number: str, error) -> CallState:
+        '''
+        Logs an attempt which failed with an error. Returns its state
+        '''
+        self.metrics.dial_exceptions.inc()
+        if self.logger.isEnabledFor(logging.ERROR):
+            msg = (f'Dialing "{phone_number}" for agent "{self.agent_id}" failed. '
+                   f'Error: "{error}"')
             self.logger.error(msg)
-            conn_state = CallState.FAILED
-        should_signal = False
-        call_data.lock.acquire()
-        if conn_state == CallState.CONNECTED and call_data.connected_number == '':
+        return CallState.FAILED
+
+    # pylint: disable=too-many-arguments
+    def finish_attempt(self, phone_number, call_data, generation, conn_state, started):
+        '''
+        Reports the outcome of an attempt which started at clock() value started,
+        and completes it
+        '''
+        self.report_outcome(phone_number, conn_state, self.clock() - started)
+        try:
+            self.complete_attempt(phone_number, call_data, generation, conn_state)
+        finally:
+            if self.inflight is not None:
+                self.inflight.release(phone_number)
+
+    def on_attempt_timeout(self, phone_number, call_data, generation):
+        '''
+        Invoked by the timeout scheduler when an attempt rings for too long.
+        The attempt is completed as FAILED right away on the scheduler thread, because
+        worker threads may all be busy with the hanging attempts the timeout cuts short.
+        Resolving the batch, which may fetch and dial the next one, is left to a worker
+        thread, so that the scheduler thread shared by all dialers isn't held up
+        '''
+        self.complete_attempt(phone_number, call_data, generation, CallState.FAILED, True)
+
+    # pylint: disable=too-many-arguments
+    def stop_timed_out_attempt(self, phone_number, call_data, generation, waiter, queued):
+        '''
+        Stops an attempt which was completed by its timeout: it is taken out of the governor
+        queue if it still waits for a line, otherwise the dialing service cancels it
+        '''
+        self.metrics.dial_timeouts.inc()
+        if self.logger.isEnabledFor(logging.WARNING):
+            msg = f'Dialing "{phone_number}" for agent "{self.agent_id}" timed out'
+            self.logger.warning(msg)
+        if waiter is not None and self.governor.cancel(waiter):
+            # it will never be dialed
+            self.skip_attempt(phone_number, call_data, generation, CallState.FAILED)
+        elif not queued:
+            self.cancel_attempt(phone_number)
+
+    # pylint: disable=too-many-arguments,too-many-branches
+    def complete_attempt(self, phone_number, call_data, generation, conn_state, timed_out=False):
+        '''
+        Records the final state of an attempt. The attempt which connects first,
+        or the last one to finish, resolves the batch.
+        An attempt completes only once, whatever comes first: its result or its timeout.
+        Results arriving after the batch was recycled only count as surplus connections
+        '''
+        result = None
+        should_recycle = False
+        with call_data.lock:
+            current = call_data.generation == generation
+            counted = current and call_data.pending.pop(phone_number, None) is not None
+            was_cancelled = counted and phone_number in call_data.cancelled
+            timer = call_data.timers.pop(phone_number, None) if counted else None
+            queued = counted and phone_number in call_data.queued
+            waiter = None
+            if timed_out and counted:
+                call_data.cancelled.add(phone_number)
+                waiter = call_data.queued.get(phone_number)
+                if waiter is not None and waiter.count == 1:
+                    # the line isn't needed anymore. Lines of a bulk request are cancelled
+                    # with the whole request
+                    del call_data.queued[phone_number]
+                else:
+                    waiter = None
+            if current and conn_state == CallState.CONNECTED and not call_data.resolved:
+                call_data.connected_number = phone_number
+                result = self.resolve_locked(call_data)
+
+            if counted:
+                call_data.thread_counter = call_data.thread_counter - 1
+                if call_data.thread_counter <= 0:
+                    if not call_data.resolved:
+                        result = self.resolve_locked(call_data)
+                    # nobody is going to touch the batch anymore
+                    should_recycle = True
+        if should_recycle:
+            self.recycle(call_data)
+        if timer is not None:
+            timer.cancel()
+        if timed_out:
+            if not counted:
+                # the attempt finished just before its timeout
+                return
+            self.stop_timed_out_attempt(phone_number, call_data, generation, waiter, queued)
+        abandoned = False
+        if conn_state == CallState.CONNECTED and result is None:
+            # a customer answered after the agent was connected to somebody else.
+            # Let's connect him to another agent if possible
+            abandoned = self.handoff is None or not self.handoff.offer(self, phone_number)
+        # outcome of a cancelled attempt says nothing about the lead
+        if conn_state == CallState.CONNECTED or (counted and not was_cancelled):
+            self.pacing.record_outcome(conn_state, abandoned)
+        if result is None:
+            return
+        if timed_out:
+            self.submit(self.resolve_batch, result)
+        else:
+            self.resolve_batch(result)
+
+    def recycle(self, call_data):
+        '''
+        Returns the batch of a finished connect to the pool
+        '''
+        if self.call_data is call_data:
+            self.call_data = None
+        self.call_data_pool.release(call_data)
+
+    def accept_handoff(self, phone_number: str) -> bool:
+        '''
+        Connects a WAITING agent with a customer who answered a call of another agent.
+        Returns False if the agent's batch is already resolved
+        '''
+        call_data = self.call_data
+        if call_data is None:
+            return False
+        with call_data.lock:
+            # the batch may have been recycled in the meantime
+            if self.call_data is not call_data or call_data.resolved:
+                return False
             call_data.connected_number = phone_number
-            should_signal = True
-        #else:
-        # in a real application if we connected to a customer we need to
-        # either connect to another agent, or terminate the call
-
-        call_data.thread_counter = call_data.thread_counter - 1
-        if call_data.thread_counter <= 0:
-            should_signal = True
-        # usually we put the code between .acquire and .release into a try/finally block
-        # but in this particular case there is no need for it
-        call_data.lock.release()
-        if should_signal:
-            call_data.event.set()
-
-    def connect(self):
-        '''
-        Connects agent with the next customer
-        '''
-        # First let's ensure that agent is available
-        if self.agent_state != AgentState.AVAILABLE:
-            msg = (f'Agent "{self.agent_id}" must be in AVAILABLE state. '
-                   f'Current state is "{self.agent_state}"')
+            result = self.resolve_locked(call_data)
+        self.resolve_batch(result)
+        return True
+
+    def resolve_locked(self, call_data) -> BatchResult:
+        '''
+        Marks the batch as resolved and takes everything needed to finish connecting,
+        because the batch may be recycled as soon as the lock is released.
+        Must be called while holding the lock of the batch
+        '''
+        call_data.resolved = True
+        losers = []
+        timers = []
+        queued = []
+        if call_data.connected_number != '':
+            # losing attempts don't need timeouts anymore
+            timers = list(call_data.timers.values())
+            call_data.timers.clear()
+            # attempts which didn't start are never dialed
+            for number, waiter in call_data.queued.items():
+                pending = number in call_data.pending
+                queued.append((number, waiter,
+                               CallState.DISCONNECTED if pending else CallState.FAILED))
+                call_data.cancelled.add(number)
+            call_data.queued.clear()
+            if getattr(self.dialing_service, 'cancel', None) is not None:
+                losers = [(number, started) for number, started in call_data.pending.items()
+                          if number not in call_data.cancelled]
+                call_data.cancelled.update(number for number, _ in losers)
+        return BatchResult(call_data.connected_number, call_data.callback, call_data.deadline,
+                           losers, timers, queued, call_data, call_data.generation)
+
+    def resolve_batch(self, result: BatchResult):
+        '''
+        Called exactly once per batch. Either connects the agent with the customer,
+        or starts a new batch when all attempts failed
+        '''
+        if result.connected_number != '':
+            for timer in result.timers:
+                timer.cancel()
+            self.cancel_pending_attempts(result.losers)
+            self.cancel_queued_attempts(result)
+            self.on_call_started(result.connected_number)
+            self.finish_connect(result.callback)
+            return
+        try:
+            self.dial_next_batch(result.callback, result.deadline)
+        except Exception as ex: # pylint: disable=broad-except
+            self.give_up_connect()
+            self.finish_connect(result.callback, ex)
+
+    def cancel_attempt(self, phone_number: str) -> bool:
+        '''
+        Cancels dialing of a number if the dialing service implements `cancel` method.
+        Returns True if the attempt was cancelled
+        '''
+        cancel = getattr(self.dialing_service, 'cancel', None)
+        if cancel is None:
+            return False
+        try:
+            cancel(self.agent_id, phone_number)
+        except Exception as ex: # pylint: disable=broad-except
+            msg = (f'Cancelling "{phone_number}" for agent "{self.agent_id}" failed. '
+                   f'Error: "{ex}"')
             self.logger.error(msg)
-            raise Exception(msg)
+            return False
+        return True
+
+    def cancel_pending_attempts(self, losers: list):
+        '''
+        Cancels attempts of a connected batch which are still ringing.
+        losers is a list of (phone number, time when dialing started) tuples
+        '''
+        if not losers:
+            return
+        now = self.clock()
+        ring_seconds = self.ring_timeout if self.ring_timeout is not None else self.MAX_RING_SECONDS
+        saved = 0.0
+        cancelled = 0
+        for number, started in losers:
+            if self.cancel_attempt(number):
+                cancelled += 1
+                saved += max(0.0, ring_seconds - (now - started))
+        self.cancelled += cancelled
+        self.line_seconds_saved += saved
+        if self.logger.isEnabledFor(logging.DEBUG):
+            msg = (f'Cancelled {cancelled} attempts for agent "{self.agent_id}" '
+                   f'saving {saved:.1f} line-seconds')
+            self.logger.debug(msg)
 
-        self.threads.clear()
+    def cancel_queued_attempts(self, result: BatchResult):
+        '''
+        Takes attempts of a connected batch which still wait for a line out of the governor.
+        Attempts which were already granted their lines are skipped once they run
+        '''
+        cancelled = set()
+        for _, waiter, _ in result.queued:
+            if id(waiter) not in cancelled and self.governor.cancel(waiter):
+                cancelled.add(id(waiter))
+        for number, waiter, state in result.queued:
+            if id(waiter) in cancelled:
+                self.skip_attempt(number, result.call_data, result.generation, state)
+
+    def finish_connect(self, callback, error: Exception = None):
+        '''
+        Notifies the initiator of start_connect that connecting is over
+        '''
+        if self.agent_state == AgentState.BUSY:
+            self.metrics.connects.inc()
+            self.metrics.time_to_connect.observe(self.clock() - self.connect_started)
+            self.metrics.batches_per_connect.observe(self.batches)
+        else:
+            self.metrics.connects_without_call.inc()
+        if callback is not None:
+            callback(self, error)
+
+    def dial_next_batch(self, callback, deadline: float = None):
+        '''
+        Fetches the next batch of leads and starts dialing them.
+        When there are no more leads, or the deadline passed,
+        the agent stays AVAILABLE and callback is invoked
+        '''
+        now = self.clock()
+        if deadline is not None and deadline <= now:
+            # out of time, don't waste leads
+            self.transition(AgentEvent.GIVE_UP)
+            self.finish_connect(callback)
+            return
+
+        # a customer connected by another agent may be waiting for us
+        if self.handoff is not None:
+            phone_number = self.handoff.take(self.skills)
+            if phone_number is not None:
+                self.on_call_started(phone_number)
+                self.finish_connect(callback)
+                return
+
+        count = self.pacing.leads_per_batch()
+        bulk = getattr(self.dialing_service, 'dial_many', None) is not None
+        if bulk and self.governor is not None:
+            # a request can't have more attempts than there are lines
+            count = min(count, self.governor.max_lines)
+        if self.breaker is not None:
+            # while the dialing service is failing, leads would only be wasted
+            count = self.breaker.permit(count)
+            if count == 0:
+                self.back_off(callback)
+                return
+
+        leads = self.take_leads(count)
+        if not leads:
+            # no more leads in the database
+            self.transition(AgentEvent.GIVE_UP)
+            self.finish_connect(callback)
+            return
+        now = self.clock()
+        # an attempt may ring until the ring timeout, but not past the deadline
+        timeout = self.ring_timeout
+        if deadline is not None:
+            timeout = deadline - now if timeout is None else min(timeout, deadline - now)
+        call_data = self.call_data_pool.acquire()
+        with call_data.lock:
+            generation = call_data.generation
+            call_data.thread_counter = len(leads)
+            call_data.callback = callback
+            call_data.deadline = deadline
+            for lead in leads:
+                call_data.pending[lead] = now
+                if timeout is not None:
+                    call_data.timers[lead] = self.timer.schedule(
+                        timeout, self.on_attempt_timeout, lead, call_data, generation)
+        self.call_data = call_data
+        self.dials += len(leads)
+        self.batches += 1
+        self.metrics.dials.inc(len(leads))
+        if bulk:
+            # one request for the whole batch, handled on one of the shared worker threads
+            self.start_attempt(self.bulk_dialing_wrapper, leads, leads, call_data, generation)
+            return
+        # dial every lead on one of the shared worker threads
+        for lead in leads:
+            self.start_attempt(self.dialing_wrapper, lead, [lead], call_data, generation)
+
+    def take_leads(self, count: int) -> list:
+        '''
+        Fetches up to count leads from the database and claims them.
+        Returns an empty list when the database ran out of leads
+        '''
+        # We would like to get as many leads as pacing suggests, but we need to take
+        # of exceptional cases when database doesn't have not enough leads
+        leads = []
+        while not leads:
+            fetch_started = self.clock()
+            fetched = fetch_leads(self.database, count, self.skills)
+            self.metrics.lead_fetch_seconds.observe(self.clock() - fetch_started)
+            if len(fetched) == 0:
+                break
+            # all of them may be suppressed, or dialed by other agents right now,
+            # then fetch more
+            leads = self.claim_leads(fetched)
+        if self.breaker is not None:
+            # permitted calls which won't be made
+            self.breaker.release(count - len(leads))
+        return leads
+
+    def back_off(self, callback):
+        '''
+        Ends connecting without dialing, because the dialing service is failing.
+        The agent stays in BACKOFF state until calls may be made again
+        '''
+        self.transition(AgentEvent.BACK_OFF)
+        self.metrics.backoffs.inc()
+        self.timer.schedule(self.breaker.retry_after(), self.on_backoff_over)
+        self.finish_connect(callback)
+
+    def start_connect(self, callback=None, deadline: float = None):
+        '''
+        Starts connecting agent with the next customer and returns without waiting.
+        callback(dialer, error) is invoked once the agent is connected,
+        there are no more leads to dial, or deadline seconds passed
+        '''
+        # First let's ensure that agent is available. Concurrent connects can't both succeed
+        self.transition(AgentEvent.CONNECT)
+        self.connect_started = self.clock()
+        self.batches = 0
+        if deadline is not None:
+            deadline = self.connect_started + deadline
         # We start multiple concurrent attempts, but there is a small chance
-        # that all attempts will fail. Then we will start a new batch
-        should_retry = True
-        while should_retry:
-            # Fetch phone numbers from the database. We would like to get up to DIAL_RATIO
-            # number of leads, but we need to take of exceptional cases when database
-            # doesn't have not enough leads
-            leads = []
-            for i in range(self.DIAL_RATIO):
-                lead = self.database.get_lead_phone_number_to_dial()
-                if not lead is None:
-                    leads.append(lead)
-                else:
-                    break
-
-            # if we found some leads let's dial them
-            if len(leads) > 0:
-                call_data = CallData()
-                self.agent_state = AgentState.WAITING
-                call_data.thread_counter = len(leads)
-                # create one thread per lead number
-                for lead in leads:
-                    thread = threading.Thread(
-                        target=self.dialing_wrapper,
-                        args=(lead, call_data)
-                    )
-                    self.threads.append(thread)
-                    thread.start()
-                call_data.event.wait()
-                if call_data.connected_number != '':
-                    self.on_call_started(call_data.connected_number)
-                    should_retry = False
-            else:
-                # no more leads in the database
-                self.agent_state = AgentState.AVAILABLE
-                should_retry = False
+        # that all attempts will fail. Then the last finished attempt starts a new batch
+        try:
+            self.dial_next_batch(callback, deadline)
+        except Exception:
+            # the agent must not stay WAITING when fetching the first batch failed
+            self.give_up_connect()
+            raise
+
+    def connect(self, deadline: float = None):
+        '''
+        Connects agent with the next customer.
+        If deadline is given gives up after that many seconds and leaves the agent AVAILABLE
+        '''
+        done = threading.Event()
+        errors = []
+        def on_done(dialer, error): # pylint: disable=unused-argument
+            if error is not None:
+                errors.append(error)
+            done.set()
+        self.start_connect(on_done, deadline)
+        done.wait()
+        if errors:
+            raise errors[0]
@@ -0,0 +1,176 @@
+'''
+Contains class RetryScheduler which brings failed and unanswered leads back
+after a backoff, and the hierarchical TimerWheel keeping them until they are due
+'''
+import collections
+import threading
+import time
+from .call_state import CallState
+from .lead_buffer import fetch_leads
+
+# outcome -> seconds before the first retry. The delay doubles with every further attempt
+DEFAULT_BACKOFF = {
+    CallState.FAILED: 60.0,
+    CallState.DISCONNECTED: 600.0,
+}
+
+class TimerWheel:
+    '''
+    Hierarchical timer wheel. Level 0 has a slot per tick, every next level has a slot
+    per turn of the level below it. Items move to a lower level when the slot they wait in
+    comes up, so adding an item and collecting a due one take constant time
+    however many items are waiting. It is not thread safe
+    '''
+    def __init__(self, slots: int = 256, levels: int = 4):
+        """Constructor
+
+        :param slots: slots per level, a power of two
+        :param levels: at least 2. Items further than slots ** levels ticks ahead
+            wait in the last level until they come closer
+        """
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError('slots must be a power of two')
+        if levels < 2:
+            # with a single level, items further than slots ticks ahead would be
+            # collected too early, as soon as their slot comes up
+            raise ValueError('levels must be at least 2')
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.levels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current = 0 # the last tick which was collected
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, due: int, item):
+        '''
+        Adds an item which is due at the given tick.
+        Items which are already due are collected at the next tick
+        '''
+        self.insert(max(due, self.current + 1), item)
+        self.size += 1
+
+    def insert(self, due: int, item):
+        '''
+        Puts an item into the slot of the lowest level that covers its delay
+        '''
+        delay = due - self.current
+        level = 0
+        while level < len(self.levels) - 1 and delay >= 1 << (self.bits * (level + 1)):
+            level += 1
+        # the last level takes items of any delay and sends them back
+        # to itself until they are close enough
+        shift = self.bits * level
+        slot = min(due, self.current + (1 << (shift + self.bits)) - 1) >> shift
+        self.levels[level][slot & self.mask].append((due, item))
+
+    def advance(self, tick: int) -> list:
+        '''
+        Moves the wheel up to the given tick. Returns items which became due
+        '''
+        due_items = []
+        while self.current < tick and self.size:
+            self.current += 1
+            # cascade higher levels whose slot comes up at this tick
+            for level in range(len(self.levels) - 1, 0, -1):
+                if self.current & ((1 << (self.bits * level)) - 1) == 0:
+                    slot = (self.current >> (self.bits * level)) & self.mask
+                    entries = self.levels[level][slot]
+                    self.levels[level][slot] = []
+                    for due, item in entries:
+                        self.insert(due, item)
+            slot = self.current & self.mask
+            entries = self.levels[0][slot]
+            if entries:
+                self.levels[0][slot] = []
+                self.size -= len(entries)
+                due_items.extend(item for _, item in entries)
+        # nothing is waiting, skip idle ticks at once
+        self.current = max(self.current, tick)
+        return due_items
+
+# pylint: disable=too-many-instance-attributes
+class RetryScheduler:
+    '''
+    Implements `get_lead_phone_number_to_dial` and `get_lead_phone_numbers_to_dial` methods
+    on top of another database. Leads passed to `record_outcome` with an outcome
+    of the backoff policy are dialed again once their backoff passes, until they
+    reach the attempt limit. Due retries are returned before new leads.
+    There is no timer thread: the wheel advances whenever leads are fetched
+    '''
+    def __init__(self, database: object, backoff: dict = None, max_attempts: int = 3,
+                 tick: float = 1.0, clock=None):
+        """Constructor
+
+        :param database: an object implementing `get_lead_phone_number_to_dial` method
+        :param backoff: outcome -> seconds before the first retry, DEFAULT_BACKOFF by default.
+            Other outcomes are not retried
+        :param max_attempts: attempts of a lead including the first one
+        :param tick: resolution of retry times in seconds
+        :param clock: a callable returning current time in seconds, time.monotonic by default
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be a positive number')
+        self.database = database
+        self.backoff = backoff if backoff is not None else DEFAULT_BACKOFF
+        self.max_attempts = max_attempts
+        self.tick = tick
+        self.clock = clock if clock is not None else time.monotonic
+        # lock guarding all fields below
+        self.lock = threading.Lock()
+        self.wheel = TimerWheel()
+        self.start = self.clock() # wheel ticks count from here
+        self.attempts = {} # lead -> failed attempts so far, while it's being retried
+        self.due = collections.deque() # retries to dial before new leads
+        self.exhausted = 0 # leads which failed max_attempts times
+
+    def __len__(self):
+        '''
+        Returns the number of leads waiting for a retry
+        '''
+        return len(self.attempts)
+
+    def record_outcome(self, phone_number: str, state: CallState):
+        '''
+        Schedules a retry of the lead if the outcome calls for it.
+        Dialers call it when an attempt finishes
+        '''
+        delay = self.backoff.get(state)
+        with self.lock:
+            if delay is None:
+                self.attempts.pop(phone_number, None)
+                return
+            attempts = self.attempts.get(phone_number, 0) + 1
+            if attempts >= self.max_attempts:
+                self.attempts.pop(phone_number, None)
+                self.exhausted += 1
+                return
+            self.attempts[phone_number] = attempts
+            due = self.clock() + delay * 2 ** (attempts - 1)
+            self.wheel.add(int((due - self.start) / self.tick), phone_number)
+
+    def collect_locked(self):
+        '''
+        Moves retries which became due to the queue. Must be called while holding the lock
+        '''
+        now = int((self.clock() - self.start) / self.tick)
+        self.due.extend(self.wheel.advance(now))
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Returns a due retry, or a new lead from the database
+        '''
+        leads = self.get_lead_phone_numbers_to_dial(1)
+        return leads[0] if leads else None
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count leads, due retries first
+        '''
+        with self.lock:
+            self.collect_locked()
+            leads = [self.due.popleft() for _ in range(min(count, len(self.due)))]
+        if len(leads) < count:
+            leads.extend(fetch_leads(self.database, count - len(leads)))
+        return leads
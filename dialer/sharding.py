@@ -0,0 +1,358 @@
+'''
+Contains class ShardedCampaign which splits agents across worker processes, so dialing
+bookkeeping isn't limited to one core by the GIL. Every worker runs a Campaign of PowerDialer
+objects. The parent process owns the lead source and collects outcomes. Leads and outcomes
+travel between processes in batches, so a message is exchanged per many leads
+rather than per lead
+'''
+import collections
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import wait
+from .agent_state import AgentState
+from .campaign import Campaign
+from .journal import OutcomeRecorder
+from .lead_buffer import fetch_leads
+from .power_dialer import PowerDialer
+from .timeouts import get_default_scheduler
+
+POLL_SECONDS = 0.1 # how often the collector checks whether workers are still alive
+
+def shard_of(agent_id: str, shards: int) -> int:
+    '''
+    Returns the shard of an agent. Unlike `hash`, it's the same in every process
+    '''
+    return zlib.crc32(agent_id.encode('utf-8')) % shards
+
+class RemoteLeadSource:
+    '''
+    Implements `get_lead_phone_number_to_dial` and `get_lead_phone_numbers_to_dial` methods
+    in a worker. Leads are requested from the parent process in batches of batch_size
+    and handed out from a local buffer
+    '''
+    def __init__(self, shard: int, requests, connection, batch_size: int = 64):
+        """Constructor
+
+        :param shard: index of the worker, sent with requests
+        :param requests: queue of lead requests shared by all workers
+        :param connection: end of a pipe the parent process sends leads to
+        :param batch_size: leads requested at once at least
+        """
+        self.shard = shard
+        self.requests = requests
+        self.connection = connection
+        self.batch_size = batch_size
+        # lock guarding the buffer, it's never held while waiting for the parent process
+        self.lock = threading.Lock()
+        self.buffer = collections.deque()
+        # lock held during a request, so responses can't get mixed
+        self.request_lock = threading.Lock()
+
+    def take_locked(self, count: int) -> list:
+        '''
+        Removes up to count leads from the buffer. Must be called while holding the lock
+        '''
+        return [self.buffer.popleft() for _ in range(min(count, len(self.buffer)))]
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count leads. Leads already buffered are handed out
+        while another thread waits for a request
+        '''
+        with self.lock:
+            if len(self.buffer) >= count:
+                return self.take_locked(count)
+        with self.request_lock:
+            with self.lock:
+                # the buffer may have been refilled while waiting for the request lock
+                missing = count - len(self.buffer)
+                if missing <= 0:
+                    return self.take_locked(count)
+            self.requests.put((self.shard, max(self.batch_size, missing)))
+            leads = self.connection.recv()
+        with self.lock:
+            self.buffer.extend(leads)
+            return self.take_locked(count)
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Returns the next lead, or None when the parent process ran out of leads
+        '''
+        leads = self.get_lead_phone_numbers_to_dial(1)
+        return leads[0] if leads else None
+
+class OutcomeSender(OutcomeRecorder):
+    '''
+    Collects journal records in a worker and sends them to the parent process
+    in batches of batch_size, or when `flush` is called
+    '''
+    def __init__(self, shard: int, outcomes, batch_size: int = 256):
+        """Constructor
+
+        :param shard: index of the worker, sent with batches
+        :param outcomes: queue of record batches shared by all workers
+        :param batch_size: records sent at once
+        """
+        self.shard = shard
+        self.outcomes = outcomes
+        self.batch_size = batch_size
+        # lock guarding the records
+        self.lock = threading.Lock()
+        self.records = []
+
+    def append(self, record: dict):
+        '''
+        Adds a record to the batch and sends the batch when it's full
+        '''
+        with self.lock:
+            self.records.append(record)
+            if len(self.records) < self.batch_size:
+                return
+            records, self.records = self.records, []
+        self.outcomes.put((self.shard, records, False))
+
+    def flush(self, final: bool = False):
+        '''
+        Sends collected records. The final batch tells the parent that the worker stopped
+        '''
+        with self.lock:
+            records, self.records = self.records, []
+        if records or final:
+            self.outcomes.put((self.shard, records, final))
+
+# pylint: disable=too-many-arguments,too-many-locals
+def run_shard(shard: int, agent_ids: list, service_factory, lead_requests, lead_connection,
+              commands, outcomes, options: dict):
+    '''
+    Body of a worker. Logs the agents in and connects them until it receives a stop command.
+    Commands are tuples: ('call_ended', agent_id) or ('stop',)
+    '''
+    logger = logging.getLogger(__name__)
+    leads = RemoteLeadSource(shard, lead_requests, lead_connection, options['lead_batch'])
+    sender = OutcomeSender(shard, outcomes, options['outcome_batch'])
+    service = service_factory()
+    talk_seconds = options['talk_seconds']
+    timer = get_default_scheduler()
+
+    def end_call_later(dialer, old_state, new_state, lead): # pylint: disable=unused-argument
+        if new_state == AgentState.BUSY:
+            timer.schedule(talk_seconds, dialer.on_call_ended)
+
+    campaign = Campaign(options['idle_retry_seconds'])
+    dialers = {}
+    for agent_id in agent_ids:
+        dialer = PowerDialer(leads, service, agent_id, journal=sender)
+        dialer.add_state_listener(sender.on_state_changed)
+        if talk_seconds is not None:
+            dialer.add_state_listener(end_call_later)
+        dialer.on_agent_login()
+        campaign.add_agent(dialer)
+        dialers[agent_id] = dialer
+    campaign.start()
+    while True:
+        try:
+            command = commands.get(timeout=options['flush_interval'])
+        except queue.Empty:
+            sender.flush()
+            continue
+        if command[0] == 'stop':
+            break
+        try:
+            dialers[command[1]].on_call_ended()
+        except Exception as ex: # pylint: disable=broad-except
+            msg = f'Command {command} failed in shard {shard}. Error: "{ex}"'
+            logger.error(msg)
+    campaign.stop()
+    # connects in progress may dial further batches
+    pending = True
+    while pending:
+        pending = [future for dialer in dialers.values() for future in dialer.pending_futures()]
+        wait(pending)
+    sender.flush(final=True)
+
+# pylint: disable=too-many-instance-attributes
+class ShardedCampaign:
+    '''
+    Runs agents in worker processes. Agents are assigned to workers by a stable hash
+    of their ids, so commands for an agent are always routed to the same worker.
+    Workers share a queue of lead requests and a queue of outcome batches. The parent
+    answers lead requests from the database and aggregates outcomes, which it may
+    also pass to a journal
+    '''
+    logger = logging.getLogger(__name__)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, database: object, service_factory, agent_ids: list, shards: int = None,
+                 lead_batch: int = 64, outcome_batch: int = 256, flush_interval: float = 0.1,
+                 talk_seconds: float = None, idle_retry_seconds: float = 1.0,
+                 journal: object = None, start_method: str = 'spawn'):
+        """Constructor
+
+        :param database: an object implementing `get_lead_phone_number_to_dial` method,
+            used by the parent process only
+        :param service_factory: a picklable callable creating the dialing service of a worker
+        :param agent_ids: agents of the campaign
+        :param shards: number of worker processes, the number of CPUs by default
+        :param lead_batch: leads a worker requests at once at least
+        :param outcome_batch: records a worker sends at once at most
+        :param flush_interval: seconds after which a worker sends an incomplete batch
+        :param talk_seconds: when set, workers end calls after this many seconds.
+            Otherwise `call_ended` must be called when an agent's call is over
+        :param idle_retry_seconds: passed to Campaign of every worker
+        :param journal: an OutcomeJournal the outcomes of all workers are appended to
+        :param start_method: multiprocessing start method. Workers are spawned by default,
+            because threads of the parent, like the shared dial executor, don't survive fork
+        """
+        self.database = database
+        self.service_factory = service_factory
+        self.shards = shards if shards is not None else (os.cpu_count() or 1)
+        self.assignment = [[] for _ in range(self.shards)]
+        for agent_id in agent_ids:
+            self.assignment[shard_of(agent_id, self.shards)].append(agent_id)
+        self.options = {
+            'lead_batch': lead_batch,
+            'outcome_batch': outcome_batch,
+            'flush_interval': flush_interval,
+            'talk_seconds': talk_seconds,
+            'idle_retry_seconds': idle_retry_seconds,
+        }
+        self.journal = journal
+        self.context = multiprocessing.get_context(start_method)
+        self.lead_requests = None
+        self.outcomes = None
+        self.commands = []
+        self.connections = []
+        self.processes = []
+        self.threads = []
+        # lock guarding the statistics below
+        self.lock = threading.Lock()
+        self.dials = 0
+        self.connects = 0
+        self.outcome_counts = collections.Counter() # CallState name -> dial attempts
+        self.started_at = None
+
+    def start(self):
+        '''
+        Starts the worker processes and the threads serving them
+        '''
+        self.lead_requests = self.context.Queue()
+        self.outcomes = self.context.Queue()
+        for shard, agent_ids in enumerate(self.assignment):
+            connection, worker_connection = self.context.Pipe()
+            commands = self.context.Queue()
+            process = self.context.Process(
+                target=run_shard, name=f'shard-{shard}', daemon=True,
+                args=(shard, agent_ids, self.service_factory, self.lead_requests,
+                      worker_connection, commands, self.outcomes, self.options))
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.commands.append(commands)
+            self.processes.append(process)
+        self.started_at = time.monotonic()
+        self.threads = [threading.Thread(target=self.serve_leads, name='leads', daemon=True),
+                        threading.Thread(target=self.collect, name='outcomes', daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def serve_leads(self):
+        '''
+        Body of the thread answering lead requests of the workers
+        '''
+        while True:
+            request = self.lead_requests.get()
+            if request is None:
+                return
+            shard, count = request
+            try:
+                leads = fetch_leads(self.database, count)
+            except Exception as ex: # pylint: disable=broad-except
+                msg = f'Fetching leads for shard {shard} failed. Error: "{ex}"'
+                self.logger.error(msg)
+                leads = []
+            # the worker waits for a response, if the leads can't be sent it gets none
+            for response in (leads, []):
+                try:
+                    self.connections[shard].send(response)
+                    break
+                except Exception as ex: # pylint: disable=broad-except
+                    msg = (f'Sending {len(response)} leads to shard {shard} failed. '
+                           f'Error: "{ex}"')
+                    self.logger.error(msg)
+
+    def collect(self):
+        '''
+        Body of the thread receiving outcomes until all workers stopped
+        '''
+        running = len(self.processes)
+        while running:
+            try:
+                _, records, final = self.outcomes.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if any(process.is_alive() for process in self.processes):
+                    continue
+                self.logger.error('Workers exited without reporting all outcomes')
+                return
+            self.record(records)
+            if final:
+                running -= 1
+
+    def record(self, records: list):
+        '''
+        Aggregates a batch of records received from a worker
+        '''
+        with self.lock:
+            for record in records:
+                if record['type'] == 'dial':
+                    self.dials += 1
+                    self.outcome_counts[record['state']] += 1
+                elif record['state'] == AgentState.BUSY.name:
+                    self.connects += 1
+        if self.journal is not None:
+            for record in records:
+                self.journal.append(record)
+
+    def call_ended(self, agent_id: str):
+        '''
+        Tells the worker of the agent that the agent's call is over
+        '''
+        self.commands[shard_of(agent_id, self.shards)].put(('call_ended', agent_id))
+
+    def stop(self):
+        '''
+        Stops the workers once their connects in progress finish, and waits for their outcomes
+        '''
+        for commands in self.commands:
+            commands.put(('stop',))
+        self.threads[1].join()
+        for process in self.processes:
+            process.join()
+        self.lead_requests.put(None)
+        self.threads[0].join()
+        for connection in self.connections:
+            connection.close()
+
+    def stats(self) -> dict:
+        '''
+        Returns throughput of the campaign since it started
+        '''
+        with self.lock:
+            dials = self.dials
+            connects = self.connects
+            outcomes = dict(self.outcome_counts)
+        elapsed = time.monotonic() - self.started_at if self.started_at is not None else 0
+        return {
+            'agents': sum(len(agent_ids) for agent_ids in self.assignment),
+            'shards': self.shards,
+            'dials': dials,
+            'connects': connects,
+            'outcomes': outcomes,
+            'elapsed': elapsed,
+            'dials_per_second': dials / elapsed if elapsed > 0 else 0.0,
+            'connects_per_second': connects / elapsed if elapsed > 0 else 0.0,
+        }
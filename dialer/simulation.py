@@ -0,0 +1,365 @@
+'''
+Discrete-event simulation of a campaign. Dial attempts, timeouts and agents' calls are
+events in a queue ordered by virtual time, so a whole shift runs in seconds of wall time.
+Real PowerDialer, Agent and HandoffQueue objects are driven, therefore the simulation
+goes through the same state transitions as production code.
+Everything runs on the calling thread
+'''
+import collections
+import heapq
+import itertools
+import math
+import random
+from .agent_state import AgentState
+from .call_state import CallState
+from .handoff import HandoffQueue
+from .power_dialer import PowerDialer
+from .timeouts import Timeout
+
+class Simulation:
+    '''
+    Virtual clock and event queue. Implements the `schedule` method expected
+    by PowerDialer from a timer, and `time` can be passed as its clock
+    '''
+    def __init__(self, start: float = 0.0):
+        """Constructor
+
+        :param start: initial virtual time in seconds
+        """
+        self.now = start
+        self.heap = [] # (due time, sequence number, Timeout)
+        self.sequence = itertools.count()
+        self.events = 0 # number of events processed so far
+
+    def time(self) -> float:
+        '''
+        Returns current virtual time
+        '''
+        return self.now
+
+    def schedule(self, delay: float, func, *args) -> Timeout:
+        '''
+        Runs func(*args) after delay virtual seconds. Returns a handle which can cancel it
+        '''
+        timeout = Timeout(self.now + delay, func, args)
+        heapq.heappush(self.heap, (timeout.due, next(self.sequence), timeout))
+        return timeout
+
+    def run(self, until: float = None) -> int:
+        '''
+        Processes events in order of their due time, until the queue is empty
+        or the next event is due after `until`. Returns the number of processed events
+        '''
+        processed = 0
+        while self.heap and (until is None or self.heap[0][0] <= until):
+            _, _, timeout = heapq.heappop(self.heap)
+            if timeout.cancelled:
+                continue
+            self.now = timeout.due
+            processed += 1
+            timeout.func(*timeout.args)
+        if until is not None:
+            self.now = max(self.now, until)
+        self.events += processed
+        return processed
+
+class SimulatedFuture:
+    '''
+    Result of a job run by SimulatedExecutor
+    '''
+    def __init__(self):
+        self.finished = False
+        self.callbacks = []
+
+    def done(self) -> bool:
+        '''
+        True once the job ran
+        '''
+        return self.finished
+
+    def add_done_callback(self, func):
+        '''
+        Invokes func(future) once the job ran, or right away if it already did
+        '''
+        if self.finished:
+            func(self)
+        else:
+            self.callbacks.append(func)
+
+    def set_done(self):
+        '''
+        Marks the job as finished and invokes the callbacks
+        '''
+        self.finished = True
+        callbacks, self.callbacks = self.callbacks, []
+        for func in callbacks:
+            func(self)
+
+class SimulatedExecutor:
+    '''
+    Executor running submitted jobs as events of a simulation.
+    `delay(func, args)` tells how many virtual seconds a job blocks before it returns,
+    the job runs once they passed
+    '''
+    def __init__(self, simulation: Simulation, delay=None):
+        """Constructor
+
+        :param simulation: event queue to run jobs on
+        :param delay: a callable returning the duration of a job, jobs take no time by default
+        """
+        self.simulation = simulation
+        self.delay = delay
+        self.submitted = 0
+
+    def submit(self, func, *args) -> SimulatedFuture:
+        '''
+        Schedules func(*args). Returns a future
+        '''
+        future = SimulatedFuture()
+        delay = self.delay(func, args) if self.delay is not None else 0.0
+        self.submitted += 1
+        self.simulation.schedule(delay, self.run, future, func, args)
+        return future
+
+    @staticmethod
+    def run(future: SimulatedFuture, func, args: tuple):
+        '''
+        Runs the job and completes its future
+        '''
+        try:
+            func(*args)
+        finally:
+            future.set_done()
+
+# pylint: disable=too-many-instance-attributes
+class SimulatedDialingService:
+    '''
+    Dialing service with log-normal ring times and random outcomes.
+    A call is set up by `ring`, which returns how long it rings, and `dial` is invoked
+    once that time passed. A cancelled call ends right away as FAILED and frees its line,
+    its attempt never reaches `dial`
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, simulation: Simulation, answer_rate: float = 0.3,
+                 fail_rate: float = 0.3, median_ring_seconds: float = 15.0,
+                 ring_sigma: float = 0.5, seed: int = 1):
+        """Constructor
+
+        :param simulation: provides the virtual clock
+        :param answer_rate: probability that a customer answers
+        :param fail_rate: probability that a call fails. Calls which neither connect
+            nor fail are DISCONNECTED
+        :param median_ring_seconds: median time a call rings before its outcome is known
+        :param ring_sigma: standard deviation of the logarithm of ring times
+        :param seed: seed of the random generator, so runs are repeatable
+        """
+        if answer_rate + fail_rate > 1:
+            raise ValueError('Sum of outcome rates must not exceed 1')
+        self.simulation = simulation
+        self.answer_rate = answer_rate
+        self.fail_rate = fail_rate
+        self.mu = math.log(median_ring_seconds) # pylint: disable=invalid-name
+        self.ring_sigma = ring_sigma
+        self.random = random.Random(seed)
+        self.calls = {} # phone number -> [start time, ring seconds, outcome]
+        self.outcomes = collections.Counter() # CallState -> number of finished calls
+        self.cancelled = 0
+        self.line_seconds = 0.0 # total time lines were occupied by ringing calls
+
+    def ring(self, phone_number: str) -> float:
+        '''
+        Sets up a call and returns how many seconds it rings
+        '''
+        ring_seconds = self.random.lognormvariate(self.mu, self.ring_sigma)
+        draw = self.random.random()
+        if draw < self.answer_rate:
+            outcome = CallState.CONNECTED
+        elif draw < self.answer_rate + self.fail_rate:
+            outcome = CallState.FAILED
+        else:
+            outcome = CallState.DISCONNECTED
+        self.calls[phone_number] = [self.simulation.now, ring_seconds, outcome]
+        return ring_seconds
+
+    def dial(self, agent_id: str, phone_number: str) -> CallState: # pylint: disable=unused-argument
+        '''
+        Returns the outcome of a call set up by `ring`
+        '''
+        _, ring_seconds, outcome = self.calls.pop(phone_number)
+        self.line_seconds += ring_seconds
+        self.outcomes[outcome] += 1
+        return outcome
+
+    def cancel(self, agent_id: str, phone_number: str): # pylint: disable=unused-argument
+        '''
+        Hangs up a ringing call
+        '''
+        call = self.calls.pop(phone_number, None)
+        if call is None:
+            return
+        started, ring_seconds, _ = call
+        self.line_seconds += min(ring_seconds, self.simulation.now - started)
+        self.outcomes[CallState.FAILED] += 1
+        self.cancelled += 1
+
+class SimulatedDatabase: # pylint: disable=too-few-public-methods
+    '''
+    Source of distinct leads, endless unless a total is given
+    '''
+    def __init__(self, total_leads: int = None):
+        """Constructor
+
+        :param total_leads: number of leads available during the simulation
+        """
+        self.total_leads = total_leads
+        self.fetched = 0
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count new phone numbers
+        '''
+        if self.total_leads is not None:
+            count = min(count, self.total_leads - self.fetched)
+        first = self.fetched
+        self.fetched += count
+        return [f'+1212{number:07d}' for number in range(first, first + count)]
+
+class ShiftSimulation:
+    '''
+    Agents log in at the start of the shift and keep connecting with customers.
+    Every call lasts an exponentially distributed talk time followed by a wrap-up,
+    then the agent connects again. Agents log out once the shift is over
+    '''
+    # pylint: disable=too-many-arguments,too-many-locals
+    def __init__(self, agents: int = 100, shift_seconds: float = 8 * 3600,
+                 talk_seconds: float = 180.0, wrap_up_seconds: float = 30.0,
+                 retry_seconds: float = 5.0, ring_timeout: float = 30.0,
+                 handoff_grace_seconds: float = None, pacing_factory=None,
+                 total_leads: int = None, seed: int = 1, **service_options):
+        """Constructor
+
+        :param agents: number of agents
+        :param shift_seconds: length of the shift in virtual seconds
+        :param talk_seconds: mean length of a conversation
+        :param wrap_up_seconds: time after a call before the agent connects again
+        :param retry_seconds: time after a connect without result before the next one
+        :param ring_timeout: passed to PowerDialer
+        :param handoff_grace_seconds: if given, agents share a HandoffQueue with this grace period
+        :param pacing_factory: a callable returning pacing of an agent, FixedPacing by default
+        :param total_leads: number of leads available, endless by default
+        :param seed: seed of the random generators, so runs are repeatable
+        :param service_options: passed to SimulatedDialingService
+        """
+        self.simulation = Simulation()
+        self.shift_seconds = shift_seconds
+        self.talk_seconds = talk_seconds
+        self.wrap_up_seconds = wrap_up_seconds
+        self.retry_seconds = retry_seconds
+        self.random = random.Random(seed)
+        self.service = SimulatedDialingService(self.simulation, seed=seed, **service_options)
+        self.database = SimulatedDatabase(total_leads)
+        self.executor = SimulatedExecutor(self.simulation, self.attempt_delay)
+        self.handoff = None
+        if handoff_grace_seconds is not None:
+            self.handoff = HandoffQueue(handoff_grace_seconds, clock=self.simulation.time)
+        self.transitions = collections.Counter() # (old state, new state) -> count
+        self.entered = {} # agent_id -> time when the agent entered its current state
+        self.state_seconds = collections.Counter() # AgentState -> total time spent in it
+        self.dialers = []
+        for i in range(agents):
+            dialer = PowerDialer(
+                self.database, self.service, f'agent{i}', executor=self.executor,
+                pacing=pacing_factory() if pacing_factory is not None else None,
+                handoff=self.handoff, ring_timeout=ring_timeout, timer=self.simulation,
+                clock=self.simulation.time)
+            dialer.add_state_listener(self.on_state_changed)
+            self.dialers.append(dialer)
+
+    def attempt_delay(self, func, args: tuple) -> float:
+        '''
+        Duration of a job of the executor. `dialing_wrapper(phone_number, ...)` calls
+        block for as long as the phone rings, other jobs take no time
+        '''
+        if getattr(func, '__name__', None) != 'dialing_wrapper':
+            return 0.0
+        return self.service.ring(args[0])
+
+    # pylint: disable=unused-argument
+    def on_state_changed(self, agent, old_state: AgentState, new_state: AgentState, lead: str):
+        '''
+        State listener of every agent, collects statistics
+        '''
+        now = self.simulation.now
+        self.transitions[(old_state, new_state)] += 1
+        self.state_seconds[old_state] += now - self.entered.get(agent.agent_id, 0.0)
+        self.entered[agent.agent_id] = now
+
+    def start_connect(self, dialer: PowerDialer):
+        '''
+        Connects an available agent, or logs him out when the shift is over
+        '''
+        if self.simulation.now >= self.shift_seconds:
+            dialer.on_agent_logout()
+            return
+        dialer.start_connect(self.on_connect_done)
+
+    def on_connect_done(self, dialer: PowerDialer, error: Exception):
+        '''
+        Callback of start_connect. Busy agents talk, the others retry later
+        '''
+        if error is not None:
+            raise error
+        if dialer.agent_state == AgentState.BUSY:
+            talk = self.random.expovariate(1 / self.talk_seconds)
+            self.simulation.schedule(talk, self.hang_up, dialer)
+        else:
+            self.simulation.schedule(self.retry_seconds, self.start_connect, dialer)
+
+    def hang_up(self, dialer: PowerDialer):
+        '''
+        Ends the conversation of an agent
+        '''
+        dialer.on_call_ended()
+        self.simulation.schedule(self.wrap_up_seconds, self.start_connect, dialer)
+
+    def run(self) -> dict:
+        '''
+        Simulates the shift and returns statistics
+        '''
+        for dialer in self.dialers:
+            dialer.on_agent_login()
+            self.simulation.schedule(0, self.start_connect, dialer)
+        self.simulation.run(until=self.shift_seconds)
+        return self.stats()
+
+    def stats(self) -> dict:
+        '''
+        Returns statistics of the simulation so far
+        '''
+        now = self.simulation.now
+        state_seconds = collections.Counter(self.state_seconds)
+        for dialer in self.dialers:
+            state_seconds[dialer.agent_state] += now - self.entered.get(dialer.agent_id, 0.0)
+        agent_seconds = len(self.dialers) * now
+        connects = self.transitions[(AgentState.WAITING, AgentState.BUSY)]
+        answered = self.service.outcomes[CallState.CONNECTED]
+        dials = sum(dialer.dials for dialer in self.dialers)
+        return {
+            'virtual_seconds': now,
+            'events': self.simulation.events,
+            'agents': len(self.dialers),
+            'dials': dials,
+            'connects': connects,
+            'dials_per_connect': dials / connects if connects else None,
+            'answered': answered,
+            # customers who answered but were never connected with an agent
+            'abandoned': answered - connects,
+            'cancelled': self.service.cancelled,
+            'line_seconds': self.service.line_seconds,
+            'outcomes': {state.name: count for state, count in self.service.outcomes.items()},
+            'transitions': {f'{old.name}->{new.name}': count
+                            for (old, new), count in self.transitions.items()},
+            'utilization': state_seconds[AgentState.BUSY] / agent_seconds if agent_seconds else 0.0,
+            'mean_wait_seconds': (state_seconds[AgentState.WAITING] / connects
+                                  if connects else None),
+        }
@@ -0,0 +1,113 @@
+'''
+Contains class SkillDispatcher which routes leads to agents who have the skills
+the leads require, like a language or a product
+'''
+import collections
+import threading
+from .phone import decode, encode
+
+class SkillDispatcher:
+    '''
+    Implements `get_lead_phone_numbers_for_skills` method, which dialers with skills use
+    instead of `get_lead_phone_numbers_to_dial`. Leads are queued per combination of required
+    skills. For every distinct skill set of agents the dispatcher keeps the list of non-empty
+    queues the agents may serve, most specific first. An agent takes the head of the first
+    queue of its list, so fetching a lead takes O(1) time whatever the number of leads.
+    The lists are updated only when a queue becomes empty, or stops being empty
+    '''
+    def __init__(self):
+        # lock guarding all fields below
+        self.lock = threading.Lock()
+        self.queues = {} # required skills -> deque of encoded leads
+        self.views = {} # agent skills -> non-empty compatible queue keys, most specific first
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, phone_number: str, skills=()):
+        '''
+        Queues a lead which only agents having all the skills may be connected with
+        '''
+        self.add_many([phone_number], skills)
+
+    def add_many(self, phone_numbers, skills=()):
+        '''
+        Queues leads requiring the same skills
+        '''
+        key = frozenset(skills)
+        encoded = [encode(phone_number) for phone_number in phone_numbers]
+        if not encoded:
+            return
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue is None:
+                queue = self.queues[key] = collections.deque()
+            if not queue:
+                self.activate_locked(key)
+            queue.extend(encoded)
+            self.size += len(encoded)
+
+    def activate_locked(self, key: frozenset):
+        '''
+        Adds a queue which stopped being empty to the lists of agents who may serve it.
+        Must be called while holding the lock
+        '''
+        for agent_skills, view in self.views.items():
+            if key <= agent_skills:
+                index = 0
+                while index < len(view) and len(view[index]) >= len(key):
+                    index += 1
+                view.insert(index, key)
+
+    def deactivate_locked(self, key: frozenset):
+        '''
+        Removes a queue which became empty from the lists of agents.
+        Must be called while holding the lock
+        '''
+        for agent_skills, view in self.views.items():
+            if key <= agent_skills:
+                view.remove(key)
+
+    def view_locked(self, agent_skills: frozenset) -> list:
+        '''
+        Returns the list of non-empty queues agents with the skills may serve.
+        It's built once per distinct skill set. Must be called while holding the lock
+        '''
+        view = self.views.get(agent_skills)
+        if view is None:
+            view = sorted((key for key, queue in self.queues.items()
+                           if queue and key <= agent_skills), key=len, reverse=True)
+            self.views[agent_skills] = view
+        return view
+
+    def get_lead_phone_numbers_for_skills(self, skills, count: int) -> list:
+        '''
+        Returns up to count leads an agent with the skills may be connected with.
+        Leads requiring more of the agent's skills come first, leads requiring
+        the same skills in the order they were added
+        '''
+        leads = []
+        with self.lock:
+            view = self.view_locked(frozenset(skills))
+            while view and len(leads) < count:
+                key = view[0]
+                queue = self.queues[key]
+                leads.append(decode(queue.popleft()))
+                if not queue:
+                    self.deactivate_locked(key)
+            self.size -= len(leads)
+        return leads
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count leads which don't require any skills
+        '''
+        return self.get_lead_phone_numbers_for_skills((), count)
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Returns the next lead which doesn't require any skills, or None
+        '''
+        leads = self.get_lead_phone_numbers_to_dial(1)
+        return leads[0] if leads else None
@@ -0,0 +1,159 @@
+'''
+Do-not-call suppression. Lists are files of sorted phone numbers encoded as 64 bit integers
+in native byte order (see module phone), written by `write_dnc_file`. They are memory-mapped
+rather than loaded, so tens of millions of numbers cost no startup time and the pages are
+shared by all processes screening leads against the same files
+'''
+import array
+import bisect
+import logging
+import os
+import threading
+from .phone import MappedNumbers, encode, normalize
+
+def write_dnc_file(path: str, phone_numbers):
+    '''
+    Writes phone numbers as a DNC file. Formatting characters of the numbers are ignored.
+    Raises ValueError without touching the file if any number is not E.164, because
+    a number left out of the list would be dialed.
+    The file is replaced atomically, so a running SuppressionList never sees it half written
+    '''
+    keys = set()
+    invalid = []
+    for phone_number in phone_numbers:
+        try:
+            keys.add(encode(normalize(phone_number)))
+        except ValueError:
+            invalid.append(phone_number)
+    if invalid:
+        examples = ', '.join(f'"{phone_number}"' for phone_number in invalid[:3])
+        raise ValueError(f'{len(invalid)} numbers are not valid E.164 phone numbers: {examples}')
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as output:
+        array.array('q', sorted(keys)).tofile(output)
+    os.replace(temporary, path)
+
+class DncIndex:
+    '''
+    Read-only view of a DNC file. Lookups binary search the memory-mapped numbers
+    '''
+    def __init__(self, path: str):
+        """Constructor
+
+        :param path: file written by `write_dnc_file`
+        """
+        self.path = path
+        self.file = MappedNumbers(path, 'DNC')
+        stat = self.file.stat
+        self.signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def __len__(self):
+        return len(self.file.numbers)
+
+    def contains_key(self, key: int) -> bool:
+        '''
+        True if the encoded phone number is listed
+        '''
+        numbers = self.file.numbers
+        index = bisect.bisect_left(numbers, key)
+        return index < len(numbers) and numbers[index] == key
+
+    def __contains__(self, phone_number: str) -> bool:
+        try:
+            return self.contains_key(encode(normalize(phone_number)))
+        except ValueError:
+            return False
+
+    def close(self):
+        '''
+        Unmaps the file
+        '''
+        self.file.close()
+
+class SuppressionList:
+    '''
+    Screens leads against several DNC files, for example national and internal lists.
+    When a file is replaced, `refresh` swaps in a new index while lookups continue
+    on the old one
+    '''
+    def __init__(self, paths: list):
+        """Constructor
+
+        :param paths: DNC files written by `write_dnc_file`
+        """
+        self.logger = logging.getLogger(__name__)
+        self.paths = list(paths)
+        # replaced as a whole, so readers don't need the lock
+        self.indexes = tuple(DncIndex(path) for path in self.paths)
+        # lock serializing refreshes
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def is_suppressed(self, phone_number: str) -> bool:
+        '''
+        True if the number must not be dialed. A number which is not E.164, even after
+        formatting characters are removed, can't be checked against the lists, so it's
+        suppressed too
+        '''
+        try:
+            key = encode(normalize(phone_number))
+        except ValueError:
+            return True
+        return any(index.contains_key(key) for index in self.indexes)
+
+    def screen(self, phone_numbers: list) -> list:
+        '''
+        Returns the numbers which may be dialed, in the original order
+        '''
+        return [number for number in phone_numbers if not self.is_suppressed(number)]
+
+    def refresh(self) -> bool:
+        '''
+        Reopens files which changed since they were loaded. Returns True if any did.
+        A file which can't be loaded is logged and the previous index stays in use
+        '''
+        with self.lock:
+            indexes = list(self.indexes)
+            changed = []
+            for i, index in enumerate(indexes):
+                try:
+                    stat = os.stat(index.path)
+                    if (stat.st_mtime_ns, stat.st_size, stat.st_ino) == index.signature:
+                        continue
+                    indexes[i] = DncIndex(index.path)
+                    changed.append(index)
+                except (OSError, ValueError) as ex:
+                    msg = f'Reloading DNC file "{index.path}" failed. Error: "{ex}"'
+                    self.logger.error(msg)
+            if not changed:
+                return False
+            self.indexes = tuple(indexes)
+        # lookups which already took the old indexes keep them alive until they finish,
+        # the maps are released once the old indexes are garbage collected
+        return True
+
+    def watch(self, interval: float):
+        '''
+        Body of the watcher thread
+        '''
+        while not self.stopping.wait(interval):
+            self.refresh()
+
+    def start(self, interval: float = 5.0):
+        '''
+        Starts a daemon thread checking the files for changes every interval seconds
+        '''
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.watch, args=(interval,),
+                                       name='suppression', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops the watcher thread
+        '''
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,98 @@
+'''
+Contains class TimeoutScheduler which runs delayed callbacks of all dialers
+on a single thread
+'''
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+class Timeout: # pylint: disable=too-few-public-methods
+    '''
+    Handle of a scheduled callback
+    '''
+    __slots__ = ('due', 'func', 'args', 'cancelled')
+
+    def __init__(self, due: float, func, args: tuple):
+        self.due = due
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        '''
+        Prevents the callback from running. Cancelling a callback which already ran is a no-op
+        '''
+        self.cancelled = True
+
+class TimeoutScheduler:
+    '''
+    Keeps scheduled callbacks in a heap ordered by due time.
+    A single daemon thread started on first use runs them when they become due.
+    Callbacks should be short, long running work belongs to an executor
+    '''
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.heap = [] # (due time, sequence number, Timeout)
+        self.sequence = itertools.count()
+        # condition guarding the heap and the thread
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def schedule(self, delay: float, func, *args) -> Timeout:
+        '''
+        Runs func(*args) after delay seconds. Returns a handle which can cancel it
+        '''
+        timeout = Timeout(time.monotonic() + delay, func, args)
+        with self.condition:
+            heapq.heappush(self.heap, (timeout.due, next(self.sequence), timeout))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.loop, name='timeouts', daemon=True)
+                self.thread.start()
+            elif self.heap[0][2] is timeout:
+                # the new callback is due before everything else
+                self.condition.notify()
+        return timeout
+
+    def pop_due(self) -> Timeout:
+        '''
+        Waits until the earliest callback is due and removes it from the heap
+        '''
+        with self.condition:
+            while True:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                delay = self.heap[0][0] - time.monotonic()
+                if delay <= 0:
+                    return heapq.heappop(self.heap)[2]
+                self.condition.wait(delay)
+
+    def loop(self):
+        '''
+        Body of the scheduler thread
+        '''
+        while True:
+            timeout = self.pop_due()
+            if timeout.cancelled:
+                continue
+            try:
+                timeout.func(*timeout.args)
+            except Exception as ex: # pylint: disable=broad-except
+                msg = f'Timeout callback failed. Error: "{ex}"'
+                self.logger.error(msg)
+
+# scheduler shared by all dialers which weren't given their own scheduler
+_DEFAULT_SCHEDULER = None
+_DEFAULT_SCHEDULER_LOCK = threading.Lock()
+
+def get_default_scheduler() -> TimeoutScheduler:
+    '''
+    Returns the process wide scheduler, creating it on first use
+    '''
+    global _DEFAULT_SCHEDULER # pylint: disable=global-statement
+    with _DEFAULT_SCHEDULER_LOCK:
+        if _DEFAULT_SCHEDULER is None:
+            _DEFAULT_SCHEDULER = TimeoutScheduler()
+        return _DEFAULT_SCHEDULER
@@ -0,0 +1,358 @@
+'''
+Contains classes recording dial attempts and lead fetches of production traffic
+to a compact binary trace file, and classes replaying a trace into the dialers,
+so performance problems can be reproduced offline against real behavior.
+A trace starts with MAGIC, followed by fixed-size little-endian records (see RECORD).
+Phone numbers are encoded as 64 bit integers (see module phone). Numbers which aren't
+valid E.164 numbers are stored as text once, the first time they're seen, and referred to
+by their negated index, counted from one, afterwards. Leads of a fetch follow its record.
+An error message is stored once too, and referred to by its index afterwards
+'''
+import collections
+import logging
+import struct
+import threading
+import time
+from .call_state import CallState
+from .lead_buffer import fetch_leads
+from .phone import decode, encode
+
+MAGIC = b'DTRACE2\n'
+# kind, call state or message index, seconds since the trace started, latency, number or count
+RECORD = struct.Struct('<BIdfq')
+DIAL = 1 # a dial attempt which returned a call state
+ERROR = 2 # a dial attempt which raised an exception
+FETCH = 3 # a lead fetch, followed by the leads
+MESSAGE = 4 # an error message, followed by its utf-8 bytes
+NUMBER = 5 # a phone number which can't be encoded, followed by its utf-8 bytes
+LEAD = struct.Struct('<q')
+BUFFER_SIZE = 64 * 1024 # bytes of records kept in memory before they're appended to the file
+
+class ReplayedError(Exception):
+    '''
+    An error of a dial attempt replayed from a trace, carrying the recorded message
+    '''
+
+def read_trace(path: str):
+    '''
+    Yields records of a trace file as dictionaries
+    '''
+    messages = []
+    numbers = []
+    def number(value: int) -> str:
+        return decode(value) if value > 0 else numbers[-value - 1]
+    with open(path, 'rb') as trace_file:
+        if trace_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'"{path}" is not a dial trace file')
+        while True:
+            data = trace_file.read(RECORD.size)
+            if len(data) < RECORD.size:
+                return
+            kind, code, at, latency, value = RECORD.unpack(data)
+            if kind == MESSAGE:
+                messages.append(trace_file.read(value).decode('utf-8'))
+            elif kind == NUMBER:
+                numbers.append(trace_file.read(value).decode('utf-8'))
+            elif kind == FETCH:
+                leads = struct.unpack(f'<{value}q', trace_file.read(value * LEAD.size))
+                yield {'type': 'fetch', 'time': at, 'latency': latency,
+                       'leads': [number(lead) for lead in leads]}
+            else:
+                yield {'type': 'dial', 'time': at, 'latency': latency, 'lead': number(value),
+                       'state': CallState(code) if kind == DIAL else None,
+                       'error': messages[code] if kind == ERROR else None}
+
+# pylint: disable=too-many-instance-attributes
+class TraceWriter:
+    '''
+    Appends records to a trace file. Dialing threads share one writer.
+    Records are buffered in memory and reach the file when the buffer fills up,
+    or the writer is closed. Writing never raises, a failure is logged and counted
+    in `failures`, so recording can't change what the dialers get
+    '''
+    def __init__(self, path: str, clock=None):
+        """Constructor
+
+        :param path: trace file, it's overwritten
+        :param clock: a callable returning current time in seconds, time.monotonic by default.
+            Latencies and times of records are measured with it
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.clock = clock if clock is not None else time.monotonic
+        self.started = self.clock()
+        # lock guarding the buffer and the fields below
+        self.lock = threading.Lock()
+        self.buffer = bytearray() # records not appended to the file yet, None once closed
+        self.messages = {} # error message -> index
+        self.numbers = {} # phone number which can't be encoded -> its negated index
+        self.records = 0
+        self.failures = 0 # records which couldn't be written
+        with open(path, 'wb') as output:
+            output.write(MAGIC)
+
+    def write_dial(self, phone_number: str, latency: float, state: CallState = None,
+                   error: Exception = None):
+        '''
+        Records a dial attempt which either returned state or raised error
+        '''
+        at = self.clock() - self.started
+        try:
+            with self.lock:
+                number = self.number_locked(phone_number)
+                if error is None:
+                    self.write_locked(RECORD.pack(DIAL, state.value, at, latency, number))
+                else:
+                    index = self.message_locked(str(error))
+                    self.write_locked(RECORD.pack(ERROR, index, at, latency, number))
+                self.records += 1
+        except Exception as ex: # pylint: disable=broad-except
+            self.write_failed(ex)
+
+    def write_failed(self, error: Exception):
+        '''
+        Logs and counts a record which couldn't be written
+        '''
+        with self.lock:
+            self.failures += 1
+        msg = f'Writing trace "{self.path}" failed. Error: "{error}"'
+        self.logger.error(msg)
+
+    def write_locked(self, data: bytes):
+        '''
+        Buffers data, appending the buffer to the file when it's full.
+        Must be called while holding the lock
+        '''
+        if self.buffer is None:
+            raise ValueError('write to closed file')
+        self.buffer += data
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush_locked()
+
+    def flush_locked(self):
+        '''
+        Appends the buffer to the file. Must be called while holding the lock
+        '''
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        with open(self.path, 'ab') as output:
+            output.write(data)
+
+    def number_locked(self, phone_number: str) -> int:
+        '''
+        Returns the encoded phone number, or the negated index of a number which can't
+        be encoded, writing it when it's new. Must be called while holding the lock
+        '''
+        try:
+            return encode(phone_number)
+        except ValueError:
+            pass
+        number = self.numbers.get(phone_number)
+        if number is None:
+            number = self.numbers[phone_number] = -len(self.numbers) - 1
+            data = phone_number.encode('utf-8')
+            self.write_locked(RECORD.pack(NUMBER, 0, 0, 0, len(data)))
+            self.write_locked(data)
+        return number
+
+    def message_locked(self, message: str) -> int:
+        '''
+        Returns index of an error message, writing it when it's new.
+        Must be called while holding the lock
+        '''
+        index = self.messages.get(message)
+        if index is None:
+            index = self.messages[message] = len(self.messages)
+            data = message.encode('utf-8')
+            self.write_locked(RECORD.pack(MESSAGE, index, 0, 0, len(data)))
+            self.write_locked(data)
+        return index
+
+    def write_fetch(self, leads: list, latency: float):
+        '''
+        Records a lead fetch which returned leads
+        '''
+        at = self.clock() - self.started
+        try:
+            with self.lock:
+                numbers = [self.number_locked(lead) for lead in leads]
+                self.write_locked(RECORD.pack(FETCH, 0, at, latency, len(numbers)))
+                self.write_locked(struct.pack(f'<{len(numbers)}q', *numbers))
+                self.records += 1
+        except Exception as ex: # pylint: disable=broad-except
+            self.write_failed(ex)
+
+    def close(self):
+        '''
+        Writes buffered records and closes the file
+        '''
+        try:
+            with self.lock:
+                if self.buffer is not None:
+                    try:
+                        self.flush_locked()
+                    finally:
+                        self.buffer = None
+        except Exception as ex: # pylint: disable=broad-except
+            self.write_failed(ex)
+
+class RecordingDialingService:
+    '''
+    Implements `dial` method on top of a dialing service and records every attempt,
+    with its latency and either its call state or its error. Other methods, like `cancel`,
+    are passed to the service. `dial_many` is hidden, so the dialers dial numbers one by one
+    and every attempt gets its own latency
+    '''
+    def __init__(self, dialing_service: object, writer: TraceWriter):
+        """Constructor
+
+        :param dialing_service: an object implementing `dial` method
+        :param writer: writer of the trace file
+        """
+        self.dialing_service = dialing_service
+        self.writer = writer
+
+    def __getattr__(self, name):
+        if name == 'dial_many':
+            raise AttributeError(name)
+        return getattr(self.dialing_service, name)
+
+    def dial(self, agent_id: str, number: str) -> CallState:
+        '''
+        Dials the number with the service and records the attempt.
+        Errors of the service are recorded and raised again
+        '''
+        started = self.writer.clock()
+        try:
+            state = self.dialing_service.dial(agent_id, number)
+        except Exception as ex:
+            self.writer.write_dial(number, self.writer.clock() - started, error=ex)
+            raise
+        self.writer.write_dial(number, self.writer.clock() - started, state)
+        return state
+
+class RecordingLeadSource:
+    '''
+    Implements `get_lead_phone_number_to_dial`, `get_lead_phone_numbers_to_dial` and
+    `get_lead_phone_numbers_for_skills` methods on top of a database and records every fetch
+    '''
+    def __init__(self, database: object, writer: TraceWriter):
+        """Constructor
+
+        :param database: an object implementing `get_lead_phone_number_to_dial` method
+        :param writer: writer of the trace file
+        """
+        self.database = database
+        self.writer = writer
+
+    def get_lead_phone_numbers_for_skills(self, skills, count: int) -> list:
+        '''
+        Fetches up to count leads an agent with the skills may take and records the fetch
+        '''
+        started = self.writer.clock()
+        leads = fetch_leads(self.database, count, skills)
+        self.writer.write_fetch(leads, self.writer.clock() - started)
+        return leads
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Fetches up to count leads and records the fetch
+        '''
+        return self.get_lead_phone_numbers_for_skills(None, count)
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Fetches the next lead and records the fetch. Returns None when there are no leads
+        '''
+        leads = self.get_lead_phone_numbers_to_dial(1)
+        return leads[0] if leads else None
+
+class ReplayDialingService: # pylint: disable=too-few-public-methods
+    '''
+    Implements `dial` method which answers with the outcomes recorded in a trace.
+    Every attempt of a number gets the outcome of the next recorded attempt of that number,
+    after waiting its recorded latency divided by speed.
+    Numbers which ran out of recorded attempts fail right away and are counted in `misses`
+    '''
+    def __init__(self, path: str, speed: float = 1.0, sleep=None):
+        """Constructor
+
+        :param path: trace file written by TraceWriter
+        :param speed: how many times faster than recorded the calls resolve.
+            With None calls resolve without waiting
+        :param sleep: a callable waiting for the given seconds, time.sleep by default
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError('speed must be a positive number')
+        self.speed = speed
+        self.sleep = sleep if sleep is not None else time.sleep
+        # lock guarding all fields below
+        self.lock = threading.Lock()
+        self.attempts = collections.defaultdict(collections.deque) # number -> recorded attempts
+        self.misses = 0
+        for record in read_trace(path):
+            if record['type'] == 'dial':
+                self.attempts[record['lead']].append(record)
+
+    def dial(self, agent_id: str, number: str) -> CallState: # pylint: disable=unused-argument
+        '''
+        Waits for the scaled latency of the next recorded attempt of the number,
+        then returns its call state or raises its error
+        '''
+        with self.lock:
+            attempts = self.attempts.get(number)
+            record = attempts.popleft() if attempts else None
+            if record is None:
+                self.misses += 1
+        if record is None:
+            return CallState.FAILED
+        if self.speed is not None:
+            self.sleep(record['latency'] / self.speed)
+        if record['error'] is not None:
+            raise ReplayedError(record['error'])
+        return record['state']
+
+class ReplayLeadSource:
+    '''
+    Implements `get_lead_phone_number_to_dial` and `get_lead_phone_numbers_to_dial` methods
+    handing out the leads recorded in a trace in their order. Every fetch waits
+    the latency of the next recorded fetch divided by speed
+    '''
+    def __init__(self, path: str, speed: float = 1.0, sleep=None):
+        """Constructor
+
+        :param path: trace file written by TraceWriter
+        :param speed: how many times faster than recorded the fetches return.
+            With None fetches return without waiting
+        :param sleep: a callable waiting for the given seconds, time.sleep by default
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError('speed must be a positive number')
+        self.speed = speed
+        self.sleep = sleep if sleep is not None else time.sleep
+        # lock guarding both queues
+        self.lock = threading.Lock()
+        self.leads = collections.deque()
+        self.latencies = collections.deque() # of recorded fetches
+        for record in read_trace(path):
+            if record['type'] == 'fetch':
+                self.leads.extend(record['leads'])
+                self.latencies.append(record['latency'])
+
+    def get_lead_phone_numbers_to_dial(self, count: int) -> list:
+        '''
+        Returns up to count of the recorded leads
+        '''
+        with self.lock:
+            latency = self.latencies.popleft() if self.latencies else 0.0
+            leads = [self.leads.popleft() for _ in range(min(count, len(self.leads)))]
+        if self.speed is not None and latency > 0:
+            self.sleep(latency / self.speed)
+        return leads
+
+    def get_lead_phone_number_to_dial(self) -> str:
+        '''
+        Returns the next recorded lead, or None when there are no more leads
+        '''
+        leads = self.get_lead_phone_numbers_to_dial(1)
+        return leads[0] if leads else None
@@ -0,0 +1,119 @@
+'''
+Mocks coroutine based database and dialing service interfaces
+'''
+import asyncio
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.skill_routing import SkillDispatcher
+from .database_stub import BulkDatabaseStub, DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+
+def run(coroutine, drain: bool = False):
+    '''
+    helper utility
+    runs a coroutine in a fresh event loop, with drain waits for all tasks it started too
+    '''
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(coroutine)
+        # asyncio.all_tasks was added in Python 3.7, Task.all_tasks removed in 3.9
+        all_tasks = getattr(asyncio, 'all_tasks', None)
+        if all_tasks is None:
+            all_tasks = asyncio.Task.all_tasks # pylint: disable=no-member
+        pending = {task for task in all_tasks(loop) if not task.done()}
+        if drain and pending:
+            loop.run_until_complete(asyncio.wait(pending))
+        return result
+    finally:
+        loop.close()
+
+def create_dialer(ctx: dict, **options) -> AsyncPowerDialer:
+    '''
+    helper utility
+    creates a logged in dialer backed by stubs, options are passed to the dialer
+    '''
+    dialer = AsyncPowerDialer(AsyncDatabaseStub(ctx), AsyncDialingServiceStub(ctx), 'agent1',
+                              **options)
+    dialer.on_agent_login()
+    return dialer
+
+# pylint: disable=too-few-public-methods
+class AsyncStub:
+    '''
+    Wraps a synchronous stub, passing attributes it doesn't override to the stub
+    '''
+    def __init__(self, stub: object):
+        '''Constructor
+
+        :stub: The wrapped synchronous stub.
+        '''
+        self.stub = stub
+
+    def __getattr__(self, name):
+        return getattr(self.stub, name)
+
+class AsyncDatabaseStub(AsyncStub):
+    '''
+    Implements `get_lead_phone_number_to_dial` coroutine
+    '''
+    def __init__(self, ctx: dict):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys.
+        '''
+        super().__init__(DatabaseStub(ctx))
+
+    async def get_lead_phone_number_to_dial(self)->str:
+        '''
+        Same as DatabaseStub.get_lead_phone_number_to_dial, but awaitable
+        '''
+        return self.stub.get_lead_phone_number_to_dial()
+
+class AsyncDialingServiceStub(AsyncStub):
+    '''
+    Implements `dial` coroutine
+    '''
+    def __init__(self, ctx: dict):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys.
+        '''
+        super().__init__(DialingServiceStub(ctx))
+
+    async def dial(self, agent_id: str, number: str): # pylint: disable=unused-argument
+        '''
+        Same as DialingServiceStub.dial, but waits without blocking the event loop
+        '''
+        scenario = self.stub.ctx[number]
+        if 'waitMs' in scenario:
+            await asyncio.sleep(scenario['waitMs'] / 1000)
+        return self.stub.outcome(scenario)
+
+class AsyncBulkDatabaseStub(AsyncStub):
+    '''
+    Implements `get_lead_phone_numbers_to_dial` coroutine
+    '''
+    def __init__(self, ctx: dict):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys.
+        '''
+        super().__init__(BulkDatabaseStub(ctx))
+
+    async def get_lead_phone_numbers_to_dial(self, count: int)->list:
+        '''
+        Same as BulkDatabaseStub.get_lead_phone_numbers_to_dial, but awaitable
+        '''
+        return self.stub.get_lead_phone_numbers_to_dial(count)
+
+class AsyncSkillDispatcher(AsyncStub):
+    '''
+    Implements `get_lead_phone_numbers_for_skills` coroutine
+    '''
+    def __init__(self):
+        super().__init__(SkillDispatcher())
+
+    async def get_lead_phone_numbers_for_skills(self, skills, count: int)->list:
+        '''
+        Same as SkillDispatcher.get_lead_phone_numbers_for_skills, but awaitable
+        '''
+        return self.stub.get_lead_phone_numbers_for_skills(skills, count)
@@ -22,3 +22,25 @@ class DatabaseStub:
             return None
         number = self.numbers.pop(0)
         return number
+
+class BulkDatabaseStub(DatabaseStub):
+    '''
+    Implements `get_lead_phone_numbers_to_dial` bulk method and counts round trips
+    '''
+    def __init__(self, ctx: dict):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys.
+        '''
+        super().__init__(ctx)
+        self.round_trips = 0
+
+    def get_lead_phone_numbers_to_dial(self, count: int)->list:
+        '''
+        Removes up to count elements from the beginning of the array of numbers
+        and returns them
+        '''
+        self.round_trips += 1
+        numbers = self.numbers[:count]
+        del self.numbers[:count]
+        return numbers
@@ -1,6 +1,7 @@
 '''
 Mocks dialing service interface
 '''
+import threading
 import time
 from ..dialer.call_state import CallState
 
@@ -25,9 +26,105 @@ class DialingServiceStub:
         scenario = self.ctx[number]
         if 'waitMs' in scenario:
             time.sleep(scenario['waitMs'] / 1000)
+        return self.outcome(scenario)
+
+    @staticmethod
+    def outcome(scenario: dict)->CallState:
+        '''
+        Either returns a value or throws an exception, as configured in scenario
+        '''
         if 'state' in scenario: # pylint: disable=no-else-return
             return scenario['state']
         elif 'exception' in scenario:
             raise scenario['exception']
         raise Exception('Invalid scenario. A scenario must specify either '
                         '"state", or "exception" field')
+
+class RecordingDialingServiceStub(DialingServiceStub):
+    '''
+    Records dialed numbers
+    '''
+    def __init__(self, ctx: dict):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys and result scenarios as values
+        '''
+        super().__init__(ctx)
+        self.dialed = []
+
+    def dial(self, agent_id: str, number: str)->CallState:
+        '''
+        Same as DialingServiceStub.dial, but records the number
+        '''
+        self.dialed.append(number)
+        return super().dial(agent_id, number)
+
+class CancellableDialingServiceStub(DialingServiceStub):
+    '''
+    Implements `dial` and `cancel` methods. A cancelled attempt stops waiting
+    and returns DISCONNECTED
+    '''
+    def __init__(self, ctx: dict):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys and result scenarios as values
+        '''
+        super().__init__(ctx)
+        self.events = {number: threading.Event() for number in ctx}
+        self.cancelled = []
+
+    def dial(self, agent_id: str, number: str)->CallState:
+        '''
+        Same as DialingServiceStub.dial, but waiting can be interrupted by `cancel`
+        '''
+        scenario = self.ctx[number]
+        if self.events[number].wait(scenario.get('waitMs', 0) / 1000):
+            return CallState.DISCONNECTED
+        return self.outcome(scenario)
+
+    def cancel(self, agent_id: str, number: str): # pylint: disable=unused-argument
+        '''
+        Interrupts dialing of the number
+        '''
+        if 'cancelException' in self.ctx[number]:
+            raise self.ctx[number]['cancelException']
+        self.cancelled.append(number)
+        self.events[number].set()
+
+class BulkDialingServiceStub(DialingServiceStub):
+    '''
+    Implements `dial` and `dial_many` methods and counts round trips of `dial_many`.
+    Calls of a bulk request resolve in the order of their waitMs.
+    A scenario with an exception breaks the stream of results
+    '''
+    def __init__(self, ctx: dict):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys and result scenarios as values
+        '''
+        super().__init__(ctx)
+        self.round_trips = 0
+        self.requests = [] # (agent_id, numbers) of every `dial_many` call
+
+    def dial_many(self, agent_id, numbers: list):
+        '''
+        Yields (index, CallState) pairs as calls of the request resolve
+        '''
+        self.round_trips += 1
+        self.requests.append((agent_id, list(numbers)))
+        return self.resolve(numbers)
+
+    def resolve(self, numbers: list):
+        '''
+        Waits for the calls of a request in the order they resolve
+        '''
+        waited = 0
+        order = sorted(range(len(numbers)),
+                       key=lambda index: self.ctx[numbers[index]].get('waitMs', 0))
+        for index in order:
+            scenario = self.ctx[numbers[index]]
+            wait_ms = scenario.get('waitMs', 0)
+            if wait_ms > waited:
+                time.sleep((wait_ms - waited) / 1000)
+                waited = wait_ms
+            yield index, self.outcome(scenario)
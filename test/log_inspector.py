@@ -12,7 +12,9 @@ class CaptureFilter(logging.Filter):
     This filter captures all messages in a global variable
     '''
     def filter(self, record):
-        BUFFER.append(record.msg)
+        # event loop internals are not interesting for unit tests
+        if record.name != 'asyncio':
+            BUFFER.append(record.msg)
         return True
 
 class LogInspector:
@@ -24,9 +26,12 @@ class LogInspector:
     @staticmethod
     def setup_logging():
         '''
-        Adds a filter to capture messages being logged
+        Adds a filter to capture messages being logged.
+        Repeated calls from several test modules are ignored
         '''
         root_logger = logging.getLogger()
+        if any(isinstance(f, CaptureFilter) for h in root_logger.handlers for f in h.filters):
+            return
         root_logger.setLevel(logging.DEBUG)
         # create a dummy handler, because filter needs to be attached to a handler
         handler = MemoryHandler(10000)
@@ -0,0 +1,23 @@
+'''
+Helper utilities to wait for background threads and processes in unit tests
+'''
+import time
+from concurrent.futures import wait
+
+def wait_until(predicate, timeout: float = 5.0) -> bool:
+    '''
+    Polls predicate until it becomes true or timeout seconds pass.
+    Returns the last result of predicate
+    '''
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return predicate()
+
+def wait_for_all_attempts(*dialers):
+    '''
+    helper utility
+    waits until all dial attempts of the dialers terminate
+    '''
+    for dialer in dialers:
+        wait(dialer.pending_futures())
@@ -0,0 +1,15 @@
+'''
+A helper utility to give unit tests a scratch directory
+'''
+import shutil
+import tempfile
+import unittest
+
+def create_temp_dir(test: unittest.TestCase) -> str:
+    '''
+    helper utility
+    creates a temporary directory which is removed after the test
+    '''
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    return directory
@@ -0,0 +1,163 @@
+'''
+Tests for the table-driven state machine of Agent
+'''
+import threading
+import unittest
+from ..dialer.agent import Agent
+from ..dialer.agent_state import TRANSITIONS, AgentEvent, AgentState
+from ..dialer.agent_table import AgentTable
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+# events driving a new agent to each state
+EVENTS_TO = {
+    AgentState.UNAVAILABLE: [],
+    AgentState.AVAILABLE: [AgentEvent.LOGIN],
+    AgentState.WAITING: [AgentEvent.LOGIN, AgentEvent.CONNECT],
+    AgentState.BUSY: [AgentEvent.LOGIN, AgentEvent.CONNECT, AgentEvent.CALL_STARTED],
+    AgentState.BACKOFF: [AgentEvent.LOGIN, AgentEvent.CONNECT, AgentEvent.BACK_OFF],
+}
+
+def agent_in(state: AgentState) -> Agent:
+    '''
+    helper utility
+    returns an agent driven to the given state by events
+    '''
+    agent = Agent('agent1')
+    for event in EVENTS_TO[state]:
+        agent.transition(event, '+12123334444')
+    return agent
+
+class TestAgent(unittest.TestCase):
+    '''
+    Tests for Agent class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_transition_table(self):
+        '''
+        Testing that Agent and AgentTable follow the table for every event and state
+        '''
+        for event, targets in TRANSITIONS.items():
+            for state in AgentState:
+                agent = agent_in(state)
+                table = AgentTable()
+                row = table.add('agent1', state)
+                if state in targets:
+                    agent.transition(event, '+12123334444')
+                    table.transition(row, event, '+12123334444')
+                    self.assertEqual(targets[state], agent.agent_state, (event, state))
+                    self.assertEqual(targets[state], table.state(row), (event, state))
+                else:
+                    with self.assertRaises(Exception):
+                        agent.transition(event)
+                    with self.assertRaises(Exception):
+                        table.transition(row, event)
+                    self.assertEqual(state, agent.agent_state)
+                    self.assertEqual(state, table.state(row))
+
+    def test_error_lists_allowed_states(self):
+        '''
+        Testing error messages of events not allowed in the current state
+        '''
+        agent = Agent('agent1')
+        with self.assertRaises(Exception):
+            agent.transition(AgentEvent.CONNECT)
+        with self.assertRaises(Exception):
+            agent.on_call_ended()
+        self.assertListEqual([
+            'Agent "agent1" must be in AVAILABLE state. Current state is "AgentState.UNAVAILABLE"',
+            'Agent "agent1" must be in BUSY state. Current state is "AgentState.UNAVAILABLE"',
+        ], LogInspector.get_messages())
+
+    def test_logout_while_connecting(self):
+        '''
+        Testing that an agent who logged out while connecting
+        becomes unavailable if no customer was found
+        '''
+        agent = agent_in(AgentState.AVAILABLE)
+        agent.transition(AgentEvent.CONNECT)
+        agent.on_agent_logout()
+        self.assertEqual(AgentState.WAITING, agent.agent_state)
+        self.assertTrue(agent.is_logging_out)
+        agent.give_up_connect()
+        self.assertEqual(AgentState.UNAVAILABLE, agent.agent_state)
+        self.assertFalse(agent.is_logging_out)
+        agent.give_up_connect() # connecting is already over
+        self.assertEqual(AgentState.UNAVAILABLE, agent.agent_state)
+
+    def test_listeners(self):
+        '''
+        Testing that listeners are notified about changes only and may call back into the agent
+        '''
+        agent = agent_in(AgentState.WAITING)
+        changes = []
+        def listener(changed, old_state, new_state, lead):
+            changes.append((old_state, new_state, lead))
+            if new_state == AgentState.BUSY:
+                changed.on_call_ended()
+        agent.add_state_listener(listener)
+        agent.on_agent_logout() # no change, only marked as logging out
+        agent.on_call_started('+12123334444')
+        self.assertListEqual([(AgentState.WAITING, AgentState.BUSY, '+12123334444'),
+                              (AgentState.BUSY, AgentState.UNAVAILABLE, '+12123334444')],
+                             changes)
+        self.assertEqual('', agent.current_lead)
+
+    def test_concurrent_connects(self):
+        '''
+        Testing that only one of concurrent connects of the same agent succeeds
+        '''
+        agent = agent_in(AgentState.AVAILABLE)
+        threads = 8
+        barrier = threading.Barrier(threads)
+        successes = []
+        def connect():
+            for _ in range(100):
+                barrier.wait()
+                try:
+                    agent.transition(AgentEvent.CONNECT)
+                    successes.append(1)
+                except Exception: # pylint: disable=broad-except
+                    pass
+                if barrier.wait() == 0:
+                    agent.transition(AgentEvent.GIVE_UP)
+        workers = [threading.Thread(target=connect) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(100, len(successes))
+
+    def test_concurrent_callbacks(self):
+        '''
+        Testing that callbacks of calls racing with logouts leave the agent logged out
+        '''
+        agent = agent_in(AgentState.AVAILABLE)
+        changes = []
+        agent.add_state_listener(lambda _, old_state, new_state, lead: changes.append(new_state))
+        def calls():
+            for i in range(2000):
+                try:
+                    agent.transition(AgentEvent.CONNECT)
+                except Exception: # pylint: disable=broad-except
+                    return # logged out
+                agent.on_call_started(f'+1212{i:07d}')
+                agent.on_call_ended()
+        caller = threading.Thread(target=calls)
+        caller.start()
+        for _ in range(200):
+            agent.on_agent_logout()
+        caller.join()
+        agent.on_agent_logout()
+        self.assertEqual(AgentState.UNAVAILABLE, agent.agent_state)
+        self.assertFalse(agent.is_logging_out)
+        self.assertEqual('', agent.current_lead)
+        # listeners run outside the lock, so notifications of the two threads may interleave
+        self.assertIn(AgentState.UNAVAILABLE, changes)
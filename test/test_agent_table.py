@@ -0,0 +1,83 @@
+'''
+Tests for agent_table module
+'''
+import unittest
+from ..dialer.agent_state import AgentEvent, AgentState
+from ..dialer.agent_table import AgentTable
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestAgentTable(unittest.TestCase):
+    '''
+    Tests for AgentTable class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_call_lifecycle(self):
+        '''
+        Testing transitions of a call, and logout during the call
+        '''
+        table = AgentTable()
+        row = table.add('agent1')
+        table.transition(row, AgentEvent.LOGIN)
+        table.transition(row, AgentEvent.CONNECT)
+        table.transition(row, AgentEvent.CALL_STARTED, '+12123334444')
+        self.assertEqual(AgentState.BUSY, table.state(row))
+        self.assertEqual('+12123334444', table.current_lead(row))
+        table.transition(row, AgentEvent.LOGOUT)
+        self.assertTrue(table.is_logging_out(row))
+        self.assertEqual('+12123334444', table.transition(row, AgentEvent.CALL_ENDED))
+        self.assertEqual(AgentState.UNAVAILABLE, table.state(row))
+        self.assertEqual('', table.current_lead(row))
+        self.assertFalse(table.is_logging_out(row))
+        self.assertListEqual([], LogInspector.get_messages())
+
+    def test_invalid_transition(self):
+        '''
+        Testing that an invalid transition raises and is logged like in Agent
+        '''
+        table = AgentTable()
+        row = table.add('agent1')
+        with self.assertRaises(Exception):
+            table.transition(row, AgentEvent.CALL_ENDED)
+        self.assertEqual(AgentState.UNAVAILABLE, table.state(row))
+        self.assertListEqual([
+            'Agent "agent1" must be in BUSY state. Current state is "AgentState.UNAVAILABLE"'
+        ], LogInspector.get_messages())
+
+    def test_rows_are_reused(self):
+        '''
+        Testing that agents can't be added twice, and rows of removed agents are reused
+        '''
+        table = AgentTable()
+        table.add('agent1')
+        with self.assertRaises(ValueError):
+            table.add('agent1')
+        row = table.add('agent2', AgentState.BUSY)
+        table.remove('agent2')
+        self.assertEqual(1, len(table))
+        self.assertEqual(0, table.count(AgentState.BUSY))
+        self.assertListEqual([], list(table.rows_in_state(AgentState.BUSY)))
+        self.assertEqual(row, table.add('agent3'))
+        self.assertEqual(2, len(table.states))
+
+    def test_counts(self):
+        '''
+        Testing per state counters and scans
+        '''
+        table = AgentTable()
+        for i in range(5):
+            table.add(f'agent{i}', AgentState.AVAILABLE)
+        table.transition(table.rows['agent3'], AgentEvent.CONNECT)
+        table.set_state(table.rows['agent1'], AgentState.WAITING)
+        self.assertEqual(5, len(table))
+        self.assertEqual(3, table.count(AgentState.AVAILABLE))
+        self.assertEqual(2, table.count(AgentState.WAITING))
+        self.assertEqual(0, table.count(AgentState.UNAVAILABLE))
+        self.assertListEqual([1, 3], list(table.rows_in_state(AgentState.WAITING)))
@@ -0,0 +1,165 @@
+'''
+Tests for async_power_dialer module
+'''
+import asyncio
+import unittest
+from ..dialer.agent_state import AgentState
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from .async_stubs import (AsyncBulkDatabaseStub, AsyncDatabaseStub, AsyncDialingServiceStub,
+                          create_dialer, run)
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestAsyncPowerDialer(unittest.TestCase):
+    '''
+    Tests for AsyncPowerDialer class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_connect_agent_should_login(self):
+        '''
+        Testing that attempt to connect without a login
+        results in an exception and a log message
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED}
+        }
+        dialer = AsyncPowerDialer(AsyncDatabaseStub(ctx), AsyncDialingServiceStub(ctx), 'agent1')
+        with self.assertRaises(Exception) as cm:
+            run(dialer.connect(), drain=True)
+        self.assertIn('Agent "agent1" must be in AVAILABLE', str(cm.exception))
+        logs = LogInspector.get_messages()
+        self.assertListEqual(logs, ['Agent "agent1" must be in AVAILABLE state. '
+                                    'Current state is "AgentState.UNAVAILABLE"'])
+
+    def test_connect_without_leads(self):
+        '''
+        Testing that if database has no leads, then agent's status doesn't change
+        '''
+        dialer = create_dialer({})
+        run(dialer.connect(), drain=True)
+        self.assertEqual(dialer.agent_state, AgentState.AVAILABLE)
+        self.assertEqual(dialer.current_lead, '')
+
+    def test_connect_two_leads_successfull(self):
+        '''
+        Testing that when dialing 2 numbers. We will use the one we connected to sooner
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 10},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 5}
+        }
+        dialer = create_dialer(ctx)
+        run(dialer.connect(), drain=True)
+        self.assertEqual(dialer.agent_state, AgentState.BUSY)
+        self.assertEqual(dialer.current_lead, '+12123334449')
+        self.assertEqual(2, len(dialer.tasks))
+
+    def test_connect_two_leads_fail_should_try_third(self):
+        '''
+        Testing that when both attempts of a batch fail a new batch is dialed
+        '''
+        ctx = {
+            '+12123334444': {'exception': Exception('Dialing service failed'), 'waitMs': 5},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 10},
+            '+12123334447': {'state': CallState.CONNECTED, 'waitMs': 5}
+        }
+        dialer = create_dialer(ctx)
+        run(dialer.connect(), drain=True)
+        self.assertListEqual([
+            'Dialing "+12123334444" for agent "agent1" failed. Error: "Dialing service failed"'
+        ], LogInspector.get_messages())
+        self.assertEqual(AgentState.BUSY, dialer.agent_state)
+        self.assertEqual('+12123334447', dialer.current_lead)
+
+    def test_connect_all_leads_fail(self):
+        '''
+        Testing that when all connections fail the agent keeps AVAILABLE status
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.DISCONNECTED, 'waitMs': 5},
+            '+12123334449': {'state': CallState.FAILED},
+            '+12123334447': {'state': CallState.DISCONNECTED, 'waitMs': 5}
+        }
+        dialer = create_dialer(ctx)
+        run(dialer.connect(), drain=True)
+        self.assertEqual(dialer.agent_state, AgentState.AVAILABLE)
+        self.assertEqual(dialer.current_lead, '')
+
+    def test_connect_uses_bulk_fetch(self):
+        '''
+        Testing that a batch of leads is fetched in a single round trip when possible
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 5}
+        }
+        database = AsyncBulkDatabaseStub(ctx)
+        dialer = AsyncPowerDialer(database, AsyncDialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        run(dialer.connect(), drain=True)
+        self.assertEqual(dialer.current_lead, '+12123334449')
+        self.assertEqual(1, database.round_trips)
+
+    def test_many_agents_share_one_loop(self):
+        '''
+        Testing that a single event loop drives concurrent connects of several agents
+        '''
+        ctx = {f'+1212333{i:04}': {'state': CallState.CONNECTED, 'waitMs': 5} for i in range(20)}
+        database = AsyncDatabaseStub(ctx)
+        service = AsyncDialingServiceStub(ctx)
+        dialers = [AsyncPowerDialer(database, service, f'agent{i}') for i in range(10)]
+        for dialer in dialers:
+            dialer.on_agent_login()
+        async def connect_all():
+            await asyncio.gather(*[dialer.connect() for dialer in dialers])
+        run(connect_all(), drain=True)
+        self.assertTrue(all(dialer.agent_state == AgentState.BUSY for dialer in dialers))
+        self.assertEqual(10, len({dialer.current_lead for dialer in dialers}))
+
+    def test_connect_database_fails_during_retry(self):
+        '''
+        Testing that an error fetching the next batch is raised by connect
+        and the agent doesn't stay WAITING
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 5}
+        }
+        dialer = create_dialer(ctx)
+        fetch = dialer.database.get_lead_phone_number_to_dial
+        async def failing_fetch():
+            if not dialer.database.numbers:
+                raise Exception('Database is down')
+            return await fetch()
+        dialer.database.get_lead_phone_number_to_dial = failing_fetch
+        with self.assertRaises(Exception) as cm:
+            run(dialer.connect(), drain=True)
+        self.assertEqual('Database is down', str(cm.exception))
+        self.assertEqual(dialer.agent_state, AgentState.AVAILABLE)
+
+    def test_cancelled_connect_cancels_attempts(self):
+        '''
+        Testing that attempts of a connect which was cancelled don't outlive it
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 5000}
+        }
+        dialer = create_dialer(ctx)
+        async def cancel_connect():
+            task = asyncio.ensure_future(dialer.connect())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return [attempt.cancelled() for attempt in dialer.tasks]
+        self.assertListEqual([True, True], run(cancel_connect()))
+        self.assertEqual(dialer.agent_state, AgentState.AVAILABLE)
@@ -0,0 +1,103 @@
+'''
+Smoke tests for benchmark module
+'''
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from ..dialer.benchmark import (Scenario, SyntheticDialingService, main, percentile, run_isolated,
+                                run_scenario)
+from ..dialer.call_state import CallState
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestBenchmark(unittest.TestCase):
+    '''
+    Tests for benchmark module
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_percentile(self):
+        '''
+        Testing nearest-rank percentiles
+        '''
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 0.5))
+        self.assertEqual(99, percentile(values, 0.99))
+        self.assertEqual(1, percentile(values, 0))
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_invalid_scenario(self):
+        '''
+        Testing that outcome rates can't exceed 1
+        '''
+        with self.assertRaises(ValueError):
+            Scenario('invalid', answer_rate=0.6, fail_rate=0.5)
+
+    def test_outcomes(self):
+        '''
+        Testing that the synthetic service produces every kind of outcome
+        '''
+        service = SyntheticDialingService(Scenario(
+            'all', answer_rate=0.25, fail_rate=0.25, exception_rate=0.25,
+            median_ring_seconds=0.0001))
+        outcomes = set()
+        for _ in range(100):
+            try:
+                outcomes.add(service.dial('agent1', '+12123334444'))
+            except Exception as ex: # pylint: disable=broad-except
+                outcomes.add(str(ex))
+        self.assertSetEqual({CallState.CONNECTED, CallState.FAILED, CallState.DISCONNECTED,
+                             'Synthetic dialing error'}, outcomes)
+        self.assertEqual(100, service.dials)
+        self.assertGreaterEqual(service.peak_threads, 1)
+
+    def test_run_scenario(self):
+        '''
+        Testing metrics of a run, including connects which didn't make it before the deadline
+        '''
+        result = run_scenario(Scenario('never_answers', answer_rate=0, agents=2, connects=3,
+                                       median_ring_seconds=0.001, connect_deadline=0.01))
+        self.assertEqual(0, result['connects'])
+        self.assertEqual(3, result['failed_connects'])
+        self.assertIsNone(result['time_to_connect_p50'])
+        self.assertIsNone(result['dials_per_connect'])
+        self.assertGreater(result['dials'], 0)
+        self.assertGreater(result['peak_threads'], 1)
+
+    def test_main_writes_report(self):
+        '''
+        Testing that the command line entry point writes results of chosen scenarios as JSON
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            for options in (['--in-process'], ['--verbose']):
+                with redirect_stdout(io.StringIO()) as output:
+                    main(['--output', path, '--scenario', 'typical', '--connects', '5'] + options)
+                with open(path, encoding='utf-8') as results:
+                    report = json.load(results)
+                self.assertIn('typical: p50=', output.getvalue())
+                self.assertEqual('--in-process' not in options, report['results'][0]['isolated'])
+        self.assertEqual(['typical'], [r['scenario']['name'] for r in report['results']])
+        result = report['results'][0]
+        self.assertEqual(5, result['connects'])
+        self.assertEqual(5, result['scenario']['connects'])
+        self.assertGreaterEqual(result['dials_per_connect'], 1)
+        self.assertLessEqual(result['time_to_connect_p50'], result['time_to_connect_p99'])
+        self.assertGreater(result['peak_rss_kb'], 0)
+
+    def test_isolated_run(self):
+        '''
+        Testing that a scenario run in a process of its own reports its metrics
+        '''
+        result = run_isolated(Scenario('typical', connects=3), quiet=True)
+        self.assertEqual(3, result['scenario']['connects'])
+        self.assertGreater(result['peak_rss_kb'], 0)
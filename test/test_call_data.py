@@ -0,0 +1,106 @@
+'''
+Tests for call_data module and recycling of batches by PowerDialer
+'''
+import time
+import unittest
+from concurrent.futures import wait
+from ..dialer.agent_state import AgentState
+from ..dialer.call_data import CallData, CallDataPool
+from ..dialer.call_state import CallState
+from ..dialer.pacing import EwmaPacing, FixedPacing
+from ..dialer.power_dialer import PowerDialer
+from .database_stub import DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestCallDataPool(unittest.TestCase):
+    '''
+    Tests for CallDataPool class
+    '''
+
+    def test_released_objects_are_reused(self):
+        '''
+        Testing that a released object is reset and returned by the next acquire
+        '''
+        pool = CallDataPool()
+        call_data = pool.acquire()
+        call_data.connected_number = '+12123334444'
+        call_data.thread_counter = 2
+        call_data.resolved = True
+        call_data.pending['+12123334444'] = 1.0
+        call_data.cancelled.add('+12123334444')
+        call_data.deadline = 1.0
+        pool.release(call_data)
+        self.assertIs(call_data, pool.acquire())
+        self.assertEqual('', call_data.connected_number)
+        self.assertEqual(0, call_data.thread_counter)
+        self.assertFalse(call_data.resolved)
+        self.assertDictEqual({}, call_data.pending)
+        self.assertSetEqual(set(), call_data.cancelled)
+        self.assertIsNone(call_data.deadline)
+        self.assertEqual(1, call_data.generation)
+
+    def test_pool_size_is_limited(self):
+        '''
+        Testing that objects released to a full pool are dropped
+        '''
+        pool = CallDataPool(max_size=1)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertIsNot(first, second)
+        pool.release(first)
+        pool.release(second)
+        self.assertListEqual([first], pool.free)
+
+class TestRecycling(unittest.TestCase):
+    '''
+    Tests how PowerDialer treats results of attempts from recycled batches
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_batch_is_recycled(self):
+        '''
+        Testing that the next connect reuses the batch of the previous one
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.CONNECTED}
+        }
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1',
+                             pacing=FixedPacing(1))
+        dialer.on_agent_login()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertIsNone(dialer.call_data)
+        recycled = dialer.call_data_pool.free[-1]
+        generation = recycled.generation
+        dialer.on_call_ended()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertEqual('+12123334449', dialer.current_lead)
+        self.assertIs(recycled, dialer.call_data_pool.free[-1])
+        self.assertEqual(generation + 1, recycled.generation)
+
+    def test_stale_connected_result_is_surplus(self):
+        '''
+        Testing that a customer answering after his batch was recycled
+        is not connected to the agent
+        '''
+        pacing = EwmaPacing()
+        dialer = PowerDialer(DatabaseStub({}), DialingServiceStub({}), 'agent1', pacing=pacing)
+        dialer.on_agent_login()
+        call_data = CallData()
+        call_data.pending['+12123334444'] = time.monotonic()
+        call_data.thread_counter = 1
+        call_data.reset()
+        dialer.complete_attempt('+12123334444', call_data, 0, CallState.CONNECTED)
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertEqual(1, pacing.outcomes)
+        self.assertGreater(pacing.abandon_rate, 0)
@@ -0,0 +1,166 @@
+'''
+Tests for campaign module
+'''
+import time
+import unittest
+from ..dialer.agent_state import AgentState
+from ..dialer.call_state import CallState
+from ..dialer.campaign import Campaign
+from ..dialer.power_dialer import PowerDialer
+from .dialing_service_stub import DialingServiceStub
+from .database_stub import DatabaseStub
+from .log_inspector import LogInspector
+from .polling import wait_until
+
+LogInspector.setup_logging()
+
+class TestCampaign(unittest.TestCase):
+    '''
+    Tests for Campaign class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def create_agents(self, ctx, count):
+        '''
+        Creates a campaign with count logged in agents sharing the same stubs
+        '''
+        database = DatabaseStub(ctx)
+        service = DialingServiceStub(ctx)
+        campaign = Campaign(idle_retry_seconds=0.01)
+        dialers = [PowerDialer(database, service, f'agent{i}') for i in range(count)]
+        for dialer in dialers:
+            dialer.on_agent_login()
+            campaign.add_agent(dialer)
+        return campaign, dialers
+
+    def test_all_available_agents_are_connected(self):
+        '''
+        Testing that one scheduler thread connects every available agent
+        '''
+        ctx = {f'+1212333{i:04}': {'state': CallState.CONNECTED, 'waitMs': 5} for i in range(40)}
+        campaign, dialers = self.create_agents(ctx, 20)
+        campaign.start()
+        try:
+            self.assertTrue(wait_until(lambda: campaign.stats()['connects'] == 20))
+        finally:
+            campaign.stop()
+        self.assertTrue(all(dialer.agent_state == AgentState.BUSY for dialer in dialers))
+        stats = campaign.stats()
+        self.assertEqual(20, stats['agents'])
+        self.assertEqual(40, stats['dials'])
+        self.assertEqual(20, stats['states']['BUSY'])
+        self.assertGreater(stats['connects_per_second'], 0)
+        self.assertGreater(stats['dials_per_second'], 0)
+
+    def test_agent_is_connected_again_after_call(self):
+        '''
+        Testing that an agent becoming AVAILABLE after a call is scheduled again
+        '''
+        ctx = {f'+1212333{i:04}': {'state': CallState.CONNECTED} for i in range(4)}
+        campaign, dialers = self.create_agents(ctx, 1)
+        campaign.start()
+        try:
+            self.assertTrue(wait_until(lambda: dialers[0].agent_state == AgentState.BUSY))
+            dialers[0].on_call_ended()
+            self.assertTrue(wait_until(lambda: campaign.stats()['connects'] == 2))
+        finally:
+            campaign.stop()
+        self.assertEqual(AgentState.BUSY, dialers[0].agent_state)
+
+    def test_idle_agent_is_retried(self):
+        '''
+        Testing that an agent which found no leads is retried after a delay
+        '''
+        campaign, dialers = self.create_agents({}, 1)
+        self.assertEqual(1, campaign.run_once())
+        self.assertEqual(0, campaign.run_once())
+        self.assertEqual(AgentState.AVAILABLE, dialers[0].agent_state)
+        time.sleep(0.01)
+        self.assertEqual(1, campaign.run_once())
+        self.assertEqual(0, campaign.stats()['elapsed'])
+        self.assertEqual(0.0, campaign.stats()['dials_per_second'])
+
+    def test_removed_and_logged_out_agents_are_skipped(self):
+        '''
+        Testing that the scheduler ignores agents which are gone or not available
+        '''
+        ctx = {'+12123334444': {'state': CallState.CONNECTED}}
+        campaign, dialers = self.create_agents(ctx, 2)
+        campaign.remove_agent('agent0')
+        dialers[1].on_agent_logout()
+        self.assertEqual(0, campaign.run_once())
+        self.assertEqual(AgentState.AVAILABLE, dialers[0].agent_state)
+
+    def test_agents_by_state(self):
+        '''
+        Testing that the campaign follows state changes of its agents
+        and forgets removed ones
+        '''
+        campaign, dialers = self.create_agents({}, 3)
+        dialers[1].on_agent_logout()
+        campaign.remove_agent('agent2')
+        # a notification which raced with the removal
+        campaign.on_state_changed(dialers[2], AgentState.AVAILABLE, AgentState.UNAVAILABLE, '')
+        self.assertListEqual(['agent0'], campaign.agents_in_state(AgentState.AVAILABLE))
+        self.assertListEqual(['agent1'], campaign.agents_in_state(AgentState.UNAVAILABLE))
+        states = campaign.stats()['states']
+        self.assertEqual(1, states['AVAILABLE'])
+        self.assertEqual(1, states['UNAVAILABLE'])
+        self.assertEqual(0, states['WAITING'])
+
+    def test_stats_count_dials_since_start(self):
+        '''
+        Testing that dials agents made before the campaign started are not counted,
+        while dials of agents removed meanwhile are
+        '''
+        ctx = {f'+1212333{i:04}': {'state': CallState.FAILED} for i in range(4)}
+        campaign, dialers = self.create_agents(ctx, 2)
+        dialers[0].connect()
+        self.assertEqual(dialers[0].dials, campaign.stats()['dials'])
+        # logged out agents aren't connected by the scheduler thread
+        for dialer in dialers:
+            dialer.on_agent_logout()
+        campaign.start()
+        campaign.stop()
+        self.assertEqual(0, campaign.stats()['dials'])
+        ctx.update({f'+1212444{i:04}': {'state': CallState.FAILED} for i in range(2)})
+        dialers[1].database = DatabaseStub(ctx)
+        dialers[1].on_agent_login()
+        dialers[1].connect()
+        campaign.remove_agent('agent1')
+        self.assertEqual(dialers[1].dials, campaign.stats()['dials'])
+        self.assertGreater(dialers[1].dials, 0)
+        self.assertEqual(1, campaign.stats()['agents'])
+
+    def test_connect_error_is_logged(self):
+        '''
+        Testing that an exception raised while connecting is logged by the campaign
+        '''
+        campaign, _ = self.create_agents({}, 1)
+        campaign.dialers['agent0'].database = None # makes fetching leads fail
+        self.assertEqual(1, campaign.run_once())
+        logs = LogInspector.get_messages()
+        self.assertEqual(1, len(logs))
+        self.assertIn('Connecting agent "agent0" failed', logs[0])
+        self.assertEqual(set(), campaign.connecting)
+
+    def test_unavailable_agents_are_not_scheduled(self):
+        '''
+        Testing that agents are scheduled only after they log in
+        and that stopping an idle campaign is a no-op
+        '''
+        campaign = Campaign()
+        dialer = PowerDialer(DatabaseStub({}), DialingServiceStub({}), 'agent1')
+        campaign.add_agent(dialer)
+        self.assertEqual([], campaign.schedule)
+        campaign.on_connect_done(dialer, None)
+        self.assertEqual([], campaign.schedule)
+        campaign.connecting.add('agent1')
+        dialer.on_agent_login()
+        self.assertEqual([], campaign.schedule)
+        campaign.stop()
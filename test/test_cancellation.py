@@ -0,0 +1,176 @@
+'''
+Tests for cancellation of outstanding dial attempts
+'''
+import asyncio
+import logging
+import time
+import unittest
+from concurrent.futures import wait
+from ..dialer.agent_state import AgentState
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from ..dialer.pacing import EwmaPacing
+from ..dialer.power_dialer import PowerDialer
+from .async_stubs import AsyncDatabaseStub, AsyncDialingServiceStub, run
+from .database_stub import DatabaseStub
+from .dialing_service_stub import CancellableDialingServiceStub
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class OutcomeStub: # pylint: disable=too-few-public-methods
+    '''
+    Implements `record_outcome` method of a retry scheduler
+    '''
+    def __init__(self):
+        self.outcomes = [] # (phone number, CallState) tuples in the order they were reported
+
+    def record_outcome(self, phone_number: str, state: CallState):
+        '''
+        Stores the outcome
+        '''
+        self.outcomes.append((phone_number, state))
+
+class TestCancellation(unittest.TestCase):
+    '''
+    Tests cancellation of attempts which lost the race
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_losing_attempts_are_cancelled(self):
+        '''
+        Testing that attempts still ringing when a lead connects are cancelled
+        and their outcome doesn't affect pacing
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 5000}
+        }
+        service = CancellableDialingServiceStub(ctx)
+        pacing = EwmaPacing(initial_connect_rate=0.5, target_connect_probability=0.75,
+                            max_abandon_rate=1)
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1', pacing=pacing)
+        dialer.on_agent_login()
+        started = time.monotonic()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(AgentState.BUSY, dialer.agent_state)
+        self.assertEqual(['+12123334449'], service.cancelled)
+        self.assertEqual(1, dialer.cancelled)
+        self.assertGreater(dialer.line_seconds_saved, dialer.MAX_RING_SECONDS - 1)
+        self.assertEqual(1, pacing.outcomes)
+        logs = LogInspector.get_messages()
+        self.assertEqual(1, len(logs))
+        self.assertIn('Cancelled 1 attempts for agent "agent1"', logs[0])
+
+    def test_debug_message_is_skipped(self):
+        '''
+        Testing that the summary is not formatted when debug logging is disabled
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 5000}
+        }
+        dialer = PowerDialer(DatabaseStub(ctx), CancellableDialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.logger.setLevel(logging.INFO)
+        try:
+            dialer.connect()
+            wait(list(dialer.futures))
+        finally:
+            dialer.logger.setLevel(logging.NOTSET)
+        self.assertEqual(1, dialer.cancelled)
+        self.assertListEqual([], LogInspector.get_messages())
+
+    def test_nothing_to_cancel(self):
+        '''
+        Testing that cancel isn't called when all attempts already finished
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 10}
+        }
+        service = CancellableDialingServiceStub(ctx)
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual([], service.cancelled)
+        self.assertEqual(0, dialer.cancelled)
+
+    def test_cancel_errors_are_logged(self):
+        '''
+        Testing that a failing cancel is logged and not counted
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 20,
+                             'cancelException': Exception('Unknown call')}
+        }
+        service = CancellableDialingServiceStub(ctx)
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertEqual(0, dialer.cancelled)
+        self.assertEqual(0.0, dialer.line_seconds_saved)
+        logs = LogInspector.get_messages()
+        self.assertEqual('Cancelling "+12123334449" for agent "agent1" failed. '
+                         'Error: "Unknown call"', logs[0])
+
+    def test_async_losing_tasks_are_cancelled(self):
+        '''
+        Testing that AsyncPowerDialer cancels tasks which lost the race
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 5000}
+        }
+        retries = OutcomeStub()
+        dialer = AsyncPowerDialer(AsyncDatabaseStub(ctx), AsyncDialingServiceStub(ctx), 'agent1',
+                                  retries=retries)
+        dialer.on_agent_login()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(dialer.connect())
+            loop.run_until_complete(asyncio.wait(dialer.tasks))
+        finally:
+            loop.close()
+        self.assertEqual(AgentState.BUSY, dialer.agent_state)
+        self.assertTrue(dialer.tasks[1].cancelled())
+        # the loser is reported like a hung up call
+        self.assertListEqual([('+12123334444', CallState.CONNECTED),
+                              ('+12123334449', CallState.DISCONNECTED)], retries.outcomes)
+
+    def test_async_batch_is_deduplicated(self):
+        '''
+        Testing that AsyncPowerDialer doesn't dial a number twice in one batch
+        '''
+        dialer = AsyncPowerDialer(AsyncDatabaseStub({}), AsyncDialingServiceStub({}), 'agent1')
+        self.assertListEqual(['+12123334444', '+12123334449'],
+                             dialer.claim_leads(['+12123334444', '+12123334449', '+12123334444']))
+
+    def test_async_governor_error(self):
+        '''
+        Testing that an error waiting for a line is reported as a FAILED attempt
+        '''
+        class FailingGovernor: # pylint: disable=too-few-public-methods
+            '''
+            Fails to grant lines
+            '''
+            async def acquire_async(self, agent_id: str):
+                '''
+                Raises an error
+                '''
+                raise Exception(f'No lines for {agent_id}')
+        dialer = AsyncPowerDialer(AsyncDatabaseStub({}), AsyncDialingServiceStub({}), 'agent1',
+                                  governor=FailingGovernor())
+        state = run(dialer.dialing_wrapper('+12123334444'))
+        self.assertEqual(CallState.FAILED, state)
+        self.assertListEqual(['Dialing "+12123334444" for agent "agent1" failed. '
+                              'Error: "No lines for agent1"'], LogInspector.get_messages())
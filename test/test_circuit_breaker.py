@@ -0,0 +1,253 @@
+'''
+Tests for circuit_breaker module
+'''
+import asyncio
+import unittest
+from ..dialer.agent_state import AgentState
+from ..dialer.call_state import CallState
+from ..dialer.circuit_breaker import BreakerState, CircuitBreaker
+from ..dialer.governor import DialGovernor
+from ..dialer.power_dialer import PowerDialer
+from .async_stubs import create_dialer, run
+from .database_stub import DatabaseStub
+from .dialing_service_stub import BulkDialingServiceStub, DialingServiceStub
+from .log_inspector import LogInspector
+from .test_governor import TimerStub
+
+LogInspector.setup_logging()
+
+OPENED = 'Dialing service is failing, dialing is paused for 10 seconds'
+RECOVERED = 'Dialing service recovered, dialing is resumed'
+
+class TestCircuitBreaker(unittest.TestCase):
+    '''
+    Tests for CircuitBreaker class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+        self.now = 0.0
+
+    def create_breaker(self, **kwargs) -> CircuitBreaker:
+        '''
+        Returns a breaker using the fake clock, which stays open for 10 seconds
+        '''
+        return CircuitBreaker(open_seconds=10, clock=lambda: self.now, **kwargs)
+
+    def test_error_rate(self):
+        '''
+        Testing that the circuit opens when the share of errors of the latest calls
+        reaches the threshold
+        '''
+        breaker = self.create_breaker(error_rate=0.5, window=4, min_calls=4)
+        opened = breaker.metrics.breaker_opened.value
+        breaker.record(0.1, True)
+        for _ in range(3):
+            breaker.record(0.1)
+        self.assertEqual(2, breaker.permit(2))
+        breaker.record(0.1, True) # the first error left the window
+        self.assertEqual(BreakerState.CLOSED, breaker.state)
+        breaker.record(0.1, True)
+        self.assertEqual(BreakerState.OPEN, breaker.state)
+        self.assertEqual(0, breaker.permit(2))
+        self.now += 4
+        self.assertEqual(6, breaker.retry_after())
+        self.assertEqual(opened + 1, breaker.metrics.breaker_opened.value)
+        self.assertListEqual([OPENED], LogInspector.get_messages())
+        with self.assertRaises(ValueError):
+            CircuitBreaker(error_rate=0)
+
+    def test_latency(self):
+        '''
+        Testing that slow calls count as failed
+        '''
+        breaker = self.create_breaker(window=2, min_calls=2, slow_seconds=1.0)
+        breaker.record(0.5)
+        breaker.record(1.5)
+        self.assertEqual(BreakerState.OPEN, breaker.state)
+        # calls which started before the circuit opened are ignored
+        breaker.record(0.5)
+        self.assertEqual(BreakerState.OPEN, breaker.state)
+
+    def test_trial_calls(self):
+        '''
+        Testing that the circuit lets trial calls through once it was open long enough,
+        closes when they succeed and opens again when one of them fails
+        '''
+        breaker = self.create_breaker(window=1, trial_calls=2, trial_wait_seconds=0.5)
+        breaker.record(0.1, True)
+        self.now += 10
+        self.assertEqual(1, breaker.permit(1))
+        self.assertEqual(BreakerState.HALF_OPEN, breaker.state)
+        self.assertEqual(1, breaker.permit(3))
+        self.assertEqual(0, breaker.permit(1))
+        self.assertEqual(0.5, breaker.retry_after())
+        breaker.release(1)
+        breaker.record(0.1)
+        self.assertEqual(1, breaker.permit(1))
+        breaker.record(0.1)
+        self.assertEqual(BreakerState.CLOSED, breaker.state)
+        self.assertEqual(0, breaker.retry_after())
+        breaker.release(5)
+        self.assertEqual(5, breaker.permit(5))
+
+        breaker.record(0.1, True)
+        self.now += 10
+        self.assertEqual(2, breaker.permit(2))
+        breaker.record(0.1, True)
+        self.assertEqual(BreakerState.OPEN, breaker.state)
+        self.assertEqual(10, breaker.retry_after())
+        self.assertListEqual([OPENED, RECOVERED, OPENED, OPENED], LogInspector.get_messages())
+
+class TestBackoff(unittest.TestCase):
+    '''
+    Tests for dialers backing off while the circuit is open
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+        self.now = 0.0
+        self.ctx = {
+            '+12123334444': {'exception': Exception('Service unavailable')},
+            '+12123334445': {'exception': Exception('Service unavailable')},
+            '+12123334446': {'state': CallState.CONNECTED},
+            '+12123334447': {'state': CallState.FAILED}
+        }
+        self.failures = [
+            'Dialing "+12123334444" for agent "agent1" failed. Error: "Service unavailable"',
+            'Dialing "+12123334445" for agent "agent1" failed. Error: "Service unavailable"',
+        ]
+
+    def create_breaker(self) -> CircuitBreaker:
+        '''
+        Returns a breaker which opens after two errors
+        '''
+        return CircuitBreaker(window=2, min_calls=2, open_seconds=10, clock=lambda: self.now)
+
+    def test_power_dialer(self):
+        '''
+        Testing that PowerDialer backs off without consuming leads while the circuit is open
+        '''
+        database = DatabaseStub(self.ctx)
+        timer = TimerStub()
+        dialer = PowerDialer(database, DialingServiceStub(self.ctx), 'agent1', timer=timer,
+                             breaker=self.create_breaker())
+        backoffs = dialer.metrics.backoffs.value
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual(AgentState.BACKOFF, dialer.agent_state)
+        self.assertEqual(backoffs + 1, dialer.metrics.backoffs.value)
+        self.assertListEqual(['+12123334446', '+12123334447'], database.numbers)
+        self.assertListEqual(self.failures + [OPENED], LogInspector.get_messages())
+        # logging out is postponed until the back-off is over
+        dialer.on_agent_logout()
+        delay, func, _ = timer.scheduled.pop()
+        self.assertEqual(10, delay)
+        self.now += 10
+        func()
+        self.assertEqual(AgentState.UNAVAILABLE, dialer.agent_state)
+        # a single trial call is made
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertListEqual(['+12123334447'], database.numbers)
+        self.assertEqual(BreakerState.CLOSED, dialer.breaker.state)
+        dialer.on_call_ended()
+        dialer.connect()
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+
+    def test_bulk_dialing(self):
+        '''
+        Testing that results of a `dial_many` request are recorded
+        '''
+        self.ctx['+12123334444'] = {'state': CallState.FAILED}
+        breaker = self.create_breaker()
+        dialer = PowerDialer(DatabaseStub(self.ctx), BulkDialingServiceStub(self.ctx), 'agent1',
+                             timer=TimerStub(), breaker=breaker)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual(AgentState.BACKOFF, dialer.agent_state)
+        self.assertEqual(BreakerState.OPEN, breaker.state)
+        self.assertListEqual([OPENED, self.failures[1]], LogInspector.get_messages())
+
+    def open_for_trials(self, trial_calls: int) -> CircuitBreaker:
+        '''
+        helper utility
+        returns a half-open breaker letting trial_calls trial calls through
+        '''
+        breaker = CircuitBreaker(window=1, min_calls=1, open_seconds=10, trial_calls=trial_calls,
+                                 clock=lambda: self.now)
+        breaker.record(0.1, True)
+        self.now += 10
+        return breaker
+
+    def test_power_dialer_half_open_batch(self):
+        '''
+        Testing that trial calls which are never dialed, because another trial call
+        of the batch connected, are returned to a half-open breaker
+        '''
+        ctx = {
+            '+12123334446': {'state': CallState.CONNECTED},
+            '+12123334447': {'state': CallState.FAILED}
+        }
+        breaker = self.open_for_trials(3)
+        # the second attempt waits for a line until the first one connects
+        governor = DialGovernor(1, 1000)
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1',
+                             timer=TimerStub(), breaker=breaker, governor=governor)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertEqual(BreakerState.HALF_OPEN, breaker.state)
+        self.assertEqual(0, breaker.trials)
+        self.assertEqual(2, breaker.permit(2))
+
+    def test_async_power_dialer_half_open_batch(self):
+        '''
+        Testing that trial calls cancelled because another trial call of the batch connected
+        are returned to a half-open breaker
+        '''
+        ctx = {
+            '+12123334446': {'state': CallState.CONNECTED},
+            '+12123334447': {'state': CallState.FAILED, 'waitMs': 5000}
+        }
+        breaker = self.open_for_trials(3)
+        dialer = create_dialer(ctx, breaker=breaker)
+        run(dialer.connect(), drain=True)
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertTrue(dialer.tasks[1].cancelled())
+        self.assertEqual(BreakerState.HALF_OPEN, breaker.state)
+        self.assertEqual(0, breaker.trials)
+        self.assertEqual(2, breaker.permit(2))
+
+    def test_async_power_dialer(self):
+        '''
+        Testing that AsyncPowerDialer backs off without consuming leads while the circuit is open
+        '''
+        breaker = CircuitBreaker(window=2, min_calls=2, open_seconds=0.01)
+        dialer = create_dialer(self.ctx, breaker=breaker)
+        database = dialer.database
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(dialer.connect())
+            self.assertEqual(AgentState.BACKOFF, dialer.agent_state)
+            self.assertListEqual(['+12123334446', '+12123334447'], database.numbers)
+            loop.run_until_complete(asyncio.sleep(0.05))
+            self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+            loop.run_until_complete(dialer.connect())
+            self.assertEqual('+12123334446', dialer.current_lead)
+            self.assertListEqual(['+12123334447'], database.numbers)
+            dialer.on_call_ended()
+            loop.run_until_complete(dialer.connect())
+        finally:
+            loop.close()
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertListEqual(self.failures + [
+            'Dialing service is failing, dialing is paused for 0.01 seconds', RECOVERED],
+                             LogInspector.get_messages())
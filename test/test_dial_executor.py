@@ -0,0 +1,70 @@
+'''
+Tests for dial_executor module
+'''
+import threading
+import time
+import unittest
+from ..dialer.agent_state import AgentState
+from ..dialer.call_state import CallState
+from ..dialer.dial_executor import DialExecutor, get_default_executor
+from ..dialer.power_dialer import PowerDialer
+from .dialing_service_stub import DialingServiceStub
+from .database_stub import DatabaseStub
+
+class TestDialExecutor(unittest.TestCase):
+    '''
+    Tests for DialExecutor class
+    '''
+
+    def test_invalid_max_workers(self):
+        '''
+        Testing that executor requires at least one worker
+        '''
+        with self.assertRaises(ValueError):
+            DialExecutor(0)
+
+    def test_default_executor_is_shared(self):
+        '''
+        Testing that dialers without an explicit executor share the same pool
+        '''
+        first = PowerDialer(None, None, 'agent1')
+        second = PowerDialer(None, None, 'agent2')
+        self.assertIs(first.executor, second.executor)
+        self.assertIs(get_default_executor(), first.executor)
+
+    def test_in_flight_is_capped(self):
+        '''
+        Testing that no more than max_workers attempts run concurrently
+        '''
+        executor = DialExecutor(2)
+        lock = threading.Lock()
+        observed = {'current': 0, 'peak': 0}
+        def job():
+            with lock:
+                observed['current'] += 1
+                observed['peak'] = max(observed['peak'], observed['current'])
+            time.sleep(0.005)
+            with lock:
+                observed['current'] -= 1
+        futures = [executor.submit(job) for _ in range(10)]
+        for future in futures:
+            future.result()
+        executor.shutdown()
+        self.assertEqual(2, observed['peak'])
+        self.assertEqual(0, executor.in_flight)
+        self.assertEqual(0, executor.pending)
+
+    def test_threads_are_reused(self):
+        '''
+        Testing that repeated connects neither start new threads
+        nor keep references to finished attempts
+        '''
+        ctx = {f'+1212333{i:04}': {'state': CallState.DISCONNECTED} for i in range(200)}
+        executor = DialExecutor(4)
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1', executor)
+        dialer.on_agent_login()
+        dialer.connect()
+        executor.shutdown()
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertLessEqual(len(executor.pool._threads), 4) # pylint: disable=protected-access
+        self.assertEqual(0, len(dialer.futures))
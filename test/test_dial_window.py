@@ -0,0 +1,177 @@
+'''
+Tests for dial_window module and bulk dialing of PowerDialer
+'''
+import threading
+import unittest
+from concurrent.futures import wait
+from ..dialer.agent_state import AgentState
+from ..dialer.call_state import CallState
+from ..dialer.dial_window import DialWindow
+from ..dialer.governor import DialGovernor
+from ..dialer.power_dialer import PowerDialer
+from .database_stub import DatabaseStub
+from .dialing_service_stub import BulkDialingServiceStub
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class ShortDialingServiceStub(BulkDialingServiceStub):
+    '''
+    Returns the first result of every bulk request only
+    '''
+    def resolve(self, numbers: list):
+        '''
+        Yields the result of the first number twice, then stops
+        '''
+        for result in super().resolve(numbers):
+            yield result
+            yield result
+            return
+
+class TestBulkDialing(unittest.TestCase):
+    '''
+    Tests for PowerDialer using `dial_many` method of the dialing service
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_connect(self):
+        '''
+        Testing that every batch is dialed with one request, and its results are handled
+        as they're streamed back
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED, 'waitMs': 5},
+            '+12123334445': {'state': CallState.DISCONNECTED},
+            '+12123334446': {'state': CallState.CONNECTED, 'waitMs': 5},
+            '+12123334447': {'state': CallState.CONNECTED, 'waitMs': 10}
+        }
+        service = BulkDialingServiceStub(ctx)
+        governor = DialGovernor(10, 1000)
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1', governor=governor)
+        dialer.on_agent_login()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertEqual(AgentState.BUSY, dialer.agent_state)
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertEqual(2, service.round_trips)
+        self.assertListEqual([('agent1', ['+12123334444', '+12123334445']),
+                              ('agent1', ['+12123334446', '+12123334447'])], service.requests)
+        self.assertEqual(0, governor.in_use)
+        self.assertListEqual([], LogInspector.get_messages())
+
+    def test_failed_request(self):
+        '''
+        Testing that attempts left without a result are logged and count as FAILED
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334445': {'exception': Exception('Dialing service failed'), 'waitMs': 5},
+            '+12123334446': {'state': CallState.FAILED},
+            '+12123334447': {'state': CallState.CONNECTED, 'waitMs': 5},
+        }
+        dialer = PowerDialer(DatabaseStub(ctx), BulkDialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334447', dialer.current_lead)
+        self.assertListEqual(
+            ['Dialing "+12123334445" for agent "agent1" failed. Error: "Dialing service failed"'],
+            LogInspector.get_messages())
+
+        LogInspector.reset_buffer()
+        dialer = PowerDialer(DatabaseStub(ctx), ShortDialingServiceStub(ctx), 'agent2')
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertListEqual(
+            ['Dialing "+12123334445" for agent "agent2" failed. Error: "no result was returned"',
+             'Dialing "+12123334447" for agent "agent2" failed. Error: "no result was returned"'],
+            LogInspector.get_messages())
+
+class TestDialWindow(unittest.TestCase):
+    '''
+    Tests for DialWindow class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_agents_share_a_submission(self):
+        '''
+        Testing that small batches of several agents are submitted together
+        and every agent gets the results of its own numbers
+        '''
+        ctx = {f'+1212333444{i}': {'state': CallState.FAILED, 'waitMs': 10 - i}
+               for i in range(6)}
+        ctx['+12123334443']['state'] = CallState.CONNECTED
+        service = BulkDialingServiceStub(ctx)
+        window = DialWindow(service, window=10, max_numbers=6)
+        database = DatabaseStub(ctx)
+        dialers = [PowerDialer(database, window, f'agent{i}') for i in range(3)]
+        done = threading.Barrier(4)
+        for dialer in dialers:
+            dialer.on_agent_login()
+            dialer.start_connect(lambda dialer, error: done.wait())
+        done.wait()
+        self.assertEqual(1, service.round_trips)
+        self.assertEqual(1, window.submissions)
+        # requests join the group in the order worker threads run them
+        self.assertListEqual(['agent0', 'agent0', 'agent1', 'agent1', 'agent2', 'agent2'],
+                             sorted(service.requests[0][0]))
+        self.assertListEqual([AgentState.AVAILABLE, AgentState.BUSY, AgentState.AVAILABLE],
+                             [dialer.agent_state for dialer in dialers])
+        self.assertEqual('+12123334443', dialers[1].current_lead)
+
+    def test_window(self):
+        '''
+        Testing that a group is submitted when its window is over, and large requests
+        are submitted on their own
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334445': {'state': CallState.CONNECTED},
+        }
+        service = BulkDialingServiceStub(ctx)
+        window = DialWindow(service, window=0.01, max_numbers=2)
+        self.assertListEqual([(0, CallState.CONNECTED)],
+                             list(window.dial_many('agent1', ['+12123334445'])))
+        self.assertEqual([(0, CallState.FAILED), (1, CallState.CONNECTED)],
+                         list(window.dial_many('agent1', ['+12123334444', '+12123334445'])))
+        self.assertListEqual([(['agent1'], ['+12123334445']),
+                              ('agent1', ['+12123334444', '+12123334445'])], service.requests)
+        self.assertEqual(2, window.submissions)
+        # other methods are passed to the service
+        self.assertEqual(CallState.FAILED, window.dial('agent1', '+12123334444'))
+        self.assertIsNone(getattr(window, 'cancel', None))
+        with self.assertRaises(ValueError):
+            DialWindow(service, max_numbers=0)
+
+    def test_failed_submission(self):
+        '''
+        Testing that requests waiting for results learn that the submission failed
+        or returned fewer results
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334445': {'exception': Exception('Dialing service failed'), 'waitMs': 5},
+        }
+        window = DialWindow(BulkDialingServiceStub(ctx), window=10, max_numbers=2)
+        first = window.dial_many('agent1', ['+12123334444'])
+        second = window.dial_many('agent2', ['+12123334445'])
+        self.assertListEqual([(0, CallState.FAILED)], list(first))
+        with self.assertRaises(Exception) as error:
+            list(second)
+        self.assertEqual('Dialing service failed', str(error.exception))
+
+        window = DialWindow(ShortDialingServiceStub(ctx), window=10, max_numbers=2)
+        first = window.dial_many('agent1', ['+12123334444'])
+        second = window.dial_many('agent2', ['+12123334445'])
+        self.assertListEqual([(0, CallState.FAILED)], list(first))
+        self.assertListEqual([], list(second))
@@ -0,0 +1,402 @@
+'''
+Tests for governor module
+'''
+import asyncio
+import threading
+import unittest
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.agent_state import AgentState
+from ..dialer.call_state import CallState
+from ..dialer.governor import DialGovernor
+from ..dialer.inflight import InFlightRegistry
+from ..dialer.pacing import FixedPacing
+from ..dialer.power_dialer import PowerDialer
+from ..dialer.retry import RetryScheduler
+from .async_stubs import AsyncDatabaseStub, AsyncDialingServiceStub, run
+from .database_stub import DatabaseStub
+from .dialing_service_stub import (BulkDialingServiceStub, DialingServiceStub,
+                                   RecordingDialingServiceStub)
+
+class TimerStub: # pylint: disable=too-few-public-methods
+    '''
+    Implements `schedule` method. Callbacks run when the test calls them
+    '''
+    def __init__(self):
+        self.scheduled = [] # (delay, func)
+
+    def schedule(self, delay: float, func, *args):
+        '''
+        Records the callback
+        '''
+        self.scheduled.append((delay, func, args))
+
+class PeakDialingServiceStub(DialingServiceStub):
+    '''
+    Records the number of lines in use while dialing
+    '''
+    def __init__(self, ctx: dict, governor: DialGovernor):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys and result scenarios as values
+        '''
+        super().__init__(ctx)
+        self.governor = governor
+        self.lines = []
+
+    def dial(self, agent_id: str, number: str)->CallState:
+        '''
+        Same as DialingServiceStub.dial, but records lines in use
+        '''
+        self.lines.append(self.governor.in_use)
+        return super().dial(agent_id, number)
+
+class PeakBulkDialingServiceStub(BulkDialingServiceStub):
+    '''
+    Records the number of lines in use by every `dial_many` request
+    '''
+    def __init__(self, ctx: dict, governor: DialGovernor):
+        '''Constructor
+
+        :context: A hashmap with phone numbers as keys and result scenarios as values
+        '''
+        super().__init__(ctx)
+        self.governor = governor
+        self.lines = []
+
+    def dial_many(self, agent_id, numbers: list):
+        '''
+        Same as BulkDialingServiceStub.dial_many, but records lines in use
+        '''
+        self.lines.append(self.governor.in_use)
+        return super().dial_many(agent_id, numbers)
+
+class TestDialGovernor(unittest.TestCase):
+    '''
+    Tests for DialGovernor class
+    '''
+
+    def setUp(self):
+        '''
+        Creates a governor with a fake clock and timer
+        '''
+        self.now = 0.0
+        self.timer = TimerStub()
+        self.woken = []
+
+    def create_governor(self, max_lines: int, calls_per_second: float = 1000, burst=None):
+        '''
+        Returns a governor using the fake clock and timer
+        '''
+        return DialGovernor(max_lines, calls_per_second, burst, clock=lambda: self.now,
+                            timer=self.timer)
+
+    def enqueue(self, governor: DialGovernor, agent_id: str, name: str):
+        '''
+        Queues an attempt which records its name when it's granted a line
+        '''
+        return governor.enqueue(agent_id, lambda: self.woken.append(name))
+
+    def test_lines_are_limited(self):
+        '''
+        Testing that attempts wait for a free line
+        '''
+        governor = self.create_governor(2)
+        governor.acquire('agent1')
+        governor.acquire('agent1')
+        self.assertEqual(2, governor.in_use)
+        thread = threading.Thread(target=governor.acquire, args=('agent2',))
+        thread.start()
+        while governor.queue_depth == 0:
+            thread.join(0.001)
+        governor.release()
+        thread.join()
+        self.assertEqual(2, governor.in_use)
+        self.assertEqual(0, governor.queue_depth)
+        with self.assertRaises(ValueError):
+            DialGovernor(0, 1)
+
+    def test_agents_take_turns(self):
+        '''
+        Testing that an agent with many queued attempts doesn't hold the others back
+        '''
+        governor = self.create_governor(1)
+        self.assertIsNone(self.enqueue(governor, 'agent1', 'first'))
+        for name in ('a1', 'a2', 'a3'):
+            self.enqueue(governor, 'agent1', name)
+        self.enqueue(governor, 'agent2', 'b1')
+        self.assertEqual(4, governor.queue_depth)
+        for _ in range(4):
+            governor.release()
+        self.assertListEqual(['a1', 'b1', 'a2', 'a3'], self.woken)
+        self.assertEqual(0, governor.queue_depth)
+
+    def test_calls_per_second(self):
+        '''
+        Testing that attempts start no faster than the token bucket allows
+        '''
+        governor = self.create_governor(10, calls_per_second=2, burst=1)
+        self.assertEqual(1, governor.burst)
+        self.assertIsNone(self.enqueue(governor, 'agent1', 'first'))
+        self.enqueue(governor, 'agent1', 'second')
+        self.enqueue(governor, 'agent2', 'third')
+        self.assertEqual(1, len(self.timer.scheduled))
+        delay, func, args = self.timer.scheduled.pop()
+        self.assertAlmostEqual(0.5, delay)
+        self.now += 0.5
+        func(*args)
+        self.assertListEqual(['second'], self.woken)
+        self.assertEqual(1, len(self.timer.scheduled))
+        # a new attempt queues behind the others, even when a token arrived
+        self.now += 0.5
+        self.assertIsNotNone(self.enqueue(governor, 'agent1', 'fourth'))
+        self.assertListEqual(['second', 'third'], self.woken)
+        self.now += 10
+        self.timer.scheduled.pop()[1]()
+        self.assertListEqual(['second', 'third', 'fourth'], self.woken)
+        self.assertEqual(4, governor.in_use)
+        # the burst caps tokens saved during the quiet period
+        self.now += 10
+        self.assertIsNone(self.enqueue(governor, 'agent1', 'fifth'))
+        self.assertIsNotNone(self.enqueue(governor, 'agent1', 'sixth'))
+
+    def test_lines_granted_together(self):
+        '''
+        Testing that a request for several lines gets all of them at once,
+        doesn't hold any of them while it waits, and isn't overtaken by smaller requests
+        '''
+        governor = self.create_governor(3, calls_per_second=2, burst=3)
+        self.assertIsNone(self.enqueue(governor, 'agent1', 'first'))
+        bulk = governor.enqueue('agent2', lambda: self.woken.append('bulk'), 3)
+        self.enqueue(governor, 'agent3', 'single')
+        self.assertEqual(1, governor.in_use)
+        governor.release()
+        self.assertEqual(0, governor.in_use)
+        # the request waits for a token per line
+        delay, func, args = self.timer.scheduled.pop()
+        self.assertAlmostEqual(0.5, delay)
+        self.now += 0.5
+        func(*args)
+        self.assertListEqual(['bulk'], self.woken)
+        self.assertEqual(3, governor.in_use)
+        self.assertFalse(governor.cancel(bulk))
+        governor.release(3)
+        self.now += 10
+        self.timer.scheduled.pop()[1]()
+        self.assertListEqual(['bulk', 'single'], self.woken)
+        # a request queued behind a cancelled larger one gets its line
+        large = governor.enqueue('agent4', lambda: self.woken.append('large'), 3)
+        self.enqueue(governor, 'agent5', 'small')
+        self.assertTrue(governor.cancel(large))
+        self.assertListEqual(['bulk', 'single', 'small'], self.woken)
+        self.assertEqual(2, governor.in_use)
+        with self.assertRaises(ValueError):
+            governor.enqueue('agent1', None, 4)
+
+    def test_cancel(self):
+        '''
+        Testing that a queued attempt can be cancelled, but a granted one can't
+        '''
+        governor = self.create_governor(1)
+        governor.acquire('agent1')
+        first = self.enqueue(governor, 'agent1', 'first')
+        second = self.enqueue(governor, 'agent1', 'second')
+        third = self.enqueue(governor, 'agent2', 'third')
+        self.assertTrue(governor.cancel(second))
+        self.assertTrue(governor.cancel(third))
+        self.assertEqual(1, governor.queue_depth)
+        governor.release()
+        self.assertListEqual(['first'], self.woken)
+        self.assertFalse(governor.cancel(first))
+
+    def test_acquire_async(self):
+        '''
+        Testing that coroutines wait for a line without blocking the event loop,
+        and that cancelled waits don't leak lines
+        '''
+        governor = self.create_governor(1)
+        async def scenario():
+            await governor.acquire_async('agent1')
+            waiting = asyncio.ensure_future(governor.acquire_async('agent2'))
+            cancelled = asyncio.ensure_future(governor.acquire_async('agent3'))
+            await asyncio.sleep(0)
+            self.assertEqual(2, governor.queue_depth)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            self.assertEqual(1, governor.queue_depth)
+            governor.release()
+            await waiting
+            self.assertEqual(1, governor.in_use)
+            # granted, but cancelled before it could run
+            granted = asyncio.ensure_future(governor.acquire_async('agent4'))
+            await asyncio.sleep(0)
+            governor.release()
+            granted.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await granted
+            self.assertEqual(0, governor.in_use)
+        run(scenario())
+
+    def test_dialers_wait_for_lines(self):
+        '''
+        Testing that attempts of PowerDialer and AsyncPowerDialer pass through the governor
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED, 'waitMs': 10},
+            '+12123334445': {'state': CallState.FAILED, 'waitMs': 10},
+            '+12123334446': {'state': CallState.CONNECTED, 'waitMs': 10}
+        }
+        governor = DialGovernor(1, 1000)
+        service = PeakDialingServiceStub(ctx, governor)
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1', pacing=FixedPacing(3),
+                             governor=governor)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertListEqual([1, 1, 1], service.lines)
+
+        dialer = AsyncPowerDialer(AsyncDatabaseStub(ctx), AsyncDialingServiceStub(ctx), 'agent2',
+                                  governor=governor)
+        dialer.DIAL_RATIO = 3
+        dialer.on_agent_login()
+        run(dialer.connect())
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertEqual(0, governor.in_use)
+        self.assertEqual(0, governor.queue_depth)
+
+    def test_bulk_dialers_share_lines(self):
+        '''
+        Testing that agents dialing batches with `dial_many` don't deadlock
+        when there are fewer lines than their attempts
+        '''
+        ctx = {f'+1212333444{i}': {'state': CallState.CONNECTED, 'waitMs': 10}
+               for i in range(8)}
+        governor = DialGovernor(2, 1000)
+        database = DatabaseStub(ctx)
+        service = PeakBulkDialingServiceStub(ctx, governor)
+        dialers = [PowerDialer(database, service, f'agent{i}', pacing=FixedPacing(3),
+                               governor=governor) for i in range(4)]
+        threads = []
+        for dialer in dialers:
+            dialer.on_agent_login()
+            threads.append(threading.Thread(target=dialer.connect))
+            threads[-1].start()
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        self.assertTrue(all(dialer.current_lead for dialer in dialers))
+        # every batch was cut down to the number of lines
+        self.assertListEqual([2] * 4, [len(numbers) for _, numbers in service.requests])
+        self.assertListEqual([2] * 4, service.lines)
+        for dialer in dialers:
+            for future in list(dialer.futures):
+                future.result()
+        self.assertEqual(0, governor.in_use)
+
+class TestQueuedAttempts(unittest.TestCase):
+    '''
+    Tests for attempts which wait for a line
+    '''
+
+    def setUp(self):
+        '''
+        Creates leads and a governor with a single line
+        '''
+        self.ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 20},
+            '+12123334445': {'state': CallState.FAILED}
+        }
+        self.governor = DialGovernor(1, 1000)
+
+    @staticmethod
+    def wait_for(dialer: PowerDialer):
+        '''
+        Waits for all attempts of the dialer
+        '''
+        for future in list(dialer.futures):
+            future.result()
+
+    def test_connected_batch_cancels_waiting_attempts(self):
+        '''
+        Testing that attempts waiting for a line are never dialed once a lead connects
+        '''
+        service = RecordingDialingServiceStub(self.ctx)
+        inflight = InFlightRegistry()
+        retries = RetryScheduler(DatabaseStub(self.ctx))
+        dialer = PowerDialer(retries, service, 'agent1', governor=self.governor,
+                             inflight=inflight, retries=retries)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.wait_for(dialer)
+        self.assertEqual('+12123334444', dialer.current_lead)
+        self.assertListEqual(['+12123334444'], service.dialed)
+        # the lead which wasn't dialed will be
+        self.assertEqual(1, len(retries))
+        self.assertEqual(0, len(inflight))
+        self.assertEqual(0, self.governor.in_use)
+        self.assertEqual(0, self.governor.queue_depth)
+
+    def test_timed_out_attempts_are_not_dialed(self):
+        '''
+        Testing that attempts which timed out while they waited for a line are never dialed
+        '''
+        self.ctx['+12123334444'] = {'state': CallState.FAILED, 'waitMs': 200}
+        service = RecordingDialingServiceStub(self.ctx)
+        dialer = PowerDialer(DatabaseStub(self.ctx), service, 'agent1', governor=self.governor,
+                             ring_timeout=0.05)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.wait_for(dialer)
+        self.assertListEqual(['+12123334444'], service.dialed)
+        self.assertEqual(0, self.governor.queue_depth)
+
+    def test_waiting_bulk_request(self):
+        '''
+        Testing that a `dial_many` request waiting for lines is never sent
+        once its batch is over
+        '''
+        ctx = dict(self.ctx)
+        self.ctx['+12123334446'] = {'state': CallState.FAILED}
+        self.ctx['+12123334447'] = {'state': CallState.FAILED}
+        governor = DialGovernor(2, 1000)
+        service = BulkDialingServiceStub(self.ctx)
+        governor.acquire('other', 2)
+        # all attempts of the request time out
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1', governor=governor,
+                             ring_timeout=0.02)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertEqual(1, governor.queue_depth)
+        governor.release(2)
+        self.wait_for(dialer)
+        self.assertEqual(0, governor.in_use)
+        # a handed over customer connects the agent
+        governor.acquire('other', 2)
+        dialer = PowerDialer(DatabaseStub(self.ctx), service, 'agent2', governor=governor)
+        dialer.on_agent_login()
+        dialer.start_connect()
+        self.assertTrue(dialer.accept_handoff('+12123334448'))
+        self.assertEqual('+12123334448', dialer.current_lead)
+        self.assertEqual(0, governor.queue_depth)
+        governor.release(2)
+        self.assertEqual(0, service.round_trips)
+
+    def test_line_granted_while_queued(self):
+        '''
+        Testing that an attempt which gets its line as soon as it's queued is dialed
+        '''
+        now = [0.0]
+        timer = TimerStub()
+        governor = DialGovernor(2, 1, 2, clock=lambda: now[0], timer=timer)
+        governor.acquire('other', 2)
+        governor.release(2)
+        self.assertIsNotNone(governor.enqueue('other', lambda: None))
+        # tokens arrived, but nothing dispatched the queue yet
+        now[0] += 10
+        service = RecordingDialingServiceStub(self.ctx)
+        dialer = PowerDialer(DatabaseStub(self.ctx), service, 'agent1', governor=governor,
+                             pacing=FixedPacing(1))
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334444', dialer.current_lead)
@@ -0,0 +1,152 @@
+'''
+Tests for handoff module
+'''
+import time
+import unittest
+from ..dialer.agent_state import AgentEvent, AgentState
+from ..dialer.call_data import CallData
+from ..dialer.call_state import CallState
+from ..dialer.handoff import HandoffQueue
+from ..dialer.power_dialer import PowerDialer
+from .database_stub import DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+from .polling import wait_for_all_attempts
+
+LogInspector.setup_logging()
+
+# pylint: disable=unbalanced-tuple-unpacking
+class TestHandoffQueue(unittest.TestCase):
+    '''
+    Tests for HandoffQueue class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def create_dialers(self, ctx, handoff, count=2):
+        '''
+        Creates logged in agents sharing stubs and the handoff queue
+        '''
+        database = DatabaseStub(ctx)
+        service = DialingServiceStub(ctx)
+        dialers = []
+        for i in range(count):
+            dialer = PowerDialer(database, service, f'agent{i}', handoff=handoff)
+            dialer.on_agent_login()
+            dialers.append(dialer)
+        return dialers
+
+    def test_surplus_call_goes_to_waiting_agent(self):
+        '''
+        Testing that a second answered call is connected to another waiting agent
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 30},
+            '+12123334447': {'state': CallState.FAILED, 'waitMs': 100},
+            '+12123334448': {'state': CallState.FAILED, 'waitMs': 100}
+        }
+        handoff = HandoffQueue()
+        first, second = self.create_dialers(ctx, handoff)
+        first.start_connect()
+        second.start_connect()
+        wait_for_all_attempts(first, second)
+        self.assertEqual(AgentState.BUSY, first.agent_state)
+        self.assertEqual('+12123334444', first.current_lead)
+        self.assertEqual(AgentState.BUSY, second.agent_state)
+        self.assertEqual('+12123334449', second.current_lead)
+        self.assertEqual(1, handoff.handoffs)
+        self.assertEqual(0, handoff.abandoned)
+
+    def test_surplus_call_is_parked_for_next_agent(self):
+        '''
+        Testing that a surplus call is taken by the next agent who starts connecting
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 10},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        handoff = HandoffQueue(grace_seconds=10)
+        first, second = self.create_dialers(ctx, handoff)
+        first.connect()
+        wait_for_all_attempts(first)
+        self.assertEqual(1, len(handoff.parked))
+        second.connect()
+        self.assertEqual(AgentState.BUSY, second.agent_state)
+        self.assertEqual('+12123334449', second.current_lead)
+        self.assertEqual(0, second.dials)
+        self.assertEqual(1, handoff.handoffs)
+
+    def test_parked_call_expires(self):
+        '''
+        Testing that a surplus call nobody takes during grace period is abandoned
+        '''
+        handoff = HandoffQueue(grace_seconds=0.001)
+        first, second = self.create_dialers({}, handoff)
+        self.assertTrue(handoff.offer(first, '+12123334449'))
+        time.sleep(0.002)
+        second.connect()
+        self.assertEqual(AgentState.AVAILABLE, second.agent_state)
+        self.assertEqual(1, handoff.abandoned)
+        self.assertListEqual(LogInspector.get_messages(),
+                             ['Nobody took connected call with lead="+12123334449"'])
+
+    def test_no_grace_period(self):
+        '''
+        Testing that without grace period a surplus call is abandoned immediately
+        '''
+        handoff = HandoffQueue(grace_seconds=0)
+        first = self.create_dialers({}, handoff, 1)[0]
+        self.assertFalse(handoff.offer(first, '+12123334449'))
+        self.assertEqual(1, handoff.abandoned)
+
+    def test_resolved_agents_are_skipped(self):
+        '''
+        Testing that agents which can't accept a call are skipped
+        '''
+        handoff = HandoffQueue()
+        first, second = self.create_dialers({}, handoff)
+        self.assertFalse(second.accept_handoff('+12123334449'))
+        # both agents are waiting, but the batch of the second one is already resolved
+        first.transition(AgentEvent.CONNECT)
+        second.call_data = CallData()
+        second.call_data.resolved = True
+        second.transition(AgentEvent.CONNECT)
+        self.assertTrue(handoff.offer(first, '+12123334449'))
+        self.assertEqual(0, handoff.handoffs)
+        self.assertEqual(1, len(handoff.parked))
+        self.assertNotIn('agent1', handoff.waiting)
+
+    def test_calls_go_to_agents_with_skills(self):
+        '''
+        Testing that a surplus call is only taken by agents having the skills
+        of the agent who dialed it
+        '''
+        handoff = HandoffQueue(grace_seconds=10)
+        database = DatabaseStub({})
+        service = DialingServiceStub({})
+        spanish = PowerDialer(database, service, 'agent0', handoff=handoff, skills={'es'})
+        english = PowerDialer(database, service, 'agent1', handoff=handoff)
+        billing = PowerDialer(database, service, 'agent2', handoff=handoff,
+                              skills={'es', 'billing'})
+        for dialer in (spanish, english, billing):
+            dialer.on_agent_login()
+        english.transition(AgentEvent.CONNECT)
+        self.assertTrue(handoff.offer(spanish, '+12123334449'))
+        # the waiting agent can't take the call, so it's parked
+        self.assertEqual(1, len(handoff.parked))
+        self.assertIn('agent1', handoff.waiting)
+        english.transition(AgentEvent.GIVE_UP)
+        english.connect()
+        self.assertEqual(AgentState.AVAILABLE, english.agent_state)
+        self.assertTrue(handoff.offer(english, '+12123334448'))
+        billing.connect()
+        self.assertEqual('+12123334449', billing.current_lead)
+        english.connect()
+        self.assertEqual('+12123334448', english.current_lead)
+        self.assertEqual(2, handoff.handoffs)
@@ -0,0 +1,148 @@
+'''
+Tests for inflight module and skipping of numbers dialed by other agents
+'''
+import asyncio
+import unittest
+from concurrent.futures import wait
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from ..dialer.inflight import InFlightRegistry
+from ..dialer.metrics import DEFAULT_METRICS
+from ..dialer.pacing import FixedPacing
+from ..dialer.power_dialer import PowerDialer
+from .async_stubs import AsyncDatabaseStub, AsyncDialingServiceStub, run
+from .database_stub import BulkDatabaseStub, DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestInFlightRegistry(unittest.TestCase):
+    '''
+    Tests for InFlightRegistry class
+    '''
+
+    def test_acquire_and_release(self):
+        '''
+        Testing that a number can be acquired only once until it's released
+        '''
+        registry = InFlightRegistry()
+        numbers = ['+12123334444', '+12123334449', 'operator', '+12123334444']
+        self.assertListEqual(numbers[:3], registry.acquire(numbers))
+        self.assertListEqual([], registry.acquire(numbers))
+        self.assertEqual(3, len(registry))
+        self.assertIn('+12123334444', registry)
+        self.assertIn('operator', registry)
+        registry.release('+12123334444')
+        registry.release('operator')
+        registry.release('+12123334440') # unknown numbers are ignored
+        self.assertNotIn('+12123334444', registry)
+        self.assertNotIn('operator', registry)
+        self.assertListEqual(['+12123334444', 'operator'], registry.acquire(numbers))
+        with self.assertRaises(ValueError):
+            InFlightRegistry(0)
+
+    def test_growth_and_reuse_of_slots(self):
+        '''
+        Testing that the table grows, and slots of released numbers are reused
+        '''
+        registry = InFlightRegistry(capacity=4)
+        numbers = [f'+1212{number:07d}' for number in range(10000)]
+        self.assertEqual(10000, len(registry.acquire(numbers)))
+        self.assertEqual(10000, len(registry))
+        self.assertGreaterEqual(len(registry.slots), 20000)
+        self.assertTrue(all(number in registry for number in numbers))
+        for number in numbers:
+            registry.release(number)
+        self.assertEqual(0, len(registry))
+        # many dials, but only a few at the same time keep the table small
+        for number in range(10000, 20000):
+            self.assertEqual(1, len(registry.acquire([f'+1212{number:07d}'])))
+            registry.release(f'+1212{number:07d}')
+        registry.acquire(numbers[:3])
+        self.assertLessEqual(len(registry.slots), 8)
+        self.assertTrue(all(number in registry for number in numbers[:3]))
+
+class TestDuplicateDials(unittest.TestCase):
+    '''
+    Tests dialers sharing an InFlightRegistry
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_number_is_dialed_once(self):
+        '''
+        Testing that a number being dialed by one agent is skipped by another one
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 30},
+            '+12123334449': {'state': CallState.CONNECTED}
+        }
+        database = BulkDatabaseStub(ctx)
+        database.numbers = ['+12123334444', '+12123334444', '+12123334444', '+12123334449']
+        service = DialingServiceStub(ctx)
+        registry = InFlightRegistry()
+        duplicates = DEFAULT_METRICS.duplicate_leads.value
+        first, second = [PowerDialer(database, service, f'agent{i}', pacing=FixedPacing(1),
+                                     inflight=registry) for i in range(2)]
+        first.on_agent_login()
+        second.on_agent_login()
+        first.start_connect()
+        second.connect()
+        wait(list(first.futures))
+        self.assertEqual('+12123334444', first.current_lead)
+        self.assertEqual('+12123334449', second.current_lead)
+        self.assertEqual(1, first.dials)
+        self.assertEqual(1, second.dials)
+        self.assertEqual(2, DEFAULT_METRICS.duplicate_leads.value - duplicates)
+        self.assertEqual(4, database.round_trips)
+        self.assertEqual(0, len(registry))
+
+    def test_only_duplicates_left(self):
+        '''
+        Testing that an agent gives up when all remaining leads are being dialed
+        '''
+        ctx = {'+12123334444': {'state': CallState.CONNECTED, 'waitMs': 30}}
+        database = DatabaseStub(ctx)
+        database.numbers = ['+12123334444', '+12123334444']
+        service = DialingServiceStub(ctx)
+        registry = InFlightRegistry()
+        first, second = [PowerDialer(database, service, f'agent{i}', inflight=registry)
+                         for i in range(2)]
+        first.on_agent_login()
+        second.on_agent_login()
+        first.start_connect()
+        second.connect()
+        self.assertEqual(0, second.dials)
+        wait(list(first.futures))
+        self.assertEqual('+12123334444', first.current_lead)
+        self.assertEqual(0, len(registry))
+
+    def test_async_number_is_dialed_once(self):
+        '''
+        Testing that AsyncPowerDialer skips numbers being dialed by another agent
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 30},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 10}
+        }
+        database = AsyncDatabaseStub(ctx)
+        database.numbers = ['+12123334444', '+12123334444', '+12123334444', '+12123334449']
+        service = AsyncDialingServiceStub(ctx)
+        registry = InFlightRegistry()
+        first, second = [AsyncPowerDialer(database, service, f'agent{i}', inflight=registry)
+                         for i in range(2)]
+        first.DIAL_RATIO = 1
+        second.DIAL_RATIO = 1
+        first.on_agent_login()
+        second.on_agent_login()
+        async def connect_both():
+            await asyncio.gather(first.connect(), second.connect())
+        run(connect_both())
+        self.assertEqual('+12123334444', first.current_lead)
+        self.assertEqual('+12123334449', second.current_lead)
+        self.assertEqual(0, len(registry))
@@ -0,0 +1,183 @@
+'''
+Tests for journal module
+'''
+import os
+import threading
+import unittest
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from ..dialer.journal import OutcomeJournal, read_journal
+from ..dialer.power_dialer import PowerDialer
+from .async_stubs import AsyncDatabaseStub, AsyncDialingServiceStub, run
+from .database_stub import BulkDatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+from .polling import wait_until
+from .temp_files import create_temp_dir
+
+LogInspector.setup_logging()
+
+class StubOutput:
+    '''
+    Wraps the journal file. Writes wait until they are released and may fail
+    '''
+    def __init__(self, output, error: Exception = None):
+        '''Constructor
+
+        :param output: the journal file
+        :param error: raised by write and flush when set
+        '''
+        self.output = output
+        self.error = error
+        self.released = threading.Event()
+
+    def write(self, line: str):
+        '''
+        Waits until released, then fails or writes the line
+        '''
+        self.released.wait()
+        if self.error is not None:
+            raise self.error
+        self.output.write(line)
+
+    def flush(self):
+        '''
+        Fails or flushes the file
+        '''
+        if self.error is not None:
+            raise self.error
+        self.output.flush()
+
+    def fileno(self):
+        '''
+        Returns the descriptor of the file
+        '''
+        return self.output.fileno()
+
+class TestOutcomeJournal(unittest.TestCase):
+    '''
+    Tests for OutcomeJournal class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage and creates a directory for journals
+        '''
+        LogInspector.reset_buffer()
+        self.directory = create_temp_dir(self)
+        self.path = os.path.join(self.directory, 'outcomes.jsonl')
+
+    def test_dialers_record_attempts_and_transitions(self):
+        '''
+        Testing that dial attempts of both dialers and agent transitions are journaled
+        '''
+        journal = OutcomeJournal(self.path, clock=lambda: 1000.0)
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334445': {'state': CallState.CONNECTED}
+        }
+        dialer = PowerDialer(BulkDatabaseStub(ctx), DialingServiceStub(ctx), 'agent1',
+                             journal=journal)
+        dialer.add_state_listener(journal.on_state_changed)
+        dialer.on_agent_login()
+        dialer.connect()
+        dialer.on_call_ended()
+        async_dialer = AsyncPowerDialer(AsyncDatabaseStub(ctx), AsyncDialingServiceStub(ctx),
+                                        'agent2', journal=journal)
+        run(async_dialer.dialing_wrapper('+12123334445'))
+        journal.close()
+        journal.close()
+
+        records = list(read_journal(self.path))
+        transitions = [(record['from'], record['state'], record['lead'])
+                       for record in records if record['type'] == 'transition']
+        self.assertListEqual([('UNAVAILABLE', 'AVAILABLE', ''), ('AVAILABLE', 'WAITING', ''),
+                              ('WAITING', 'BUSY', '+12123334445'),
+                              ('BUSY', 'AVAILABLE', '+12123334445')], transitions)
+        dials = sorted((record['agent'], record['lead'], record['state'])
+                       for record in records if record['type'] == 'dial')
+        self.assertListEqual([('agent1', '+12123334444', 'FAILED'),
+                              ('agent1', '+12123334445', 'CONNECTED'),
+                              ('agent2', '+12123334445', 'CONNECTED')], dials)
+        self.assertTrue(all(record['time'] == 1000.0 for record in records))
+        self.assertTrue(all(record['latency'] >= 0 for record in records
+                            if record['type'] == 'dial'))
+
+    def test_records_are_synced_in_groups(self):
+        '''
+        Testing that fsync is called once per max_batch records, or after flush_interval
+        '''
+        journal = OutcomeJournal(self.path, max_batch=3, flush_interval=60)
+        for index in range(7):
+            journal.append({'index': index})
+        journal.close()
+        self.assertEqual(3, journal.syncs)
+        self.assertListEqual([{'index': index} for index in range(7)],
+                             list(read_journal(self.path)))
+
+        journal = OutcomeJournal(self.path, flush_interval=0.01)
+        journal.append({'index': 7})
+        wait_until(lambda: journal.syncs == 1)
+        self.assertEqual(1, journal.syncs)
+        self.assertEqual(8, len(list(read_journal(self.path))))
+        journal.close()
+        with self.assertRaises(ValueError):
+            OutcomeJournal(self.path, capacity=0)
+
+    def test_full_queue_blocks(self):
+        '''
+        Testing that by default a record which doesn't fit into the queue waits for room
+        '''
+        journal = OutcomeJournal(self.path, capacity=1)
+        output = StubOutput(journal.output)
+        journal.output = output
+        journal.append({'index': 0})
+        # the writer thread took the first record and waits in write
+        wait_until(journal.queue.empty)
+        journal.append({'index': 1})
+        appender = threading.Thread(target=journal.append, args=({'index': 2},))
+        appender.start()
+        appender.join(0.05)
+        self.assertTrue(appender.is_alive())
+        output.released.set()
+        appender.join()
+        journal.close()
+        self.assertEqual(0, journal.dropped)
+        self.assertListEqual([{'index': index} for index in range(3)],
+                             list(read_journal(self.path)))
+
+    def test_full_queue_drops_records(self):
+        '''
+        Testing that records which don't fit into the queue are dropped when dropping
+        was asked for
+        '''
+        journal = OutcomeJournal(self.path, capacity=1, block_seconds=0)
+        output = StubOutput(journal.output)
+        journal.output = output
+        journal.append({'index': 0})
+        # the writer thread took the first record and waits in write
+        wait_until(journal.queue.empty)
+        journal.append({'index': 1})
+        journal.append({'index': 2})
+        journal.block_seconds = 0.01
+        journal.append({'index': 3})
+        self.assertEqual(2, journal.dropped)
+        output.released.set()
+        journal.close()
+        self.assertListEqual([{'index': 0}, {'index': 1}], list(read_journal(self.path)))
+
+    def test_write_errors_are_logged(self):
+        '''
+        Testing that the writer thread logs errors and keeps running
+        '''
+        journal = OutcomeJournal(self.path, flush_interval=0)
+        output = StubOutput(journal.output, OSError('disk full'))
+        output.released.set()
+        journal.output = output
+        journal.append({'index': 0})
+        journal.sync()
+        journal.close()
+        self.assertListEqual([f'Writing journal "{self.path}" failed. Error: "disk full"'] * 2,
+                             LogInspector.get_messages())
+        with self.assertRaises(OSError):
+            OutcomeJournal(self.directory)
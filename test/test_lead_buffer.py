@@ -0,0 +1,162 @@
+'''
+Tests for lead_buffer module
+'''
+import threading
+import unittest
+from ..dialer.agent_state import AgentState
+from ..dialer.call_state import CallState
+from ..dialer.lead_buffer import LeadBuffer, fetch_leads
+from ..dialer.power_dialer import PowerDialer
+from .database_stub import BulkDatabaseStub, DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+from .polling import wait_until
+
+LogInspector.setup_logging()
+
+def create_ctx(count):
+    '''
+    helper utility
+    creates a context with count leads
+    '''
+    return {f'+1212333{i:04}': {'state': CallState.CONNECTED} for i in range(count)}
+
+class TestFetchLeads(unittest.TestCase):
+    '''
+    Tests for fetch_leads function
+    '''
+
+    def test_single_lead_fallback(self):
+        '''
+        Testing that leads are fetched one by one when there is no bulk method
+        '''
+        database = DatabaseStub(create_ctx(3))
+        self.assertEqual(['+12123330000', '+12123330001'], fetch_leads(database, 2))
+        self.assertEqual(['+12123330002'], fetch_leads(database, 2))
+        self.assertEqual([], fetch_leads(database, 2))
+
+    def test_bulk_fetch(self):
+        '''
+        Testing that bulk method is preferred
+        '''
+        database = BulkDatabaseStub(create_ctx(3))
+        self.assertEqual(['+12123330000', '+12123330001'], fetch_leads(database, 2))
+        self.assertEqual(1, database.round_trips)
+
+    def test_connect_uses_bulk_fetch(self):
+        '''
+        Testing that connect fetches a batch in a single round trip
+        '''
+        ctx = create_ctx(2)
+        database = BulkDatabaseStub(ctx)
+        dialer = PowerDialer(database, DialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual(AgentState.BUSY, dialer.agent_state)
+        self.assertEqual(1, database.round_trips)
+
+class TestLeadBuffer(unittest.TestCase):
+    '''
+    Tests for LeadBuffer class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_invalid_capacity(self):
+        '''
+        Testing that buffer requires a positive capacity
+        '''
+        with self.assertRaises(ValueError):
+            LeadBuffer(DatabaseStub({}), capacity=0)
+
+    def test_leads_are_returned_in_order(self):
+        '''
+        Testing that all leads are returned in the original order
+        '''
+        database = BulkDatabaseStub(create_ctx(25))
+        buffer = LeadBuffer(database, capacity=10, low_water=5)
+        try:
+            leads = []
+            lead = buffer.get_lead_phone_number_to_dial()
+            while lead is not None:
+                leads.append(lead)
+                lead = buffer.get_lead_phone_number_to_dial()
+        finally:
+            buffer.close()
+        self.assertEqual(list(create_ctx(25)), leads)
+
+    def test_buffer_is_refilled_in_background(self):
+        '''
+        Testing that the buffer is refilled ahead of consumers
+        '''
+        database = BulkDatabaseStub(create_ctx(100))
+        buffer = LeadBuffer(database, capacity=10, low_water=5)
+        try:
+            self.assertEqual(10, len(buffer.get_lead_phone_numbers_to_dial(10)))
+            self.assertTrue(wait_until(lambda: len(buffer.leads) == 10))
+            self.assertEqual(4, len(buffer.get_lead_phone_numbers_to_dial(4)))
+            self.assertEqual(6, len(buffer.leads)) # still above the low-water mark
+        finally:
+            buffer.close()
+
+    def test_exhausted_database_is_retried(self):
+        '''
+        Testing that new leads are picked up after the database ran out of leads
+        '''
+        database = DatabaseStub({})
+        buffer = LeadBuffer(database, capacity=4, retry_seconds=0.01)
+        try:
+            self.assertIsNone(buffer.get_lead_phone_number_to_dial())
+            database.numbers.append('+12123334444')
+            self.assertTrue(wait_until(lambda: buffer.leads))
+            self.assertEqual('+12123334444', buffer.get_lead_phone_number_to_dial())
+        finally:
+            buffer.close()
+
+    def test_database_errors_are_logged(self):
+        '''
+        Testing that a failing database is reported as having no leads
+        '''
+        buffer = LeadBuffer(None, capacity=4, retry_seconds=60)
+        try:
+            self.assertIsNone(buffer.get_lead_phone_number_to_dial())
+        finally:
+            buffer.close()
+        logs = LogInspector.get_messages()
+        self.assertEqual(1, len(logs))
+        self.assertIn('Fetching leads failed', logs[0])
+
+    def test_close_releases_waiting_consumers(self):
+        '''
+        Testing that a consumer waiting for a refill returns when the buffer is closed
+        '''
+        started = threading.Event()
+        release = threading.Event()
+        class SlowDatabase: # pylint: disable=too-few-public-methods
+            '''
+            Database blocking until released
+            '''
+            @staticmethod
+            def get_lead_phone_number_to_dial():
+                '''
+                Blocks and then returns no leads
+                '''
+                started.set()
+                release.wait()
+        buffer = LeadBuffer(SlowDatabase(), capacity=1)
+        started.wait()
+        closer = threading.Thread(target=buffer.close)
+        result = []
+        consumer = threading.Thread(
+            target=lambda: result.append(buffer.get_lead_phone_number_to_dial()))
+        consumer.start()
+        closer.start()
+        self.assertTrue(wait_until(lambda: buffer.closed))
+        release.set()
+        consumer.join()
+        closer.join()
+        self.assertEqual([None], result)
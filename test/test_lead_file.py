@@ -0,0 +1,146 @@
+'''
+Tests for lead_file module
+'''
+import os
+import threading
+import unittest
+from ..dialer.call_state import CallState
+from ..dialer.lead_file import LeadFile, convert_csv
+from ..dialer.power_dialer import PowerDialer
+from .dialing_service_stub import DialingServiceStub
+from .temp_files import create_temp_dir
+
+class TestLeadFile(unittest.TestCase):
+    '''
+    Tests for convert_csv function and LeadFile class
+    '''
+
+    def setUp(self):
+        '''
+        Writes a CSV export of leads
+        '''
+        self.directory = create_temp_dir(self)
+        self.csv_path = os.path.join(self.directory, 'leads.csv')
+        self.path = os.path.join(self.directory, 'leads.bin')
+        with open(self.csv_path, 'w', encoding='utf-8') as output:
+            output.write('name,phone\n')
+            output.write('Alice,+12123334444\n')
+            output.write('Bob,operator\n')
+            output.write('Carol\n')
+            output.write('Dave, +12123334445\n')
+            output.write('Eve,+12123334446\n')
+
+    def test_convert_csv(self):
+        '''
+        Testing that valid numbers are converted in order and the rest is skipped
+        '''
+        self.assertEqual((3, 2), convert_csv(self.csv_path, self.path, column=1,
+                                             skip_header=True, chunk_size=2))
+        self.assertEqual(24, os.path.getsize(self.path))
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        leads = LeadFile(self.path)
+        self.assertEqual(3, len(leads))
+        self.assertEqual('+12123334444', leads.get_lead_phone_number_to_dial())
+        self.assertListEqual(['+12123334445', '+12123334446'],
+                             leads.get_lead_phone_numbers_to_dial(5))
+        self.assertIsNone(leads.get_lead_phone_number_to_dial())
+        self.assertListEqual([], leads.get_lead_phone_numbers_to_dial(5))
+        self.assertEqual(0, len(leads))
+        leads.close()
+        leads.close()
+
+    def test_cursor_survives_restart(self):
+        '''
+        Testing that a reopened lead file continues with the next lead
+        '''
+        convert_csv(self.csv_path, self.path, column=1, skip_header=True)
+        leads = LeadFile(self.path)
+        self.assertEqual('+12123334444', leads.get_lead_phone_number_to_dial())
+        leads.close()
+        leads = LeadFile(self.path)
+        self.assertEqual(1, leads.position)
+        self.assertEqual('+12123334445', leads.get_lead_phone_number_to_dial())
+        leads.close()
+        # a separate cursor starts from the beginning
+        leads = LeadFile(self.path, os.path.join(self.directory, 'second.cursor'))
+        self.assertEqual('+12123334444', leads.get_lead_phone_number_to_dial())
+        leads.close()
+
+    def test_cursor_of_replaced_file(self):
+        '''
+        Testing that a cursor starts over when the lead file was replaced
+        '''
+        convert_csv(self.csv_path, self.path, column=1, skip_header=True)
+        leads = LeadFile(self.path)
+        self.assertEqual('+12123334444', leads.get_lead_phone_number_to_dial())
+        leads.close()
+        with open(self.csv_path, 'w', encoding='utf-8') as output:
+            output.write('+12123334447\n+12123334448\n')
+        convert_csv(self.csv_path, self.path)
+        stat = os.stat(self.path)
+        # the replacement may get the same modification time on coarse clocks
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        leads = LeadFile(self.path)
+        self.assertEqual(0, leads.position)
+        self.assertEqual('+12123334447', leads.get_lead_phone_number_to_dial())
+        leads.close()
+
+    def test_invalid_files(self):
+        '''
+        Testing that empty files are allowed and files of wrong size are rejected
+        '''
+        convert_csv(self.csv_path, self.path)
+        leads = LeadFile(self.path)
+        self.assertEqual(0, len(leads))
+        self.assertIsNone(leads.get_lead_phone_number_to_dial())
+        leads.close()
+        with open(self.path + '.cursor', 'wb') as output:
+            output.write(b'1234')
+        with self.assertRaises(ValueError):
+            LeadFile(self.path)
+        with open(self.path, 'wb') as output:
+            output.write(b'12345')
+        with self.assertRaises(ValueError):
+            LeadFile(self.path)
+
+    def test_concurrent_fetches(self):
+        '''
+        Testing that concurrent fetches never return the same lead twice
+        '''
+        with open(self.csv_path, 'w', encoding='utf-8') as output:
+            for number in range(10000):
+                output.write(f'+1212{number:07d}\n')
+        convert_csv(self.csv_path, self.path)
+        leads = LeadFile(self.path)
+        fetched = []
+        def fetch():
+            while True:
+                batch = leads.get_lead_phone_numbers_to_dial(3)
+                if not batch:
+                    return
+                fetched.extend(batch)
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(10000, len(set(fetched)))
+        leads.close()
+
+    def test_dialer_uses_lead_file(self):
+        '''
+        Testing that PowerDialer fetches leads from a lead file
+        '''
+        convert_csv(self.csv_path, self.path, column=1, skip_header=True)
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334445': {'state': CallState.FAILED},
+            '+12123334446': {'state': CallState.CONNECTED}
+        }
+        leads = LeadFile(self.path)
+        dialer = PowerDialer(leads, DialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertEqual(0, len(leads))
+        leads.close()
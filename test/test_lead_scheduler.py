@@ -0,0 +1,95 @@
+'''
+Tests for lead_scheduler module
+'''
+import unittest
+from ..dialer.call_state import CallState
+from ..dialer.lead_scheduler import LeadScheduler
+from ..dialer.power_dialer import PowerDialer
+from .dialing_service_stub import DialingServiceStub
+
+HOUR = 3600
+NEW_YORK = -5 * HOUR
+LONDON = 0
+TOKYO = 9 * HOUR
+
+class TestLeadScheduler(unittest.TestCase):
+    '''
+    Tests for LeadScheduler class
+    '''
+
+    def setUp(self):
+        '''
+        Creates a scheduler at 13:00 UTC: London is open, New York and Tokyo are closed
+        '''
+        self.now = 13 * HOUR
+        self.scheduler = LeadScheduler(clock=lambda: self.now)
+
+    def test_score_order(self):
+        '''
+        Testing that leads come out by score, and in FIFO order when scores are equal
+        '''
+        self.scheduler.add('+442071234567', 1, LONDON)
+        self.scheduler.add('+442071234568', 5, LONDON)
+        self.scheduler.add('+442071234569', 1, LONDON)
+        self.scheduler.add('+442071234560', 3, LONDON)
+        self.assertEqual(4, len(self.scheduler))
+        self.assertEqual('+442071234568', self.scheduler.get_lead_phone_number_to_dial())
+        self.assertListEqual(['+442071234560', '+442071234567', '+442071234569'],
+                             self.scheduler.get_lead_phone_numbers_to_dial(5))
+        self.assertIsNone(self.scheduler.get_lead_phone_number_to_dial())
+        self.assertEqual(0, len(self.scheduler))
+        with self.assertRaises(ValueError):
+            self.scheduler.add('operator')
+
+    def test_calling_windows(self):
+        '''
+        Testing that leads are held back until calling hours start in their time zone
+        '''
+        self.assertIsNone(self.scheduler.next_opening())
+        self.scheduler.add('+12123334444', 9, NEW_YORK)
+        self.scheduler.add('+81312345678', 8, TOKYO)
+        self.scheduler.add('+442071234567', 1, LONDON)
+        self.assertEqual(0, self.scheduler.next_opening())
+        self.assertListEqual(['+442071234567'], self.scheduler.get_lead_phone_numbers_to_dial(5))
+        # New York opens at 14:00 UTC
+        self.assertEqual(HOUR, self.scheduler.next_opening())
+        self.now = 14 * HOUR
+        self.assertEqual('+12123334444', self.scheduler.get_lead_phone_number_to_dial())
+        # Tokyo opens at midnight UTC
+        self.assertEqual(10 * HOUR, self.scheduler.next_opening())
+        self.now = 24 * HOUR + 30
+        self.assertEqual('+81312345678', self.scheduler.get_lead_phone_number_to_dial())
+
+    def test_window_over_midnight(self):
+        '''
+        Testing windows which span midnight, and invalid windows
+        '''
+        scheduler = LeadScheduler((22 * HOUR, 2 * HOUR), clock=lambda: self.now)
+        scheduler.add('+442071234567', 1, LONDON)
+        self.assertIsNone(scheduler.get_lead_phone_number_to_dial())
+        self.now = 23 * HOUR
+        self.assertEqual('+442071234567', scheduler.get_lead_phone_number_to_dial())
+        scheduler.add('+442071234568', 1, LONDON)
+        self.now = HOUR
+        self.assertEqual('+442071234568', scheduler.get_lead_phone_number_to_dial())
+        for window in ((HOUR, HOUR), (-1, HOUR), (HOUR, 25 * HOUR)):
+            with self.assertRaises(ValueError):
+                LeadScheduler(window)
+
+    def test_dialer_uses_scheduler(self):
+        '''
+        Testing that PowerDialer dials the best lead which may be called
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+442071234567': {'state': CallState.FAILED},
+            '+442071234568': {'state': CallState.CONNECTED}
+        }
+        self.scheduler.add('+12123334444', 9, NEW_YORK)
+        self.scheduler.add('+442071234567', 5, LONDON)
+        self.scheduler.add('+442071234568', 1, LONDON)
+        dialer = PowerDialer(self.scheduler, DialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+442071234568', dialer.current_lead)
+        self.assertEqual(1, len(self.scheduler))
@@ -0,0 +1,199 @@
+'''
+Tests for metrics module and metrics updated by dialers
+'''
+import asyncio
+import logging
+import unittest
+import urllib.request
+from concurrent.futures import wait
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from ..dialer.metrics import (DEFAULT_METRICS, DEFAULT_REGISTRY, CONTENT_TYPE, Histogram,
+                              MetricsRegistry, start_http_server)
+from ..dialer.power_dialer import PowerDialer
+from .async_stubs import AsyncDatabaseStub, AsyncDialingServiceStub, run
+from .database_stub import DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+def snapshot() -> dict:
+    '''
+    helper utility
+    returns current values of the default dialer metrics
+    '''
+    metrics = DEFAULT_METRICS
+    return {
+        'dials': metrics.dials.value,
+        'exceptions': metrics.dial_exceptions.value,
+        'timeouts': metrics.dial_timeouts.value,
+        'connected': metrics.outcome(CallState.CONNECTED).value,
+        'failed': metrics.outcome(CallState.FAILED).value,
+        'connects': metrics.connects.value,
+        'without_call': metrics.connects_without_call.value,
+        'time_to_connect': metrics.time_to_connect.count,
+        'batches': metrics.batches_per_connect.sum,
+        'waiting': metrics.waiting_seconds.count,
+        'lead_fetches': metrics.lead_fetch_seconds.count,
+        'calls_failed': metrics.calls_failed.value,
+    }
+
+def delta(before: dict) -> dict:
+    '''
+    helper utility
+    returns changes of the default dialer metrics since the snapshot, leaving out zeros
+    '''
+    after = snapshot()
+    return {key: after[key] - value for key, value in before.items() if after[key] != value}
+
+class TestMetricsRegistry(unittest.TestCase):
+    '''
+    Tests for MetricsRegistry, Counter and Histogram classes
+    '''
+
+    def test_exposition_format(self):
+        '''
+        Testing Prometheus text format of counters and histograms
+        '''
+        registry = MetricsRegistry()
+        registry.counter('calls_total', 'Calls', {'state': 'A"B\\C\nD'}).inc(2)
+        registry.counter('calls_total', 'Calls', {'state': 'CONNECTED'}).inc(0.5)
+        registry.counter('calls_total', 'Calls', {'state': 'CONNECTED'}).inc()
+        histogram = registry.histogram('latency_seconds', 'Latency', (0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(0.25)
+        histogram.observe(7)
+        self.assertEqual(
+            '# HELP calls_total Calls\n'
+            '# TYPE calls_total counter\n'
+            'calls_total{state="A\\"B\\\\C\\nD"} 2\n'
+            'calls_total{state="CONNECTED"} 1.5\n'
+            '# HELP latency_seconds Latency\n'
+            '# TYPE latency_seconds histogram\n'
+            'latency_seconds_bucket{le="0.1"} 2\n'
+            'latency_seconds_bucket{le="1"} 3\n'
+            'latency_seconds_bucket{le="+Inf"} 4\n'
+            'latency_seconds_sum 7.4\n'
+            'latency_seconds_count 4\n',
+            registry.to_prometheus())
+
+    def test_invalid_metrics(self):
+        '''
+        Testing that a name can't be reused for another type and buckets must be sorted
+        '''
+        registry = MetricsRegistry()
+        registry.counter('calls_total', 'Calls')
+        with self.assertRaises(ValueError):
+            registry.histogram('calls_total', 'Calls', (1, 2))
+        with self.assertRaises(ValueError):
+            Histogram('latency_seconds', (1, 0.5))
+
+    def test_http_server(self):
+        '''
+        Testing that metrics are served over HTTP
+        '''
+        registry = MetricsRegistry()
+        registry.counter('calls_total', 'Calls').inc()
+        server = start_http_server(0, '127.0.0.1', registry)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(CONTENT_TYPE, response.headers['Content-Type'])
+                self.assertIn('calls_total 1\n', response.read().decode('utf-8'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class TestDialerMetrics(unittest.TestCase):
+    '''
+    Tests metrics updated by PowerDialer and AsyncPowerDialer
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_power_dialer_metrics(self):
+        '''
+        Testing metrics of connects, dial attempts and calls
+        '''
+        ctx = {
+            '+12123334444': {'exception': Exception('Unknown number')},
+            '+12123334449': {'state': CallState.FAILED},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        before = snapshot()
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        wait(list(dialer.futures))
+        dialer.on_call_failed()
+        dialer.connect()
+        self.assertDictEqual({
+            'dials': 3, 'exceptions': 1, 'connected': 1, 'failed': 2, 'connects': 1,
+            'without_call': 1, 'time_to_connect': 1, 'batches': 2, 'waiting': 2,
+            'lead_fetches': 3, 'calls_failed': 1
+        }, delta(before))
+        self.assertIn('dialer_dial_outcomes_total{state="CONNECTED"}',
+                      DEFAULT_REGISTRY.to_prometheus())
+
+    def test_async_power_dialer_metrics(self):
+        '''
+        Testing metrics of AsyncPowerDialer
+        '''
+        ctx = {
+            '+12123334444': {'exception': Exception('Unknown number')},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        before = snapshot()
+        dialer = AsyncPowerDialer(AsyncDatabaseStub(ctx), AsyncDialingServiceStub(ctx),
+                                  'agent1', ring_timeout=0.01)
+        dialer.on_agent_login()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(dialer.connect())
+            dialer.on_call_ended()
+            loop.run_until_complete(dialer.connect())
+            loop.run_until_complete(dialer.connect(deadline=0))
+        finally:
+            loop.close()
+        self.assertDictEqual({
+            'dials': 3, 'exceptions': 1, 'timeouts': 1, 'connected': 1, 'failed': 2,
+            'connects': 1, 'without_call': 2, 'time_to_connect': 1, 'batches': 2,
+            'waiting': 3, 'lead_fetches': 3
+        }, delta(before))
+
+    def test_disabled_logging(self):
+        '''
+        Testing that metrics are updated when log messages are not built
+        '''
+        ctx = {
+            '+12123334444': {'exception': Exception('Unknown number')},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 40},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        before = snapshot()
+        logging.disable(logging.CRITICAL)
+        try:
+            dialer = PowerDialer(DatabaseStub(dict(ctx)), DialingServiceStub(ctx), 'agent1',
+                                 ring_timeout=0.01)
+            dialer.on_agent_login()
+            dialer.connect()
+            wait(list(dialer.futures))
+            dialer.on_call_failed()
+            dialer = AsyncPowerDialer(AsyncDatabaseStub(dict(ctx)),
+                                      AsyncDialingServiceStub(ctx), 'agent2', ring_timeout=0.01)
+            dialer.on_agent_login()
+            run(dialer.connect())
+        finally:
+            logging.disable(logging.NOTSET)
+        changes = delta(before)
+        self.assertEqual(2, changes['exceptions'])
+        self.assertEqual(2, changes['timeouts'])
+        self.assertEqual(1, changes['calls_failed'])
+        self.assertListEqual([], LogInspector.get_messages())
@@ -0,0 +1,132 @@
+'''
+Tests for pacing module
+'''
+import unittest
+from ..dialer.call_state import CallState
+from ..dialer.pacing import EwmaPacing, FixedPacing, expected_abandon_rate
+from ..dialer.power_dialer import PowerDialer
+from .dialing_service_stub import DialingServiceStub
+from .database_stub import DatabaseStub
+
+class TestFixedPacing(unittest.TestCase):
+    '''
+    Tests for FixedPacing class
+    '''
+
+    def test_ratio_is_constant(self):
+        '''
+        Testing that outcomes don't change the ratio
+        '''
+        pacing = FixedPacing(3)
+        pacing.record_outcome(CallState.FAILED)
+        self.assertEqual(3, pacing.leads_per_batch())
+
+    def test_invalid_ratio(self):
+        '''
+        Testing that ratio must be positive
+        '''
+        with self.assertRaises(ValueError):
+            FixedPacing(0)
+
+    def test_dialer_default(self):
+        '''
+        Testing that dialer uses DIAL_RATIO by default
+        '''
+        dialer = PowerDialer(None, None, 'agent1')
+        self.assertEqual(dialer.DIAL_RATIO, dialer.pacing.leads_per_batch())
+
+class TestEwmaPacing(unittest.TestCase):
+    '''
+    Tests for EwmaPacing class
+    '''
+
+    def test_expected_abandon_rate(self):
+        '''
+        Testing the abandon rate model
+        '''
+        self.assertEqual(0.0, expected_abandon_rate(0.0, 3))
+        self.assertAlmostEqual(0.0, expected_abandon_rate(0.5, 1))
+        # 2 leads, p=0.5: E[connects]=1, P(at least one)=0.75
+        self.assertAlmostEqual(0.25, expected_abandon_rate(0.5, 2))
+
+    def test_invalid_arguments(self):
+        '''
+        Testing argument validation
+        '''
+        with self.assertRaises(ValueError):
+            EwmaPacing(alpha=0)
+        with self.assertRaises(ValueError):
+            EwmaPacing(max_ratio=0)
+
+    def test_low_connect_rate_dials_more(self):
+        '''
+        Testing that the ratio grows when few calls are answered
+        '''
+        pacing = EwmaPacing(initial_connect_rate=0.5, alpha=0.2, max_abandon_rate=0.2)
+        ratio = pacing.leads_per_batch()
+        for _ in range(10):
+            pacing.record_outcome(CallState.DISCONNECTED)
+        self.assertLess(pacing.connect_rate, 0.5)
+        self.assertGreater(pacing.leads_per_batch(), ratio)
+
+    def test_high_connect_rate_dials_less(self):
+        '''
+        Testing that one lead per batch is dialed when almost every call is answered
+        '''
+        pacing = EwmaPacing(initial_connect_rate=0.5, alpha=0.5)
+        for _ in range(10):
+            pacing.record_outcome(CallState.CONNECTED)
+        self.assertEqual(1, pacing.leads_per_batch())
+
+    def test_realistic_connect_rates(self):
+        '''
+        Testing that batches grow above the fixed ratio at realistic connect rates
+        while customers are rarely abandoned
+        '''
+        for connect_rate, expected in ((0.1, 10), (0.2, 10), (0.3, 7), (0.5, 4)):
+            pacing = EwmaPacing(initial_connect_rate=connect_rate)
+            self.assertEqual(expected, pacing.leads_per_batch(), connect_rate)
+
+    def test_abandon_ceiling_limits_ratio(self):
+        '''
+        Testing that the ratio doesn't exceed the modelled ceiling
+        while the observed abandon rate is above it
+        '''
+        pacing = EwmaPacing(initial_connect_rate=0.2, target_connect_probability=0.99,
+                            max_abandon_rate=0.05, alpha=0.5)
+        self.assertEqual(10, pacing.leads_per_batch())
+        pacing.record_outcome(CallState.CONNECTED, abandoned=True)
+        pacing.connect_rate = 0.2
+        self.assertEqual(0.5, pacing.abandon_rate)
+        leads = pacing.leads_per_batch()
+        self.assertLessEqual(expected_abandon_rate(0.2, leads), 0.05)
+        self.assertGreater(expected_abandon_rate(0.2, leads + 1), 0.05)
+
+    def test_no_connects_dials_max_ratio(self):
+        '''
+        Testing that max_ratio leads are dialed when nothing connects
+        '''
+        pacing = EwmaPacing(initial_connect_rate=0.0, max_ratio=4)
+        self.assertEqual(4, pacing.leads_per_batch())
+        pacing = EwmaPacing(initial_connect_rate=0.01, max_ratio=4, max_abandon_rate=1)
+        self.assertEqual(4, pacing.leads_per_batch())
+
+    def test_dialer_records_abandoned_calls(self):
+        '''
+        Testing that a surplus connection is recorded as abandoned
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 10}
+        }
+        pacing = EwmaPacing(initial_connect_rate=0.5, alpha=0.5, max_abandon_rate=1,
+                            target_connect_probability=0.75)
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1',
+                             pacing=pacing)
+        dialer.on_agent_login()
+        dialer.connect()
+        for future in list(dialer.futures):
+            future.result()
+        self.assertEqual(2, pacing.outcomes)
+        self.assertAlmostEqual(0.5, pacing.abandon_rate)
+        self.assertAlmostEqual(0.875, pacing.connect_rate)
@@ -0,0 +1,25 @@
+'''
+Tests for phone module
+'''
+import unittest
+from ..dialer.phone import decode, encode
+
+class TestPhone(unittest.TestCase):
+    '''
+    Tests for phone module
+    '''
+
+    def test_round_trip(self):
+        '''
+        Testing that numbers survive encoding
+        '''
+        self.assertEqual(12123334444, encode('+12123334444'))
+        self.assertEqual('+12123334444', decode(encode('+12123334444')))
+
+    def test_invalid_numbers(self):
+        '''
+        Testing that numbers which can't be encoded are rejected
+        '''
+        for number in ('', '+', '+0123', '+1212-333', '+1234567890123456', '12123334444'):
+            with self.assertRaises(ValueError):
+                encode(number)
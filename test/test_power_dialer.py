@@ -2,6 +2,7 @@
 Tests for power_dialer module
 '''
 import unittest
+from concurrent.futures import wait
 from ..dialer.agent_state import AgentState
 from ..dialer.call_state import CallState
 from ..dialer.power_dialer import PowerDialer
@@ -284,10 +285,9 @@ class TestPowerDialer(unittest.TestCase):
 def wait_for_all_threads(dialer):
     '''
     helper utility
-    waits until all threads started in dialer.connect() terminate
+    waits until all dial attempts started in dialer.connect() terminate
     '''
-    for thread in dialer.threads:
-        thread.join()
+    wait(list(dialer.futures))
 
 class TestConcurrentConnections(unittest.TestCase):
     '''
@@ -429,3 +429,57 @@ class TestConcurrentConnections(unittest.TestCase):
         validate() # validate immediately after connect
         wait_for_all_threads(dialer)
         validate() # re-validate after all threads terminate
+
+    def test_start_connect_without_callback(self):
+        '''
+        Testing that start_connect returns immediately and the agent gets connected later
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 5}
+        }
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.start_connect()
+        self.assertEqual(dialer.agent_state, AgentState.WAITING)
+        wait_for_all_threads(dialer)
+        self.assertEqual(dialer.agent_state, AgentState.BUSY)
+        self.assertEqual(dialer.current_lead, '+12123334444')
+
+    def test_connect_database_fails_during_retry(self):
+        '''
+        Testing that an error fetching the next batch is reported to the caller of connect
+        and the agent stays AVAILABLE
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 5}
+        }
+        database = DatabaseStub(ctx)
+        fetch = database.get_lead_phone_number_to_dial
+        def failing_fetch():
+            if not database.numbers:
+                raise Exception('Database is down')
+            return fetch()
+        database.get_lead_phone_number_to_dial = failing_fetch
+        dialer = PowerDialer(database, DialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        with self.assertRaises(Exception) as cm:
+            dialer.connect()
+        self.assertEqual('Database is down', str(cm.exception))
+        self.assertEqual(dialer.agent_state, AgentState.AVAILABLE)
+
+    def test_connect_database_fails(self):
+        '''
+        Testing that an error fetching the first batch is raised by connect
+        and the agent doesn't stay WAITING
+        '''
+        database = DatabaseStub({})
+        def failing_fetch():
+            raise Exception('Database is down')
+        database.get_lead_phone_number_to_dial = failing_fetch
+        dialer = PowerDialer(database, DialingServiceStub({}), 'agent1')
+        dialer.on_agent_login()
+        with self.assertRaises(Exception) as cm:
+            dialer.connect()
+        self.assertEqual('Database is down', str(cm.exception))
+        self.assertEqual(dialer.agent_state, AgentState.AVAILABLE)
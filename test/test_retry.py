@@ -0,0 +1,130 @@
+'''
+Tests for retry module
+'''
+import random
+import unittest
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from ..dialer.power_dialer import PowerDialer
+from ..dialer.retry import RetryScheduler, TimerWheel
+from .async_stubs import AsyncDialingServiceStub, run
+from .database_stub import DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+
+class TestTimerWheel(unittest.TestCase):
+    '''
+    Tests for TimerWheel class
+    '''
+
+    def test_items_become_due_on_time(self):
+        '''
+        Testing that every item is returned by the first advance past its tick,
+        including items beyond the range of the last level
+        '''
+        rnd = random.Random(7)
+        wheel = TimerWheel(slots=4, levels=3)
+        pending = {}
+        now = 0
+        for item in range(2000):
+            if rnd.random() < 0.5:
+                now += rnd.randint(1, 20)
+                due = set(wheel.advance(now))
+                expected = {key for key, tick in pending.items() if tick <= now}
+                self.assertSetEqual(expected, due)
+                for key in due:
+                    del pending[key]
+            pending[item] = now + rnd.randint(-5, 200)
+            wheel.add(pending[item], item)
+            self.assertEqual(len(pending), len(wheel))
+        self.assertSetEqual(set(pending), set(wheel.advance(now + 1000)))
+        self.assertEqual(0, len(wheel))
+        # an empty wheel skips idle ticks at once
+        self.assertListEqual([], wheel.advance(10 ** 9))
+        self.assertEqual(10 ** 9, wheel.current)
+
+    def test_invalid_slots(self):
+        '''
+        Testing that the number of slots must be a power of two, and there must be
+        at least two levels
+        '''
+        for slots in (1, 3, 100):
+            with self.assertRaises(ValueError):
+                TimerWheel(slots=slots)
+        for levels in (0, 1):
+            with self.assertRaises(ValueError):
+                TimerWheel(levels=levels)
+
+class TestRetryScheduler(unittest.TestCase):
+    '''
+    Tests for RetryScheduler class and dialers reporting outcomes
+    '''
+
+    def setUp(self):
+        '''
+        Creates a scheduler with a fake clock
+        '''
+        self.now = 1000.0
+        self.database = DatabaseStub({'+12123334444': None, '+12123334445': None})
+        self.retries = RetryScheduler(self.database, clock=lambda: self.now)
+
+    def test_backoff_and_attempt_limit(self):
+        '''
+        Testing that a failed lead comes back after a doubling backoff until it runs out
+        of attempts, and that due retries are returned before new leads
+        '''
+        self.retries.record_outcome('+12123339999', CallState.FAILED)
+        self.assertEqual(1, len(self.retries))
+        self.now += 59
+        self.assertEqual('+12123334444', self.retries.get_lead_phone_number_to_dial())
+        self.now += 1
+        self.assertListEqual(['+12123339999', '+12123334445'],
+                             self.retries.get_lead_phone_numbers_to_dial(2))
+        self.retries.record_outcome('+12123339999', CallState.FAILED)
+        self.now += 119
+        self.assertIsNone(self.retries.get_lead_phone_number_to_dial())
+        self.now += 1
+        self.assertEqual('+12123339999', self.retries.get_lead_phone_number_to_dial())
+        self.retries.record_outcome('+12123339999', CallState.FAILED)
+        self.assertEqual(0, len(self.retries))
+        self.assertEqual(1, self.retries.exhausted)
+        self.now += 10000
+        self.assertIsNone(self.retries.get_lead_phone_number_to_dial())
+
+    def test_outcomes(self):
+        '''
+        Testing that connected leads are forgotten and outcomes outside the policy
+        are not retried
+        '''
+        self.retries.record_outcome('+12123339999', CallState.DISCONNECTED)
+        self.retries.record_outcome('+12123339999', CallState.CONNECTED)
+        self.retries.record_outcome('+12123339998', CallState.ALERTING)
+        self.assertEqual(0, len(self.retries))
+        retries = RetryScheduler(self.database, max_attempts=1)
+        retries.record_outcome('+12123339999', CallState.FAILED)
+        self.assertEqual(1, retries.exhausted)
+        with self.assertRaises(ValueError):
+            RetryScheduler(self.database, max_attempts=0)
+
+    def test_dialers_report_outcomes(self):
+        '''
+        Testing that PowerDialer and AsyncPowerDialer retry leads which failed
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED},
+            '+12123334445': {'state': CallState.CONNECTED}
+        }
+        dialer = PowerDialer(self.retries, DialingServiceStub(ctx), 'agent1',
+                             retries=self.retries)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334445', dialer.current_lead)
+        self.now += 60
+        self.assertEqual('+12123334444', self.retries.get_lead_phone_number_to_dial())
+        self.assertEqual(1, len(self.retries))
+
+        # the second attempt fails too, the third one is the last
+        self.retries.record_outcome('+12123334444', CallState.FAILED)
+        dialer = AsyncPowerDialer(self.retries, AsyncDialingServiceStub(ctx), 'agent2',
+                                  retries=self.retries)
+        self.assertEqual(CallState.FAILED, run(dialer.dialing_wrapper('+12123334444')))
+        self.assertEqual(1, self.retries.exhausted)
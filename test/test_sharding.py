@@ -0,0 +1,365 @@
+'''
+Tests for sharding module
+'''
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from ..dialer.call_state import CallState
+from ..dialer.lead_buffer import fetch_leads
+from ..dialer.journal import OutcomeJournal, read_journal
+from ..dialer.sharding import OutcomeSender, RemoteLeadSource, ShardedCampaign, run_shard, shard_of
+from .database_stub import DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+from .polling import wait_until
+
+LogInspector.setup_logging()
+
+NUMBERS = [f'+1212333{i:04}' for i in range(200)]
+
+def create_service():
+    '''
+    Creates the dialing service of a worker. Every call connects
+    '''
+    return DialingServiceStub({number: {'state': CallState.CONNECTED} for number in NUMBERS})
+
+# pylint: disable=too-few-public-methods
+class FailingDatabase:
+    '''
+    Database which raises an exception
+    '''
+    def get_lead_phone_number_to_dial(self):
+        '''
+        Raises an exception
+        '''
+        raise Exception('database is down')
+
+class ObservedLock:
+    '''
+    Lock which tells when a thread started waiting for it
+    '''
+    def __init__(self):
+        '''Constructor
+        '''
+        self.lock = threading.Lock()
+        self.waiting = threading.Event()
+
+    def __enter__(self):
+        self.waiting.set()
+        self.lock.acquire()
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+class TestShard(unittest.TestCase):
+    '''
+    Tests for the worker side, run in threads of the test process
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_shard_of(self):
+        '''
+        Testing that agents are spread over all shards and always land in the same one
+        '''
+        shards = {shard_of(f'agent{i}', 4) for i in range(100)}
+        self.assertSetEqual({0, 1, 2, 3}, shards)
+        self.assertEqual(shard_of('agent7', 4), shard_of('agent7', 4))
+
+    def test_worker_connects_agents(self): # pylint: disable=too-many-locals
+        '''
+        Testing that a worker connects its agents, reconnects them when their calls end
+        and reports outcomes in batches
+        '''
+        database = DatabaseStub({number: None for number in NUMBERS[:10]})
+        lead_requests = queue.Queue()
+        commands = queue.Queue()
+        outcomes = queue.Queue()
+        connection, worker_connection = multiprocessing.Pipe()
+        requested = []
+        def serve_leads():
+            while True:
+                request = lead_requests.get()
+                if request is None:
+                    return
+                requested.append(request)
+                connection.send(fetch_leads(database, request[1]))
+        options = {'lead_batch': 4, 'outcome_batch': 3, 'flush_interval': 0.01,
+                   'talk_seconds': None, 'idle_retry_seconds': 0.01}
+        threads = [threading.Thread(target=serve_leads),
+                   threading.Thread(target=run_shard, args=(
+                       0, ['agent0', 'agent1'], create_service, lead_requests,
+                       worker_connection, commands, outcomes, options))]
+        for thread in threads:
+            thread.start()
+        records = []
+        def count_busy():
+            while not outcomes.empty():
+                records.extend(outcomes.get()[1])
+            return sum(record['type'] == 'transition' and record['state'] == 'BUSY'
+                       for record in records)
+        self.assertTrue(wait_until(lambda: count_busy() == 2))
+        commands.put(('call_ended', 'agent0'))
+        self.assertTrue(wait_until(lambda: count_busy() == 3))
+        commands.put(('call_ended', 'agent3'))
+        commands.put(('stop',))
+        threads[1].join()
+        lead_requests.put(None)
+        threads[0].join()
+        final = None
+        while not outcomes.empty():
+            _, batch, final = outcomes.get()
+            records.extend(batch)
+        self.assertTrue(final)
+        dials = [record['lead'] for record in records if record['type'] == 'dial']
+        self.assertEqual(len(dials), len(set(dials)))
+        self.assertTrue(all(count >= 4 for _, count in requested))
+        self.assertListEqual(
+            ['Command (\'call_ended\', \'agent3\') failed in shard 0. Error: "\'agent3\'"'],
+            LogInspector.get_messages())
+        connection.close()
+        worker_connection.close()
+
+    def test_remote_lead_source(self):
+        '''
+        Testing that leads are requested in batches and handed out from the buffer
+        '''
+        lead_requests = queue.Queue()
+        connection, worker_connection = multiprocessing.Pipe()
+        leads = RemoteLeadSource(1, lead_requests, worker_connection, batch_size=3)
+        connection.send(['+12123334444', '+12123334445', '+12123334446'])
+        self.assertEqual('+12123334444', leads.get_lead_phone_number_to_dial())
+        self.assertEqual((1, 3), lead_requests.get_nowait())
+        self.assertListEqual(['+12123334445', '+12123334446'],
+                             leads.get_lead_phone_numbers_to_dial(2))
+        self.assertTrue(lead_requests.empty())
+        connection.send([])
+        self.assertIsNone(leads.get_lead_phone_number_to_dial())
+        connection.close()
+        worker_connection.close()
+
+    def test_buffered_leads_while_requesting(self):
+        '''
+        Testing that buffered leads are handed out while another thread waits for leads
+        '''
+        lead_requests = queue.Queue()
+        connection, worker_connection = multiprocessing.Pipe()
+        leads = RemoteLeadSource(1, lead_requests, worker_connection, batch_size=2)
+        connection.send(['+12123334444', '+12123334445'])
+        self.assertEqual('+12123334444', leads.get_lead_phone_number_to_dial())
+        lead_requests.get_nowait()
+        batch = []
+        thread = threading.Thread(target=lambda: batch.extend(
+            leads.get_lead_phone_numbers_to_dial(3)))
+        thread.start()
+        self.assertEqual((1, 2), lead_requests.get(timeout=5))
+        self.assertEqual('+12123334445', leads.get_lead_phone_number_to_dial())
+        connection.send(['+12123334446', '+12123334447', '+12123334448'])
+        thread.join()
+        self.assertListEqual(['+12123334446', '+12123334447', '+12123334448'], batch)
+        leads.request_lock = ObservedLock()
+        batch.clear()
+        with leads.request_lock.lock:
+            thread = threading.Thread(target=lambda: batch.extend(
+                leads.get_lead_phone_numbers_to_dial(1)))
+            thread.start()
+            leads.request_lock.waiting.wait(5)
+            leads.buffer.append('+12123334449')
+        thread.join()
+        self.assertListEqual(['+12123334449'], batch)
+        self.assertTrue(lead_requests.empty())
+        connection.close()
+        worker_connection.close()
+
+    def test_worker_ends_calls(self):
+        '''
+        Testing that a worker ends calls after talk_seconds and sends incomplete batches
+        after flush_interval
+        '''
+        lead_requests = queue.Queue()
+        commands = queue.Queue()
+        outcomes = queue.Queue()
+        connection, worker_connection = multiprocessing.Pipe()
+        options = {'lead_batch': 1, 'outcome_batch': 1000, 'flush_interval': 0.01,
+                   'talk_seconds': 0.01, 'idle_retry_seconds': 0.01}
+        leads = NUMBERS[:3]
+        def serve_leads():
+            # one lead per request, then none
+            while lead_requests.get() is not None:
+                connection.send(leads[:1])
+                del leads[:1]
+        threads = [threading.Thread(target=serve_leads),
+                   threading.Thread(target=run_shard, args=(
+                       0, ['agent0'], create_service, lead_requests, worker_connection,
+                       commands, outcomes, options))]
+        for thread in threads:
+            thread.start()
+        records = []
+        def count_calls_ended():
+            while not outcomes.empty():
+                records.extend(outcomes.get()[1])
+            return sum(record['type'] == 'transition' and record['from'] == 'BUSY'
+                       for record in records)
+        self.assertTrue(wait_until(lambda: count_calls_ended() == 3))
+        commands.put(('stop',))
+        threads[1].join()
+        lead_requests.put(None)
+        threads[0].join()
+        connection.close()
+        worker_connection.close()
+
+    def test_outcome_sender(self):
+        '''
+        Testing that records are sent in batches and empty batches are sent only when final
+        '''
+        outcomes = queue.Queue()
+        sender = OutcomeSender(2, outcomes, batch_size=2)
+        sender.flush()
+        self.assertTrue(outcomes.empty())
+        sender.append({'index': 0})
+        sender.append({'index': 1})
+        sender.append({'index': 2})
+        self.assertTupleEqual((2, [{'index': 0}, {'index': 1}], False), outcomes.get_nowait())
+        sender.flush()
+        self.assertTupleEqual((2, [{'index': 2}], False), outcomes.get_nowait())
+        sender.flush(final=True)
+        self.assertTupleEqual((2, [], True), outcomes.get_nowait())
+
+class TestShardedCampaign(unittest.TestCase):
+    '''
+    Tests for ShardedCampaign class, running real worker processes
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_agents_are_connected_by_workers(self):
+        '''
+        Testing that workers connect agents with leads of the parent process
+        and report outcomes to its journal
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'outcomes.jsonl')
+            journal = OutcomeJournal(path)
+            database = DatabaseStub({number: None for number in NUMBERS})
+            campaign = ShardedCampaign(database, create_service,
+                                       [f'agent{i}' for i in range(4)], shards=2,
+                                       lead_batch=8, talk_seconds=0.01,
+                                       idle_retry_seconds=0.01, journal=journal)
+            campaign.start()
+            try:
+                self.assertTrue(wait_until(lambda: campaign.stats()['connects'] >= 8, 10))
+                campaign.call_ended('agent0')
+            finally:
+                campaign.stop()
+            journal.close()
+            stats = campaign.stats()
+            self.assertEqual(4, stats['agents'])
+            self.assertEqual(2, stats['shards'])
+            self.assertGreaterEqual(stats['dials'], stats['connects'])
+            self.assertEqual(stats['dials'], stats['outcomes']['CONNECTED'])
+            self.assertGreater(stats['dials_per_second'], 0)
+            records = list(read_journal(path))
+            self.assertEqual(stats['dials'],
+                             sum(record['type'] == 'dial' for record in records))
+        self.assertListEqual([], LogInspector.get_messages())
+
+    def test_outcomes_are_aggregated(self):
+        '''
+        Testing that dial attempts are counted by outcome and BUSY transitions as connects
+        '''
+        campaign = ShardedCampaign(DatabaseStub({}), create_service, ['agent0'], shards=1)
+        campaign.record([
+            {'type': 'dial', 'state': 'FAILED'},
+            {'type': 'dial', 'state': 'CONNECTED'},
+            {'type': 'transition', 'state': 'WAITING'},
+            {'type': 'transition', 'state': 'BUSY'},
+        ])
+        stats = campaign.stats()
+        self.assertEqual(2, stats['dials'])
+        self.assertEqual(1, stats['connects'])
+        self.assertDictEqual({'FAILED': 1, 'CONNECTED': 1}, stats['outcomes'])
+
+    def test_dead_worker(self):
+        '''
+        Testing that stop returns when a worker died without reporting its outcomes
+        '''
+        campaign = ShardedCampaign(DatabaseStub({}), create_service, ['agent0'], shards=1)
+        self.assertEqual(0, campaign.stats()['dials_per_second'])
+        campaign.start()
+        campaign.processes[0].terminate()
+        campaign.stop()
+        self.assertListEqual(['Workers exited without reporting all outcomes'],
+                             LogInspector.get_messages())
+
+    def test_lead_fetch_error(self):
+        '''
+        Testing that a failing database is logged and answered with no leads
+        '''
+        campaign = ShardedCampaign(FailingDatabase(), create_service, ['agent0'], shards=1)
+        campaign.lead_requests = queue.Queue()
+        connection, worker_connection = multiprocessing.Pipe()
+        campaign.connections = [connection]
+        campaign.lead_requests.put((0, 2))
+        campaign.lead_requests.put(None)
+        campaign.serve_leads()
+        self.assertListEqual([], worker_connection.recv())
+        self.assertListEqual(['Fetching leads for shard 0 failed. Error: "database is down"'],
+                             LogInspector.get_messages())
+        connection.close()
+        worker_connection.close()
+
+    def test_unsendable_leads(self):
+        '''
+        Testing that a worker is answered with no leads when its leads can't be sent,
+        so it doesn't wait for them forever
+        '''
+        database = DatabaseStub({})
+        database.get_lead_phone_numbers_to_dial = lambda count: [threading.Lock()]
+        campaign = ShardedCampaign(database, create_service, ['agent0'], shards=1)
+        campaign.lead_requests = queue.Queue()
+        connection, worker_connection = multiprocessing.Pipe()
+        campaign.connections = [connection]
+        campaign.lead_requests.put((0, 1))
+        campaign.lead_requests.put(None)
+        campaign.serve_leads()
+        self.assertTrue(worker_connection.poll(1))
+        self.assertListEqual([], worker_connection.recv())
+        self.assertEqual(1, len(LogInspector.get_messages()))
+        self.assertIn('Sending 1 leads to shard 0 failed', LogInspector.get_messages()[0])
+        connection.close()
+        worker_connection.close()
+
+    def test_lead_send_error(self):
+        '''
+        Testing that a worker which can't be sent leads is logged
+        and the other workers are still served
+        '''
+        campaign = ShardedCampaign(DatabaseStub({'+12123334444': None}), create_service,
+                                   ['agent0'], shards=2)
+        campaign.lead_requests = queue.Queue()
+        connections = [multiprocessing.Pipe() for _ in range(2)]
+        campaign.connections = [connection for connection, _ in connections]
+        connections[0][0].close()
+        campaign.lead_requests.put((0, 1))
+        campaign.lead_requests.put((1, 1))
+        campaign.lead_requests.put(None)
+        campaign.serve_leads()
+        self.assertListEqual([], connections[1][1].recv())
+        self.assertListEqual(['Sending 1 leads to shard 0 failed. Error: "handle is closed"',
+                              'Sending 0 leads to shard 0 failed. Error: "handle is closed"'],
+                             LogInspector.get_messages())
+        for connection, worker_connection in connections[1:]:
+            connection.close()
+            worker_connection.close()
+        connections[0][1].close()
@@ -0,0 +1,153 @@
+'''
+Tests for simulation module
+'''
+import unittest
+from ..dialer.agent_state import AgentState
+from ..dialer.call_state import CallState
+from ..dialer.pacing import EwmaPacing
+from ..dialer.simulation import (ShiftSimulation, SimulatedDatabase, SimulatedDialingService,
+                                 SimulatedExecutor, Simulation)
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestSimulation(unittest.TestCase):
+    '''
+    Tests for the event queue and simulated collaborators
+    '''
+
+    def test_events_run_in_virtual_time(self):
+        '''
+        Testing that events run in due order without waiting, and cancelled ones don't run
+        '''
+        simulation = Simulation()
+        calls = []
+        simulation.schedule(3600, calls.append, 'late')
+        simulation.schedule(20, lambda: calls.append(simulation.time()))
+        simulation.schedule(10, calls.append, 'cancelled').cancel()
+        simulation.schedule(5, calls.append, 'first')
+        self.assertEqual(2, simulation.run(until=60))
+        self.assertListEqual(['first', 20], calls)
+        self.assertEqual(60, simulation.time())
+        self.assertEqual(1, simulation.run())
+        self.assertEqual(3600, simulation.now)
+        self.assertEqual(3, simulation.events)
+
+    def test_executor(self):
+        '''
+        Testing that jobs run after their delay and complete their futures
+        '''
+        simulation = Simulation()
+        calls = []
+        executor = SimulatedExecutor(simulation, lambda func, args: args[0])
+        future = executor.submit(calls.append, 7)
+        future.add_done_callback(calls.append)
+        self.assertFalse(future.done())
+        simulation.run()
+        self.assertListEqual([7, future], calls)
+        self.assertEqual(7, simulation.now)
+        future.add_done_callback(calls.append)
+        self.assertListEqual([7, future, future], calls)
+        executor = SimulatedExecutor(simulation)
+        self.assertTrue(executor.submit(calls.clear) is not None)
+        simulation.run()
+        self.assertEqual(7, simulation.now)
+        self.assertListEqual([], calls)
+
+    def test_dialing_service(self):
+        '''
+        Testing outcomes of calls and cancellation
+        '''
+        simulation = Simulation()
+        with self.assertRaises(ValueError):
+            SimulatedDialingService(simulation, answer_rate=0.8, fail_rate=0.5)
+        service = SimulatedDialingService(simulation, answer_rate=0.3, fail_rate=0.3)
+        for i in range(100):
+            self.assertGreater(service.ring(str(i)), 0)
+        simulation.now = 1
+        service.cancel('agent1', '0')
+        service.cancel('agent1', '0')
+        service.cancel('agent1', 'unknown')
+        self.assertNotIn('0', service.calls)
+        self.assertEqual(1, service.outcomes[CallState.FAILED])
+        self.assertEqual(1, service.line_seconds)
+        for i in range(1, 100):
+            service.dial('agent1', str(i))
+        self.assertSetEqual({CallState.CONNECTED, CallState.FAILED, CallState.DISCONNECTED},
+                            set(service.outcomes))
+        self.assertEqual(1, service.cancelled)
+
+    def test_database(self):
+        '''
+        Testing that leads are distinct and run out if limited
+        '''
+        database = SimulatedDatabase(3)
+        self.assertListEqual(['+12120000000', '+12120000001'],
+                             database.get_lead_phone_numbers_to_dial(2))
+        self.assertListEqual(['+12120000002'], database.get_lead_phone_numbers_to_dial(2))
+        self.assertListEqual([], database.get_lead_phone_numbers_to_dial(2))
+
+class TestShiftSimulation(unittest.TestCase):
+    '''
+    Tests for ShiftSimulation class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_shift(self):
+        '''
+        Testing that a shift runs through real agent state transitions and is repeatable
+        '''
+        stats = ShiftSimulation(agents=20, shift_seconds=3600).run()
+        self.assertEqual(3600, stats['virtual_seconds'])
+        self.assertGreater(stats['connects'], 100)
+        self.assertEqual(20, stats['transitions']['UNAVAILABLE->AVAILABLE'])
+        self.assertEqual(stats['connects'], stats['transitions']['WAITING->BUSY'])
+        self.assertGreaterEqual(stats['dials_per_connect'], 1)
+        self.assertGreater(stats['utilization'], 0.5)
+        self.assertLess(stats['utilization'], 1)
+        self.assertDictEqual(stats, ShiftSimulation(agents=20, shift_seconds=3600).run())
+
+    def test_calls_dont_leak(self):
+        '''
+        Testing that every call ends, including calls cancelled or timed out
+        before their attempt was dialed
+        '''
+        simulation = ShiftSimulation(agents=10, shift_seconds=1800, ring_timeout=20)
+        stats = simulation.run()
+        self.assertGreater(stats['cancelled'], 0)
+        simulation.simulation.run()
+        self.assertDictEqual({}, simulation.service.calls)
+        stats = simulation.stats()
+        self.assertEqual(stats['dials'], sum(stats['outcomes'].values()))
+
+    def test_shift_ends(self):
+        '''
+        Testing that agents log out after the shift and retry when leads run out
+        '''
+        # every call is answered, so one lead per batch connects
+        simulation = ShiftSimulation(agents=2, shift_seconds=600, total_leads=4,
+                                     handoff_grace_seconds=2, answer_rate=1, fail_rate=0,
+                                     pacing_factory=lambda: EwmaPacing(initial_connect_rate=0.95))
+        stats = simulation.run()
+        self.assertEqual(4, stats['connects'])
+        simulation.simulation.run()
+        self.assertListEqual([AgentState.UNAVAILABLE] * 2,
+                             [dialer.agent_state for dialer in simulation.dialers])
+        self.assertEqual(2, simulation.stats()['transitions']['AVAILABLE->UNAVAILABLE'])
+
+    def test_connect_error_propagates(self):
+        '''
+        Testing that errors of connect stop the simulation
+        '''
+        simulation = ShiftSimulation(agents=0)
+        with self.assertRaises(ValueError):
+            simulation.on_connect_done(None, ValueError('Broken'))
+        stats = simulation.run()
+        self.assertEqual(0, stats['utilization'])
+        self.assertIsNone(stats['dials_per_connect'])
+        self.assertIsNone(stats['mean_wait_seconds'])
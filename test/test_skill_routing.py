@@ -0,0 +1,126 @@
+'''
+Tests for skill_routing module
+'''
+import unittest
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from ..dialer.lead_buffer import fetch_leads
+from ..dialer.power_dialer import PowerDialer
+from ..dialer.skill_routing import SkillDispatcher
+from .async_stubs import AsyncDialingServiceStub, AsyncSkillDispatcher, run
+from .database_stub import DatabaseStub
+from .dialing_service_stub import DialingServiceStub
+
+class TestSkillDispatcher(unittest.TestCase):
+    '''
+    Tests for SkillDispatcher class
+    '''
+
+    def test_routing(self):
+        '''
+        Testing that agents only get leads whose skills they have,
+        the most specific leads first
+        '''
+        dispatcher = SkillDispatcher()
+        dispatcher.add('+12123334444')
+        dispatcher.add_many(['+12123334445', '+12123334446'], ['es'])
+        dispatcher.add('+12123334447', ['es', 'mortgage'])
+        dispatcher.add('+12123334448', ['fr'])
+        dispatcher.add_many([], ['de'])
+        self.assertEqual(5, len(dispatcher))
+        self.assertListEqual(['+12123334447', '+12123334445'],
+                             dispatcher.get_lead_phone_numbers_for_skills({'es', 'mortgage'}, 2))
+        self.assertListEqual(['+12123334446', '+12123334444'],
+                             dispatcher.get_lead_phone_numbers_for_skills(['es'], 5))
+        self.assertEqual(1, len(dispatcher))
+        self.assertListEqual([], dispatcher.get_lead_phone_numbers_for_skills({'de'}, 1))
+        self.assertIsNone(dispatcher.get_lead_phone_number_to_dial())
+        self.assertListEqual(['+12123334448'],
+                             dispatcher.get_lead_phone_numbers_for_skills(['fr', 'es'], 5))
+        with self.assertRaises(ValueError):
+            dispatcher.add('unknown')
+
+    def test_queues_refill(self):
+        '''
+        Testing that agents whose queues emptied get leads added later
+        '''
+        dispatcher = SkillDispatcher()
+        dispatcher.add('+12123334444', ['es'])
+        self.assertListEqual(['+12123334444'],
+                             dispatcher.get_lead_phone_numbers_for_skills(['es'], 5))
+        self.assertListEqual([], dispatcher.get_lead_phone_numbers_for_skills(['es'], 5))
+        dispatcher.add('+12123334446', ['es'])
+        dispatcher.add('+12123334445')
+        dispatcher.add('+12123334447', ['es', 'mortgage'])
+        dispatcher.add('+12123334448', ['de'])
+        self.assertListEqual(['+12123334446', '+12123334445'],
+                             dispatcher.get_lead_phone_numbers_for_skills(['es'], 5))
+        self.assertEqual('+12123334447', fetch_leads(dispatcher, 5, {'es', 'mortgage'})[0])
+        self.assertListEqual([], fetch_leads(dispatcher, 5))
+        dispatcher.add('+12123334449')
+        self.assertEqual('+12123334449', dispatcher.get_lead_phone_number_to_dial())
+        # databases which don't route by skills ignore them
+        self.assertListEqual(['+12123334444'],
+                             fetch_leads(DatabaseStub({'+12123334444': None}), 5, {'es'}))
+
+    def test_many_combinations(self):
+        '''
+        Testing routing of hundreds of skill combinations
+        '''
+        dispatcher = SkillDispatcher()
+        languages = [f'language{i}' for i in range(20)]
+        products = [f'product{i}' for i in range(20)]
+        for i, language in enumerate(languages):
+            for j, product in enumerate(products):
+                dispatcher.add(f'+1212{i:03}{j:04}', [language, product])
+        self.assertEqual(400, len(dispatcher.queues))
+        leads = dispatcher.get_lead_phone_numbers_for_skills(
+            ['language3', 'product5', 'product6'], 5)
+        self.assertListEqual(['+12120030005', '+12120030006'], leads)
+        self.assertEqual(398, len(dispatcher))
+
+class TestSkilledDialers(unittest.TestCase):
+    '''
+    Tests for dialers with skills
+    '''
+
+    def setUp(self):
+        '''
+        Creates a dispatcher with leads requiring different languages
+        '''
+        self.ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334445': {'state': CallState.FAILED},
+            '+12123334446': {'state': CallState.CONNECTED},
+        }
+        self.dispatcher = SkillDispatcher()
+        self.dispatcher.add('+12123334444', ['fr'])
+        self.dispatcher.add('+12123334445', ['es'])
+        self.dispatcher.add('+12123334446', ['es'])
+
+    def test_power_dialer(self):
+        '''
+        Testing that PowerDialer connects an agent with a lead requiring his skills
+        '''
+        dialer = PowerDialer(self.dispatcher, DialingServiceStub(self.ctx), 'agent1',
+                             skills=['es'])
+        self.assertEqual(frozenset(['es']), dialer.skills)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334446', dialer.current_lead)
+        self.assertEqual(1, len(self.dispatcher))
+
+    def test_async_power_dialer(self):
+        '''
+        Testing that AsyncPowerDialer connects an agent with a lead requiring his skills
+        '''
+        dispatcher = AsyncSkillDispatcher()
+        dispatcher.add('+12123334444', ['fr'])
+        dispatcher.add('+12123334445', ['es'])
+        dispatcher.add('+12123334446', ['es'])
+        dialer = AsyncPowerDialer(dispatcher, AsyncDialingServiceStub(self.ctx), 'agent1',
+                                  skills=['fr'])
+        dialer.on_agent_login()
+        run(dialer.connect())
+        self.assertEqual('+12123334444', dialer.current_lead)
+        self.assertEqual(2, len(dispatcher.stub))
@@ -0,0 +1,188 @@
+'''
+Tests for suppression module and screening of leads against do-not-call lists
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_state import CallState
+from ..dialer.metrics import DEFAULT_METRICS
+from ..dialer.pacing import FixedPacing
+from ..dialer.power_dialer import PowerDialer
+from ..dialer.suppression import DncIndex, SuppressionList, write_dnc_file
+from .async_stubs import AsyncDatabaseStub, AsyncDialingServiceStub, run
+from .database_stub import BulkDatabaseStub
+from .dialing_service_stub import DialingServiceStub
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestDncIndex(unittest.TestCase):
+    '''
+    Tests for DNC files and DncIndex class
+    '''
+
+    def setUp(self):
+        '''
+        Creates a directory for DNC files
+        '''
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'national.dnc')
+
+    def tearDown(self):
+        '''
+        Removes the DNC files
+        '''
+        shutil.rmtree(self.directory)
+
+    def test_lookup(self):
+        '''
+        Testing that listed numbers are found, whatever their formatting
+        '''
+        write_dnc_file(self.path, ['+12123334449', '+1 (212) 333-4444', '+12123334444'])
+        self.assertEqual(16, os.path.getsize(self.path))
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        index = DncIndex(self.path)
+        self.assertEqual(2, len(index))
+        self.assertIn('+12123334444', index)
+        self.assertIn('+1 212 333 4449', index)
+        self.assertNotIn('+12123334440', index)
+        self.assertNotIn('+19999999999', index)
+        self.assertNotIn('operator', index)
+        index.close()
+        index.close()
+        self.assertEqual(0, len(index))
+
+    def test_invalid_numbers_are_rejected(self):
+        '''
+        Testing that a list with numbers which are not E.164 isn't written
+        '''
+        write_dnc_file(self.path, ['+12123334444'])
+        with self.assertRaises(ValueError) as cm:
+            write_dnc_file(self.path, ['+12123334449', 'operator', '', '+0123', 'x'])
+        self.assertEqual('4 numbers are not valid E.164 phone numbers: "operator", "", "+0123"',
+                         str(cm.exception))
+        self.assertIn('+12123334444', DncIndex(self.path))
+
+    def test_empty_and_invalid_files(self):
+        '''
+        Testing that an empty file lists nothing and a file of wrong size is rejected
+        '''
+        write_dnc_file(self.path, [])
+        index = DncIndex(self.path)
+        self.assertEqual(0, len(index))
+        self.assertNotIn('+12123334444', index)
+        with open(self.path, 'wb') as output:
+            output.write(b'12345')
+        with self.assertRaises(ValueError):
+            DncIndex(self.path)
+
+class TestSuppressionList(unittest.TestCase):
+    '''
+    Tests for SuppressionList class and dialers screening leads
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage and creates two DNC files
+        '''
+        LogInspector.reset_buffer()
+        self.directory = tempfile.mkdtemp()
+        self.national = os.path.join(self.directory, 'national.dnc')
+        self.internal = os.path.join(self.directory, 'internal.dnc')
+        write_dnc_file(self.national, ['+12123334444'])
+        write_dnc_file(self.internal, ['+12123334445'])
+        self.suppression = SuppressionList([self.national, self.internal])
+
+    def tearDown(self):
+        '''
+        Stops the watcher and removes the DNC files
+        '''
+        self.suppression.stop()
+        shutil.rmtree(self.directory)
+
+    def test_screen(self):
+        '''
+        Testing that numbers of all lists, and numbers which can't be checked, are screened out
+        '''
+        numbers = ['+12123334449', '+12123334444', 'operator', '+12123334445', '+1 212 333-4448']
+        self.assertListEqual(['+12123334449', '+1 212 333-4448'],
+                             self.suppression.screen(numbers))
+        self.assertTrue(self.suppression.is_suppressed('+1 (212) 333-4445'))
+        self.assertTrue(self.suppression.is_suppressed('operator'))
+
+    def test_refresh(self):
+        '''
+        Testing that a replaced file is reloaded and a broken one keeps the previous index
+        '''
+        self.assertFalse(self.suppression.refresh())
+        old_index = self.suppression.indexes[0]
+        write_dnc_file(self.national, ['+12123334446'])
+        self.assertTrue(self.suppression.refresh())
+        self.assertFalse(self.suppression.is_suppressed('+12123334444'))
+        self.assertTrue(self.suppression.is_suppressed('+12123334446'))
+        # lookups which still hold the old index aren't affected
+        self.assertIn('+12123334444', old_index)
+
+        with open(self.national + '.tmp', 'wb') as output:
+            output.write(b'12345')
+        os.replace(self.national + '.tmp', self.national)
+        self.assertFalse(self.suppression.refresh())
+        self.assertTrue(self.suppression.is_suppressed('+12123334446'))
+        self.assertListEqual(
+            [f'Reloading DNC file "{self.national}" failed. Error: '
+             f'""{self.national}" is not a DNC file, its size is not a multiple of 8"'],
+            LogInspector.get_messages())
+
+    def test_watcher(self):
+        '''
+        Testing that the watcher thread picks replaced files up
+        '''
+        self.suppression.start(0.01)
+        write_dnc_file(self.internal, ['+12123334446'])
+        for _ in range(500):
+            if self.suppression.is_suppressed('+12123334446'):
+                break
+            self.suppression.stopping.wait(0.01)
+        self.assertTrue(self.suppression.is_suppressed('+12123334446'))
+        self.suppression.stop()
+        self.assertIsNone(self.suppression.thread)
+
+    def test_dialer_skips_suppressed_leads(self):
+        '''
+        Testing that PowerDialer never dials suppressed numbers and fetches more instead
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334445': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.CONNECTED}
+        }
+        database = BulkDatabaseStub(ctx)
+        service = DialingServiceStub(ctx)
+        suppressed = DEFAULT_METRICS.suppressed_leads.value
+        dialer = PowerDialer(database, service, 'agent1', pacing=FixedPacing(2),
+                             suppression=self.suppression)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual('+12123334449', dialer.current_lead)
+        self.assertEqual(1, dialer.dials)
+        self.assertEqual(2, DEFAULT_METRICS.suppressed_leads.value - suppressed)
+        self.assertEqual(2, database.round_trips)
+
+    def test_async_dialer_skips_suppressed_leads(self):
+        '''
+        Testing that AsyncPowerDialer never dials suppressed numbers and fetches more instead
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED},
+            '+12123334445': {'state': CallState.CONNECTED},
+            '+12123334449': {'state': CallState.CONNECTED}
+        }
+        database = AsyncDatabaseStub(ctx)
+        service = AsyncDialingServiceStub(ctx)
+        dialer = AsyncPowerDialer(database, service, 'agent1', suppression=self.suppression)
+        dialer.on_agent_login()
+        run(dialer.connect())
+        self.assertEqual('+12123334449', dialer.current_lead)
+        self.assertEqual(1, len(dialer.tasks))
@@ -0,0 +1,281 @@
+'''
+Tests for timeouts module and deadlines of connect
+'''
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import wait
+from ..dialer.agent_state import AgentEvent, AgentState
+from ..dialer.async_power_dialer import AsyncPowerDialer
+from ..dialer.call_data import CallData
+from ..dialer.call_state import CallState
+from ..dialer.dial_executor import DialExecutor
+from ..dialer.pacing import FixedPacing
+from ..dialer.power_dialer import PowerDialer
+from ..dialer.timeouts import TimeoutScheduler, get_default_scheduler
+from .async_stubs import AsyncDatabaseStub, AsyncDialingServiceStub
+from .database_stub import DatabaseStub
+from .dialing_service_stub import (CancellableDialingServiceStub, DialingServiceStub,
+                                   RecordingDialingServiceStub)
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestTimeoutScheduler(unittest.TestCase):
+    '''
+    Tests for TimeoutScheduler class
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_callbacks_run_in_due_order(self):
+        '''
+        Testing that callbacks run in order of due time, and cancelled ones don't run
+        '''
+        scheduler = TimeoutScheduler()
+        done = threading.Event()
+        calls = []
+        scheduler.schedule(0.03, done.set)
+        scheduler.schedule(0.02, calls.append, 'second')
+        scheduler.schedule(0.01, calls.append, 'cancelled').cancel()
+        scheduler.schedule(0.001, calls.append, 'first')
+        self.assertTrue(done.wait(2))
+        self.assertEqual(['first', 'second'], calls)
+
+    def test_idle_scheduler_wakes_up(self):
+        '''
+        Testing that a callback scheduled after the thread ran out of work still runs
+        '''
+        scheduler = TimeoutScheduler()
+        first = threading.Event()
+        second = threading.Event()
+        scheduler.schedule(0, first.set)
+        self.assertTrue(first.wait(2))
+        time.sleep(0.01) # let the thread wait on the empty heap
+        scheduler.schedule(0, second.set)
+        self.assertTrue(second.wait(2))
+
+    def test_failing_callback_is_logged(self):
+        '''
+        Testing that an exception raised by a callback is logged and the thread survives
+        '''
+        scheduler = TimeoutScheduler()
+        done = threading.Event()
+        def fail():
+            raise Exception('Broken callback')
+        scheduler.schedule(0, fail)
+        scheduler.schedule(0.01, done.set)
+        self.assertTrue(done.wait(2))
+        self.assertListEqual(['Timeout callback failed. Error: "Broken callback"'],
+                             LogInspector.get_messages())
+
+    def test_default_scheduler_is_shared(self):
+        '''
+        Testing that dialers without an explicit scheduler share the same one
+        '''
+        dialer = PowerDialer(None, None, 'agent1')
+        self.assertIs(get_default_scheduler(), dialer.timer)
+
+class TestDeadlines(unittest.TestCase):
+    '''
+    Tests ring timeouts and deadlines of connect
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage before each test
+        '''
+        LogInspector.reset_buffer()
+
+    def test_ring_timeout_fails_hanging_attempts(self):
+        '''
+        Testing that hanging attempts count as FAILED and the next batch is dialed
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334449': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        service = CancellableDialingServiceStub(ctx)
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1', ring_timeout=0.02)
+        started = time.monotonic()
+        dialer.on_agent_login()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual('+12123334447', dialer.current_lead)
+        self.assertEqual(AgentState.BUSY, dialer.agent_state)
+        self.assertCountEqual(['+12123334444', '+12123334449'], service.cancelled)
+        self.assertCountEqual([
+            'Dialing "+12123334444" for agent "agent1" timed out',
+            'Dialing "+12123334449" for agent "agent1" timed out',
+        ], LogInspector.get_messages())
+
+    def test_next_batch_isnt_dialed_by_scheduler(self):
+        '''
+        Testing that the next batch after a timed out one is fetched and dialed by
+        a worker thread, not by the scheduler thread shared by all dialers
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        threads = []
+        database = DatabaseStub(ctx)
+        fetch = database.get_lead_phone_number_to_dial
+        def get_lead_phone_number_to_dial():
+            threads.append(threading.current_thread().name)
+            return fetch()
+        database.get_lead_phone_number_to_dial = get_lead_phone_number_to_dial
+        dialer = PowerDialer(database, CancellableDialingServiceStub(ctx), 'agent1',
+                             pacing=FixedPacing(1), ring_timeout=0.02)
+        dialer.on_agent_login()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertEqual('+12123334447', dialer.current_lead)
+        self.assertEqual(2, len(threads))
+        self.assertNotIn('timeouts', threads)
+
+    def test_timeouts_of_a_saturated_pool(self):
+        '''
+        Testing that attempts time out when all worker threads are busy with hanging attempts,
+        and attempts which timed out while they waited for a worker are never dialed
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED, 'waitMs': 300},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 300},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        executor = DialExecutor(max_workers=2)
+        service = RecordingDialingServiceStub(ctx)
+        dialer = PowerDialer(DatabaseStub(ctx), service, 'agent1', executor=executor,
+                             pacing=FixedPacing(3), ring_timeout=0.05)
+        dialer.on_agent_login()
+        started = time.monotonic()
+        dialer.connect()
+        # the timed out batch is resolved once a worker thread frees up
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertEqual(3, len(LogInspector.get_messages()))
+        wait(list(dialer.futures))
+        executor.shutdown()
+        self.assertCountEqual(['+12123334444', '+12123334449'], service.dialed)
+
+    def test_timers_are_cancelled_after_connect(self):
+        '''
+        Testing that losing attempts don't time out after the batch connected
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 5},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 40}
+        }
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1',
+                             ring_timeout=0.02)
+        dialer.on_agent_login()
+        dialer.connect()
+        wait(list(dialer.futures))
+        self.assertEqual('+12123334444', dialer.current_lead)
+        self.assertIsNone(dialer.call_data) # the batch was recycled
+        self.assertListEqual([], LogInspector.get_messages())
+
+    def test_timeout_without_cancel(self):
+        '''
+        Testing that a timed out attempt completes even if it can't be cancelled
+        and its late result is ignored
+        '''
+        ctx = {'+12123334444': {'state': CallState.CONNECTED, 'waitMs': 40}}
+        dialer = PowerDialer(DatabaseStub(ctx), DialingServiceStub(ctx), 'agent1',
+                             ring_timeout=0.01)
+        dialer.on_agent_login()
+        dialer.connect()
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        wait(list(dialer.futures))
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertListEqual(['Dialing "+12123334444" for agent "agent1" timed out'],
+                             LogInspector.get_messages())
+
+    def test_deadline_leaves_agent_available(self):
+        '''
+        Testing that connect gives up when the deadline passes without consuming more leads
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.FAILED, 'waitMs': 5000},
+            '+12123334449': {'state': CallState.FAILED, 'waitMs': 5000},
+            '+12123334447': {'state': CallState.CONNECTED}
+        }
+        database = DatabaseStub(ctx)
+        dialer = PowerDialer(database, CancellableDialingServiceStub(ctx), 'agent1',
+                             ring_timeout=10)
+        dialer.on_agent_login()
+        started = time.monotonic()
+        dialer.connect(deadline=0.02)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertEqual(['+12123334447'], database.numbers)
+
+    def test_expired_deadline_doesnt_dial(self):
+        '''
+        Testing that no leads are consumed once the deadline passed
+        '''
+        ctx = {'+12123334444': {'state': CallState.CONNECTED}}
+        database = DatabaseStub(ctx)
+        dialer = PowerDialer(database, CancellableDialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.connect(deadline=0)
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertEqual(0, dialer.dials)
+
+    def test_result_before_timeout_wins(self):
+        '''
+        Testing that a timeout of an already finished attempt is ignored
+        '''
+        ctx = {'+12123334444': {'state': CallState.FAILED}}
+        dialer = PowerDialer(DatabaseStub({}), CancellableDialingServiceStub(ctx), 'agent1')
+        dialer.on_agent_login()
+        dialer.transition(AgentEvent.CONNECT) # as if connect was in progress
+        call_data = CallData()
+        call_data.pending['+12123334444'] = time.monotonic()
+        call_data.thread_counter = 1
+        dialer.complete_attempt('+12123334444', call_data, 0, CallState.FAILED)
+        dialer.complete_attempt('+12123334444', call_data, 0, CallState.FAILED, True)
+        self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+        self.assertListEqual([], LogInspector.get_messages())
+
+    def test_async_ring_timeout_and_deadline(self):
+        '''
+        Testing timeouts of AsyncPowerDialer
+        '''
+        ctx = {
+            '+12123334444': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334449': {'state': CallState.CONNECTED},
+            '+12123334447': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334448': {'state': CallState.CONNECTED, 'waitMs': 5000},
+            '+12123334446': {'state': CallState.CONNECTED}
+        }
+        database = AsyncDatabaseStub(ctx)
+        dialer = AsyncPowerDialer(database, AsyncDialingServiceStub(ctx), 'agent1',
+                                  ring_timeout=0.01)
+        dialer.DIAL_RATIO = 1
+        dialer.on_agent_login()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(dialer.connect())
+            self.assertEqual('+12123334449', dialer.current_lead)
+            dialer.on_call_ended()
+            dialer.ring_timeout = None
+            loop.run_until_complete(dialer.connect(deadline=0.01))
+            self.assertEqual(AgentState.AVAILABLE, dialer.agent_state)
+            self.assertEqual(['+12123334448', '+12123334446'], database.numbers)
+            loop.run_until_complete(dialer.connect(deadline=0))
+            self.assertEqual(['+12123334448', '+12123334446'], database.numbers)
+        finally:
+            loop.close()
+        self.assertListEqual([
+            'Dialing "+12123334444" for agent "agent1" timed out',
+            'Dialing "+12123334447" for agent "agent1" timed out',
+        ], LogInspector.get_messages())
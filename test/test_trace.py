@@ -0,0 +1,205 @@
+'''
+Tests for trace module
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from ..dialer.call_state import CallState
+from ..dialer.power_dialer import PowerDialer
+from ..dialer.trace import (BUFFER_SIZE, RECORD, RecordingDialingService, RecordingLeadSource,
+                            ReplayDialingService, ReplayLeadSource, TraceWriter, read_trace)
+from .database_stub import DatabaseStub
+from .dialing_service_stub import BulkDialingServiceStub, CancellableDialingServiceStub
+from .log_inspector import LogInspector
+
+LogInspector.setup_logging()
+
+class TestTrace(unittest.TestCase):
+    '''
+    Tests for recording and replaying traces
+    '''
+
+    def setUp(self):
+        '''
+        Clears test stage and creates a directory for trace files before each test
+        '''
+        LogInspector.reset_buffer()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dial.trace')
+        self.now = 0.0
+        self.ctx = {
+            '+12123334444': {'exception': Exception('Service unavailable')},
+            '+12123334445': {'exception': Exception('Service unavailable')},
+            '+12123334446': {'state': CallState.CONNECTED, 'waitMs': 50},
+            '+12123334447': {'state': CallState.FAILED}
+        }
+
+    def tearDown(self):
+        '''
+        Removes trace files
+        '''
+        shutil.rmtree(self.directory)
+
+    def run_dialer(self, database: object, dialing_service: object) -> PowerDialer:
+        '''
+        Connects an agent and returns the dialer
+        '''
+        dialer = PowerDialer(database, dialing_service, 'agent1')
+        dialer.on_agent_login()
+        dialer.connect()
+        return dialer
+
+    def test_record_and_replay(self):
+        '''
+        Testing that a replayed trace reproduces the recorded outcomes of a dialer
+        '''
+        writer = TraceWriter(self.path)
+        service = CancellableDialingServiceStub(self.ctx)
+        recorded = self.run_dialer(RecordingLeadSource(DatabaseStub(self.ctx), writer),
+                                   RecordingDialingService(service, writer))
+        writer.close()
+        messages = LogInspector.get_messages()
+        self.assertEqual('+12123334446', recorded.current_lead)
+        self.assertEqual(2, len(messages))
+
+        records = list(read_trace(self.path))
+        dials = [record for record in records if record['type'] == 'dial']
+        fetches = [record for record in records if record['type'] == 'fetch']
+        self.assertEqual(writer.records, len(records))
+        self.assertSetEqual(set(self.ctx), {record['lead'] for record in dials})
+        self.assertListEqual(list(self.ctx), [lead for record in fetches
+                                              for lead in record['leads']])
+        connected = [record for record in dials if record['state'] == CallState.CONNECTED][0]
+        self.assertGreaterEqual(connected['latency'], 0.05)
+        self.assertListEqual(['Service unavailable'] * 2,
+                             [record['error'] for record in dials if record['error']])
+        self.assertListEqual(sorted(record['time'] for record in records),
+                             [record['time'] for record in records])
+
+        for speed in (None, 5.0):
+            LogInspector.reset_buffer()
+            dialing_service = ReplayDialingService(self.path, speed)
+            replayed = self.run_dialer(ReplayLeadSource(self.path, speed), dialing_service)
+            self.assertEqual(recorded.current_lead, replayed.current_lead)
+            self.assertListEqual(sorted(messages), sorted(LogInspector.get_messages()))
+            self.assertEqual(0, dialing_service.misses)
+
+    def test_replay_speed(self):
+        '''
+        Testing that replayed calls and fetches wait their recorded latency divided by speed,
+        and that numbers missing from the trace fail
+        '''
+        writer = TraceWriter(self.path, clock=lambda: self.now)
+        writer.write_fetch(['+12123334444', '+12123334445'], 0.5)
+        writer.write_dial('+12123334444', 2.0, CallState.FAILED)
+        writer.write_dial('+12123334444', 1.0, error=Exception('Service unavailable'))
+        writer.write_fetch([], 0)
+        writer.close()
+        waits = []
+        database = ReplayLeadSource(self.path, 2.0, sleep=waits.append)
+        self.assertListEqual(['+12123334444'], database.get_lead_phone_numbers_to_dial(1))
+        self.assertEqual('+12123334445', database.get_lead_phone_number_to_dial())
+        self.assertIsNone(database.get_lead_phone_number_to_dial())
+        service = ReplayDialingService(self.path, 4.0, sleep=waits.append)
+        self.assertEqual(CallState.FAILED, service.dial('agent1', '+12123334444'))
+        with self.assertRaisesRegex(Exception, 'Service unavailable'):
+            service.dial('agent1', '+12123334444')
+        self.assertEqual(CallState.FAILED, service.dial('agent1', '+12123334444'))
+        self.assertEqual(CallState.FAILED, service.dial('agent1', '+12123334446'))
+        self.assertEqual(2, service.misses)
+        self.assertListEqual([0.25, 0.5, 0.25], waits)
+
+    def test_numbers_which_cant_be_encoded(self):
+        '''
+        Testing that numbers which aren't valid E.164 numbers are recorded and replayed as text
+        '''
+        writer = TraceWriter(self.path)
+        writer.write_fetch(['+1 212 333 4444', '+12123334444', 'unknown'], 0.5)
+        writer.write_dial('+1 212 333 4444', 1.0, CallState.CONNECTED)
+        writer.write_dial('unknown', 1.0, error=Exception('Invalid number'))
+        writer.close()
+        records = list(read_trace(self.path))
+        self.assertListEqual(['+1 212 333 4444', '+12123334444', 'unknown'], records[0]['leads'])
+        self.assertListEqual(['+1 212 333 4444', 'unknown'],
+                             [record['lead'] for record in records[1:]])
+        service = ReplayDialingService(self.path, None)
+        self.assertEqual(CallState.CONNECTED, service.dial('agent1', '+1 212 333 4444'))
+        self.assertEqual(0, writer.failures)
+
+    def test_failed_writes(self):
+        '''
+        Testing that errors writing the trace are logged, but don't change
+        what the dialers get
+        '''
+        writer = TraceWriter(self.path)
+        writer.close()
+        service = RecordingDialingService(CancellableDialingServiceStub(self.ctx), writer)
+        self.assertEqual(CallState.FAILED, service.dial('agent1', '+12123334447'))
+        with self.assertRaisesRegex(Exception, 'Service unavailable'):
+            service.dial('agent1', '+12123334444')
+        database = RecordingLeadSource(DatabaseStub(self.ctx), writer)
+        self.assertEqual('+12123334444', database.get_lead_phone_number_to_dial())
+        self.assertEqual(3, writer.failures)
+        self.assertEqual(0, writer.records)
+        self.assertListEqual([f'Writing trace "{self.path}" failed. '
+                              'Error: "write to closed file"'] * 3, LogInspector.get_messages())
+
+    def test_many_error_messages(self):
+        '''
+        Testing that indexes of error messages aren't limited to 16 bits
+        '''
+        writer = TraceWriter(self.path)
+        for i in range(70000):
+            writer.write_dial('+12123334444', 1.0, error=Exception(f'Error {i}'))
+        writer.close()
+        records = list(read_trace(self.path))
+        self.assertEqual(70000, len(records))
+        self.assertEqual('Error 69999', records[-1]['error'])
+        self.assertEqual(0, writer.failures)
+
+    def test_buffered_writes(self):
+        '''
+        Testing that records reach the file when the buffer fills up, and that
+        an error appending the buffer on close is logged
+        '''
+        writer = TraceWriter(self.path)
+        for _ in range(BUFFER_SIZE // RECORD.size + 1):
+            writer.write_dial('+12123334447', 1.0, CallState.FAILED)
+        self.assertEqual(BUFFER_SIZE // RECORD.size + 1, len(list(read_trace(self.path))))
+        writer.write_dial('+12123334447', 1.0, CallState.FAILED)
+        shutil.rmtree(self.directory)
+        writer.close()
+        writer.close()
+        os.mkdir(self.directory)
+        self.assertEqual(1, writer.failures)
+        self.assertEqual(1, len(LogInspector.get_messages()))
+
+    def test_recording(self):
+        '''
+        Testing that recording passes other methods to the service, but hides `dial_many`,
+        and that invalid traces and speeds are rejected
+        '''
+        writer = TraceWriter(self.path)
+        service = RecordingDialingService(CancellableDialingServiceStub(self.ctx), writer)
+        service.cancel('agent1', '+12123334446')
+        self.assertEqual(CallState.DISCONNECTED, service.dial('agent1', '+12123334446'))
+        self.assertIsNone(getattr(RecordingDialingService(BulkDialingServiceStub(self.ctx),
+                                                          writer), 'dial_many', None))
+        database = RecordingLeadSource(DatabaseStub(self.ctx), writer)
+        self.assertListEqual(['+12123334444'],
+                             database.get_lead_phone_numbers_for_skills({'es'}, 1))
+        self.assertListEqual(['+12123334445'], database.get_lead_phone_numbers_to_dial(1))
+        self.assertEqual('+12123334446', database.get_lead_phone_number_to_dial())
+        database.get_lead_phone_numbers_to_dial(5)
+        self.assertIsNone(database.get_lead_phone_number_to_dial())
+        writer.close()
+        self.assertEqual(6, len(list(read_trace(self.path))))
+        with open(self.path, 'wb') as trace_file:
+            trace_file.write(b'+12123334444\n')
+        with self.assertRaises(ValueError):
+            list(read_trace(self.path))
+        with self.assertRaises(ValueError):
+            ReplayDialingService(self.path, 0)
+        with self.assertRaises(ValueError):
+            ReplayLeadSource(self.path, -1.0)